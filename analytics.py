@@ -0,0 +1,284 @@
+from contextlib import contextmanager
+from datetime import date
+
+from sqlalchemy import text
+
+from enums import Genre
+from models import db
+from partitions import add_months, month_start
+from updates import same_value
+
+# The rollups hold the number of shows per key and month, for live and
+# archived shows alike. Each statement aggregates a set of shows, given as
+# a {source} subquery of (venue_id, artist_id, start_time) rows, and adds
+# :sign times the counts to the rollup, so the same statements count new
+# shows in (+1) and deleted ones out (-1).
+VENUE_MONTH = '''
+INSERT INTO venue_month_rollup (month, venue_id, shows)
+SELECT date_trunc('month', s.start_time)::date, s.venue_id,
+    :sign * count(*)
+FROM ({source}) AS s
+GROUP BY 1, 2
+ON CONFLICT (month, venue_id)
+DO UPDATE SET shows = venue_month_rollup.shows + excluded.shows
+'''
+
+ARTIST_MONTH = '''
+INSERT INTO artist_month_rollup (month, artist_id, shows)
+SELECT date_trunc('month', s.start_time)::date, s.artist_id,
+    :sign * count(*)
+FROM ({source}) AS s
+GROUP BY 1, 2
+ON CONFLICT (month, artist_id)
+DO UPDATE SET shows = artist_month_rollup.shows + excluded.shows
+'''
+
+# A show counts once for every genre of its artist, in the city of its
+# venue. Both are taken as they are now, see recounted_shows().
+CITY_GENRE_MONTH = '''
+INSERT INTO city_genre_month_rollup (month, city, state, genre, shows)
+SELECT date_trunc('month', s.start_time)::date, coalesce(v.city, ''),
+    coalesce(v.state, ''), genre, :sign * count(*)
+FROM ({source}) AS s
+JOIN venue v ON v.id = s.venue_id
+JOIN artist a ON a.id = s.artist_id
+CROSS JOIN LATERAL unnest(a.genres) AS genre
+GROUP BY 1, 2, 3, 4
+ON CONFLICT (month, city, state, genre)
+DO UPDATE SET shows = city_genre_month_rollup.shows + excluded.shows
+'''
+
+ROLLUPS = {
+    'venue_month_rollup': VENUE_MONTH,
+    'artist_month_rollup': ARTIST_MONTH,
+    'city_genre_month_rollup': CITY_GENRE_MONTH,
+}
+
+SHOWS = '''
+SELECT venue_id, artist_id, start_time FROM show WHERE {condition}
+UNION ALL
+SELECT venue_id, artist_id, start_time FROM show_archive WHERE {condition}
+'''
+
+# Rows returned by each section of the report at most.
+MAX_ROWS = 50
+
+# Advisory lock class of recounts, locked per artist (see _lock_recount()).
+RECOUNT_LOCK = 4300
+
+# The columns the city and genre rollup counts the shows of a venue or an
+# artist under.
+RECOUNTED_COLUMNS = {'venue': ('city', 'state'), 'artist': ('genres',)}
+
+
+def _apply(sign, condition, values, rollups=ROLLUPS.values()):
+    source = SHOWS.format(condition=condition)
+    for statement in rollups:
+        db.session.execute(text(statement.format(source=source)),
+                           dict(values, sign=sign))
+
+
+def _lock(model, ids):
+    # Bookings of a locked venue or artist wait for the lock (their foreign
+    # key check needs a share lock on it), so none can slip in between the
+    # recount and the commit.
+    db.session.execute(text(
+        'SELECT id FROM {} WHERE id = ANY(:ids) ORDER BY id FOR UPDATE'
+        .format(model.__tablename__)), {'ids': list(ids)})
+
+
+def _lock_recount(model, ids):
+    # A show is counted under the city of its venue and the genres of its
+    # artist, so recounts of a venue and an artist that share shows must
+    # not overlap. They meet on a lock per artist: an artist takes its own,
+    # a venue those of the artists that play it. Taken in id order so they
+    # can't deadlock, and after _lock() so no booking adds an artist since.
+    if model.__tablename__ == 'artist':
+        artist_ids = sorted(set(ids))
+    else:
+        artist_ids = [row[0] for row in db.session.execute(text(
+            'SELECT artist_id FROM show WHERE venue_id = ANY(:ids) '
+            'UNION SELECT artist_id FROM show_archive '
+            'WHERE venue_id = ANY(:ids) ORDER BY 1'), {'ids': list(ids)})]
+    for artist_id in artist_ids:
+        db.session.execute(text('SELECT pg_advisory_xact_lock(:key, :id)'),
+                           {'key': RECOUNT_LOCK, 'id': artist_id})
+
+
+def count_shows(show_ids):
+    """ Adds newly booked shows to the rollups. Call it in the transaction
+    that inserted them. """
+
+    if show_ids:
+        _apply(1, 'id = ANY(:ids)', {'ids': list(show_ids)})
+
+
+def uncount_shows(model, ids):
+    """ Takes the shows of venues or artists out of the rollups. Call it in
+    the transaction that deletes them, before the DELETE cascades to the
+    shows. """
+
+    if ids:
+        _lock(model, ids)
+        _lock_recount(model, ids)
+        _apply(-1, '{}_id = ANY(:ids)'.format(model.__tablename__),
+               {'ids': list(ids)})
+
+
+@contextmanager
+def recounted_shows(model, obj_id, values):
+    """ Moves the shows of an edited venue or artist to its current city
+    or genres.
+
+    The city and genre rollup counts shows under the venue's city and the
+    artist's genres as they are now, so an edit that changes them has to
+    take the shows out under the old values first. Wrap the update in it,
+    in the same transaction. Edits that leave them alone skip the recount.
+
+    A venue and an artist edited at once may share shows, and each would
+    otherwise take them out and put them back under a half-updated city
+    and genres, so their recounts wait for each other until the commit.
+    So do deletes, see uncount_shows().
+
+    Args:
+        model: Venue or Artist.
+        obj_id: The id of the edited venue or artist.
+        values: Column name -> submitted value.
+    """
+
+    columns = RECOUNTED_COLUMNS[model.__tablename__]
+    row = db.session.query(*[getattr(model, name) for name in columns]) \
+        .filter(model.id == obj_id).first()
+    if row is None or all(same_value(getattr(row, name), values[name])
+                          for name in columns if name in values):
+        yield
+        return
+
+    _lock(model, [obj_id])
+    _lock_recount(model, [obj_id])
+    condition = '{}_id = :id'.format(model.__tablename__)
+    _apply(-1, condition, {'id': obj_id}, [CITY_GENRE_MONTH])
+    yield
+    _apply(1, condition, {'id': obj_id}, [CITY_GENRE_MONTH])
+
+
+def backfill_rollups(connection, since=None):
+    """ Rebuilds the rollups from the show and show_archive tables.
+
+    The rollups are locked against concurrent bookings and deletes while
+    they are rebuilt, reads of them go on. A booking that was waiting for
+    the lock counts its show in once the rebuild is committed, so nothing
+    is counted twice or missed.
+
+    Args:
+        connection: A connection in a transaction.
+        since: Only rebuild the months from this date on.
+
+    Returns: The number of rows written per rollup.
+    """
+
+    condition, values = 'TRUE', {}
+    if since is not None:
+        condition = 'start_time >= :since'
+        values['since'] = month_start(since)
+
+    source = SHOWS.format(condition=condition)
+    counts = {}
+    for table, statement in ROLLUPS.items():
+        connection.execute(text(
+            'LOCK TABLE {} IN EXCLUSIVE MODE'.format(table)))
+        connection.execute(text('DELETE FROM {} WHERE {}'.format(
+            table, 'month >= :since' if since is not None else 'TRUE')),
+            values)
+        counts[table] = connection.execute(
+            text(statement.format(source=source)),
+            dict(values, sign=1)).rowcount
+    return counts
+
+
+def booking_report(months=12, limit=10):
+    """ Summarizes the bookings of the last months from the rollups.
+
+    Args:
+        months: The number of months, up to and including the current
+            one, to cover.
+        limit: The number of venues, artists and cities to return.
+
+    Returns: A dict with the busiest venues and their shows per month,
+        the most booked artists with their average shows per month, and
+        the top genres of the busiest cities.
+    """
+
+    limit = min(limit, MAX_ROWS)
+    end = add_months(month_start(date.today()), 1)
+    start = add_months(end, -months)
+    values = {'start': start, 'end': end, 'limit': limit}
+
+    venues = db.session.execute(text('''
+        SELECT r.venue_id, v.name, sum(r.shows) AS shows,
+            array_agg(ARRAY[to_char(r.month, 'YYYY-MM'), r.shows::text]
+                      ORDER BY r.month) AS months
+        FROM venue_month_rollup r
+        JOIN venue v ON v.id = r.venue_id
+        WHERE r.month >= :start AND r.month < :end AND r.shows > 0
+        GROUP BY r.venue_id, v.name
+        ORDER BY shows DESC, r.venue_id
+        LIMIT :limit'''), values)
+
+    artists = db.session.execute(text('''
+        SELECT r.artist_id, a.name, sum(r.shows) AS shows,
+            count(*) AS active_months
+        FROM artist_month_rollup r
+        JOIN artist a ON a.id = r.artist_id
+        WHERE r.month >= :start AND r.month < :end AND r.shows > 0
+        GROUP BY r.artist_id, a.name
+        ORDER BY shows DESC, r.artist_id
+        LIMIT :limit'''), values)
+
+    genres = db.session.execute(text('''
+        WITH city_genres AS (
+            SELECT city, state, genre, sum(shows) AS shows
+            FROM city_genre_month_rollup
+            WHERE month >= :start AND month < :end AND shows > 0
+            GROUP BY city, state, genre
+        ), cities AS (
+            SELECT city, state, sum(shows) AS shows
+            FROM city_genres
+            GROUP BY city, state
+            ORDER BY shows DESC, city, state
+            LIMIT :limit
+        )
+        SELECT c.city, c.state, c.shows AS total,
+            array_agg(ARRAY[g.genre, g.shows::text]
+                      ORDER BY g.shows DESC, g.genre) AS genres
+        FROM cities c
+        JOIN city_genres g ON g.city = c.city AND g.state = c.state
+        GROUP BY c.city, c.state, c.shows
+        ORDER BY c.shows DESC, c.city, c.state'''), values)
+
+    return {
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'venues': [{
+            'id': row.venue_id,
+            'name': row.name,
+            'shows': int(row.shows),
+            'months': {month: int(shows) for month, shows in row.months},
+        } for row in venues],
+        'artists': [{
+            'id': row.artist_id,
+            'name': row.name,
+            'shows': int(row.shows),
+            'shows_per_month': round(row.shows / months, 2),
+            'active_months': row.active_months,
+        } for row in artists],
+        'cities': [{
+            'city': row.city,
+            'state': row.state,
+            'shows': int(row.total),
+            'genres': [{'genre': genre, 'shows': int(shows),
+                        'label': Genre[genre].value
+                        if genre in Genre.__members__ else genre}
+                       for genre, shows in row.genres[:limit]],
+        } for row in genres],
+    }
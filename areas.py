@@ -0,0 +1,35 @@
+""" Areas, the cities that venues and artists are in.
+
+Every distinct city and state has one row in the area table, and venues and
+artists point to it with area_id, so listings group and filter on an
+integer key instead of comparing free-text names. City names are matched
+ignoring case and repeated spaces, "seattle" and "Seattle " are the same
+area, spelled as when it was first entered.
+
+area_id is kept in line with the city and state columns by a trigger on
+venue and artist, which finds or creates the area with the area_id(city,
+state) SQL function. It is NULL for a blank city or a state that isn't a
+State code. The city and state columns stay as entered.
+"""
+
+from sqlalchemy import func, false
+
+from enums import State
+from models import Area
+
+
+def city_key(city):
+    """ Returns a city name as areas are matched on it, like lower(city)
+    of an area. """
+
+    return ' '.join((city or '').split()).lower()
+
+
+def area_condition(city, state):
+    """ Matches the area of a city, by ix_area_state_lower_city. """
+
+    state = (state or '').upper()
+    if state not in State.__members__:
+        return false()
+    return (Area.state == state) & \
+        (func.lower(Area.city) == city_key(city))
@@ -0,0 +1,265 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import shutil
+from io import BytesIO
+
+from flask import url_for, request, send_from_directory, abort
+
+# Brotli is optional, without it only gzip variants are generated.
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Output folder (inside the static folder) for the built assets.
+DIST_FOLDER = 'dist'
+MANIFEST_NAME = 'manifest.json'
+
+# Bundle name -> source files (relative to the static folder), in load order.
+BUNDLES = {
+    'main.css': [
+        'css/bootstrap.min.css',
+        'css/layout.main.css',
+        'css/main.css',
+        'css/main.responsive.css',
+        'css/main.quickfix.css',
+    ],
+    'head.js': [
+        'js/libs/modernizr-2.8.2.min.js',
+        'js/libs/moment.min.js',
+    ],
+    'main.js': [
+        'js/libs/jquery-1.11.1.min.js',
+        'js/libs/bootstrap-3.1.1.min.js',
+        'js/plugins.js',
+        'js/script.js',
+    ],
+}
+
+# Images that get resized WebP variants, and the widths to generate.
+IMAGES = ['img/front-splash.jpg']
+IMAGE_WIDTHS = [480, 960, 1440]
+WEBP_QUALITY = 80
+
+# Only text assets are worth precompressing.
+COMPRESSIBLE = ('.css', '.js', '.json', '.svg')
+
+# Hashed filenames never change content, so they can be cached forever.
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+def minify_css(source):
+    """ Removes comments and the whitespace that CSS does not need.
+
+    Whitespace before a colon is kept since it is significant in selectors
+    such as `.nav :hover`.
+    """
+
+    source = re.sub(r'/\*.*?\*/', '', source, flags=re.S)
+    source = re.sub(r'\s+', ' ', source)
+    source = re.sub(r'\s*([{};,>])\s*', r'\1', source)
+    source = re.sub(r':\s+', ':', source)
+    return source.replace(';}', '}').strip()
+
+
+def minify_js(source):
+    """ Strips indentation, blank lines and whole-line comments.
+
+    This deliberately stays on the safe side of a real minifier: the
+    libraries are already minified, so only our own small scripts go
+    through here.
+    """
+
+    lines = []
+    for line in source.splitlines():
+        line = line.strip()
+        if not line or line.startswith('//'):
+            continue
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+def fingerprint(name, content):
+    """ Adds a short content hash to a filename, e.g. main.1a2b3c4d5e.css """
+
+    digest = hashlib.sha256(content).hexdigest()[:10]
+    root, ext = os.path.splitext(name)
+    return '{}.{}{}'.format(root, digest, ext)
+
+
+def _write(dist, name, content):
+    path = os.path.join(dist, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(content)
+
+    if name.endswith(COMPRESSIBLE):
+        with open(path + '.gz', 'wb') as f:
+            f.write(gzip.compress(content, 9, mtime=0))
+        if brotli is not None:
+            with open(path + '.br', 'wb') as f:
+                f.write(brotli.compress(content))
+
+
+def build_bundle(static_folder, name, sources):
+    """ Concatenates and minifies the sources of a single bundle. """
+
+    parts = []
+    for source in sources:
+        with open(os.path.join(static_folder, source), encoding='utf-8') as f:
+            content = f.read()
+
+        if name.endswith('.css'):
+            parts.append(minify_css(content))
+        elif source.endswith('.min.js'):
+            parts.append(content.strip())
+        else:
+            parts.append(minify_js(content))
+
+    # A semicolon between scripts guards against files without a trailing one
+    separator = '\n' if name.endswith('.css') else ';\n'
+    return separator.join(parts).encode('utf-8')
+
+
+def build_image_variants(static_folder, image):
+    """ Generates resized WebP copies of an image.
+
+    Returns: A list of (width, content) tuples, never wider than the original.
+    """
+
+    # Pillow is only needed when building, not when serving.
+    from PIL import Image
+
+    variants = []
+    with Image.open(os.path.join(static_folder, image)) as original:
+        original = original.convert('RGB')
+        for width in IMAGE_WIDTHS:
+            if width > original.width:
+                width = original.width
+            height = round(original.height * width / original.width)
+
+            buffer = BytesIO()
+            original.resize((width, height), Image.LANCZOS) \
+                .save(buffer, 'WEBP', quality=WEBP_QUALITY, method=6)
+            variants.append((width, buffer.getvalue()))
+
+            if width == original.width:
+                break
+    return variants
+
+
+def build_assets(static_folder):
+    """ Builds every bundle and image variant into static/dist.
+
+    The folder is rebuilt from scratch and a manifest mapping the logical
+    names to the fingerprinted files is written next to them.
+
+    Returns: The manifest.
+    """
+
+    dist = os.path.join(static_folder, DIST_FOLDER)
+    shutil.rmtree(dist, ignore_errors=True)
+    os.makedirs(dist)
+
+    manifest = {'bundles': {}, 'images': {}}
+
+    for name, sources in BUNDLES.items():
+        content = build_bundle(static_folder, name, sources)
+        hashed = fingerprint(name, content)
+        _write(dist, hashed, content)
+        manifest['bundles'][name] = hashed
+
+    for image in IMAGES:
+        root, _ = os.path.splitext(image)
+        srcset = []
+        for width, content in build_image_variants(static_folder, image):
+            hashed = fingerprint('{}-{}.webp'.format(root, width), content)
+            _write(dist, hashed, content)
+            srcset.append([width, hashed])
+        manifest['images'][image] = srcset
+
+    with open(os.path.join(dist, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+    return manifest
+
+
+class Assets:
+    """ Serves the built assets and exposes template helpers for them.
+
+    When `flask assets build` has not been run the helpers fall back to the
+    unbundled source files, so development works without a build step.
+    """
+
+    def __init__(self, app=None):
+        self.manifest = {'bundles': {}, 'images': {}}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.dist = os.path.join(app.static_folder, DIST_FOLDER)
+        self.load_manifest()
+
+        app.add_url_rule(app.static_url_path + '/' + DIST_FOLDER +
+                         '/<path:filename>', 'dist', self.send_asset)
+        app.jinja_env.globals['asset_urls'] = self.asset_urls
+        app.jinja_env.globals['image_srcset'] = self.image_srcset
+
+    def load_manifest(self):
+        path = os.path.join(self.dist, MANIFEST_NAME)
+        if os.path.exists(path):
+            with open(path) as f:
+                self.manifest = json.load(f)
+
+    def asset_urls(self, bundle):
+        """ Returns the urls to load for a bundle: the fingerprinted file once
+        built, otherwise each of its source files. """
+
+        hashed = self.manifest['bundles'].get(bundle)
+        if hashed:
+            return [url_for('dist', filename=hashed)]
+        return [url_for('static', filename=source)
+                for source in BUNDLES[bundle]]
+
+    def image_srcset(self, image):
+        """ Returns the srcset attribute value of an image's WebP variants, or
+        an empty string when they have not been built. """
+
+        return ', '.join(
+            '{} {}w'.format(url_for('dist', filename=hashed), width)
+            for width, hashed in self.manifest['images'].get(image, []))
+
+    def send_asset(self, filename):
+        """ Serves a built asset, preferring its precompressed variant. """
+
+        path = os.path.join(self.dist, filename)
+        if not os.path.isfile(path):
+            abort(404)
+
+        accepted = request.accept_encodings
+        encoding = None
+        if 'br' in accepted and os.path.exists(path + '.br'):
+            encoding = 'br'
+        elif 'gzip' in accepted and os.path.exists(path + '.gz'):
+            encoding = 'gzip'
+
+        if encoding:
+            suffix = '.br' if encoding == 'br' else '.gz'
+            response = send_from_directory(
+                self.dist, filename + suffix,
+                mimetype=mimetypes.guess_type(filename)[0],
+                conditional=True)
+            response.headers['Content-Encoding'] = encoding
+            # Don't advertise the .gz/.br filename to the browser.
+            del response.headers['Content-Disposition']
+        else:
+            response = send_from_directory(self.dist, filename,
+                                           conditional=True)
+
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        response.vary.add('Accept-Encoding')
+        return response
@@ -0,0 +1,213 @@
+import bisect
+import re
+import threading
+from collections import Counter
+
+from sqlalchemy import select
+
+from models import db, Venue, Artist
+
+MODELS = {'venues': Venue, 'artists': Artist}
+
+# Largest number of suggestions of each kind a query returns.
+MAX_SUGGESTIONS = 10
+# Index entries looked at per query at most, so one-letter prefixes stay as
+# fast as long ones.
+MAX_SCAN = 500
+
+
+def normalize(text):
+    """ Lowercases a name and reduces it to single-spaced words. """
+
+    return ' '.join(re.findall(r'\w+', (text or '').lower()))
+
+
+def name_keys(name):
+    """ Returns a key from every word of a name on, so typing any word of
+    it matches: 'the musical hop', 'musical hop', 'hop'. """
+
+    words = normalize(name).split()
+    return [' '.join(words[i:]) for i in range(len(words))]
+
+
+class PrefixIndex:
+    """ Keys kept in a sorted list, searched by prefix with bisect. Each key
+    has a value, the same key can appear more than once. """
+
+    def __init__(self):
+        self.keys = []
+        self.values = []
+
+    def load(self, pairs):
+        pairs = sorted(pairs, key=lambda pair: pair[0])
+        self.keys = [key for key, _ in pairs]
+        self.values = [value for _, value in pairs]
+
+    def add(self, key, value):
+        i = bisect.bisect_right(self.keys, key)
+        self.keys.insert(i, key)
+        self.values.insert(i, value)
+
+    def remove(self, key, value):
+        i = bisect.bisect_left(self.keys, key)
+        while i < len(self.keys) and self.keys[i] == key:
+            if self.values[i] == value:
+                del self.keys[i]
+                del self.values[i]
+                return
+            i += 1
+
+    def search(self, prefix):
+        """ Yields the values of the keys starting with prefix, in key order.
+        """
+
+        i = bisect.bisect_left(self.keys, prefix)
+        end = min(len(self.keys), i + MAX_SCAN)
+        while i < end and self.keys[i].startswith(prefix):
+            yield self.values[i]
+            i += 1
+
+
+class Autocomplete:
+    """ Suggests venues, artists and cities as the user types.
+
+    Each worker holds the names in memory, so a keystroke is answered
+    without a database query. The index is built on the first request and
+    kept fresh from the shared ChangeLog: only venues and artists changed
+    since the last lookup are read back from the database.
+    """
+
+    def __init__(self, changelog=None):
+        self.changelog = changelog
+        self._lock = threading.Lock()
+        self._reset()
+
+    def init_app(self, app, changelog):
+        self.changelog = changelog
+
+    def _reset(self):
+        self.names = PrefixIndex()
+        self.cities = PrefixIndex()
+        # (kind, id) -> (name, city, state)
+        self.entries = {}
+        # (normalized city, state) -> [city as entered, venues and artists]
+        self.places = {}
+        self.seqs = {kind: None for kind in MODELS}
+
+    def _columns(self, kind):
+        model = MODELS[kind]
+        return [model.id, model.name, model.city, model.state]
+
+    def rebuild(self):
+        """ Builds the index from every venue and artist. """
+
+        with self._lock:
+            self._rebuild()
+
+    def _rebuild(self):
+        seqs = {kind: self.changelog.since(kind, None)[0] for kind in MODELS}
+        self._reset()
+
+        names = []
+        cities = Counter()
+        for kind in MODELS:
+            for obj_id, name, city, state in db.session.execute(
+                    select(*self._columns(kind))):
+                self.entries[kind, obj_id] = (name, city, state)
+                names.extend((key, (kind, obj_id)) for key in name_keys(name))
+                cities[normalize(city), state, city] += 1
+
+        # The most common spelling of a city is the one shown.
+        for (place, state, city), count in cities.most_common():
+            if (place, state) in self.places:
+                self.places[place, state][1] += count
+            else:
+                self.places[place, state] = [city, count]
+        self.names.load(names)
+        self.cities.load([(key, place) for place in self.places
+                          for key in name_keys(place[0])])
+        self.seqs = seqs
+
+    def _add(self, kind, obj_id, name, city, state):
+        self.entries[kind, obj_id] = (name, city, state)
+        for key in name_keys(name):
+            self.names.add(key, (kind, obj_id))
+
+        place = (normalize(city), state)
+        if place in self.places:
+            self.places[place][1] += 1
+        else:
+            self.places[place] = [city, 1]
+            for key in name_keys(place[0]):
+                self.cities.add(key, place)
+
+    def _remove(self, kind, obj_id):
+        name, city, state = self.entries.pop((kind, obj_id))
+        for key in name_keys(name):
+            self.names.remove(key, (kind, obj_id))
+
+        place = (normalize(city), state)
+        self.places[place][1] -= 1
+        if not self.places[place][1]:
+            del self.places[place]
+            for key in name_keys(place[0]):
+                self.cities.remove(key, place)
+
+    def _sync(self):
+        changed = {}
+        for kind in MODELS:
+            seq, ids = self.changelog.since(kind, self.seqs[kind])
+            if ids is None:
+                self._rebuild()
+                return
+            changed[kind] = (seq, ids)
+
+        for kind, (seq, ids) in changed.items():
+            if not ids:
+                continue
+            model = MODELS[kind]
+            rows = db.session.execute(
+                select(*self._columns(kind)).where(model.id.in_(ids)))
+            for obj_id in set(ids):
+                if (kind, obj_id) in self.entries:
+                    self._remove(kind, obj_id)
+            for obj_id, name, city, state in rows:
+                self._add(kind, obj_id, name, city, state)
+            self.seqs[kind] = seq
+
+    def suggest(self, text, limit=5):
+        """ Finds the venues, artists and cities whose name has a word
+        starting with the typed text.
+
+        Returns: A dict with a list of venues, artists and cities, each at
+            most limit long.
+        """
+
+        prefix = normalize(text)
+        suggestions = {'venues': [], 'artists': [], 'cities': []}
+        if not prefix:
+            return suggestions
+
+        with self._lock:
+            self._sync()
+
+            seen = set()
+            for kind, obj_id in self.names.search(prefix):
+                if (kind, obj_id) in seen or \
+                        len(suggestions[kind]) >= limit:
+                    continue
+                seen.add((kind, obj_id))
+                name, city, state = self.entries[kind, obj_id]
+                suggestions[kind].append({'id': obj_id, 'name': name,
+                                          'city': city, 'state': state})
+                if len(seen) >= 2 * limit:
+                    break
+
+            for place in self.cities.search(prefix):
+                city = {'city': self.places[place][0], 'state': place[1]}
+                if city not in suggestions['cities']:
+                    suggestions['cities'].append(city)
+                if len(suggestions['cities']) >= limit:
+                    break
+
+        return suggestions
@@ -0,0 +1,191 @@
+import time
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from models import db, BackfillProgress
+
+# SQLSTATE of a statement that gave up waiting for a lock.
+LOCK_NOT_AVAILABLE = '55P03'
+
+# Registered backfills, by name.
+BACKFILLS = {}
+
+# Settings of every batch transaction. A batch that can't get its row
+# locks quickly is retried rather than left waiting in front of requests.
+LOCK_TIMEOUT = '1s'
+STATEMENT_TIMEOUT = '30s'
+ATTEMPTS = 5
+
+
+class Backfill:
+    """ An UPDATE of existing rows, run in keyed batches.
+
+    The statement gets the batch bounds as :low and :high and must only
+    touch rows whose key is in (low, high]. It should skip rows that are
+    already done, so a batch that is run twice is harmless.
+    """
+
+    def __init__(self, name, table, statement, key='id', description=None):
+        self.name = name
+        self.table = table
+        self.statement = statement
+        self.key = key
+        self.description = description
+
+
+def register_backfill(name, table, statement, key='id', description=None):
+    """ Registers a backfill so `flask backfill run NAME` can run it.
+
+    Args:
+        name: The name of the backfill.
+        table: The table it updates.
+        statement: The UPDATE, bounded by :low and :high on the key.
+        key: An integer column of the table that is unique and indexed.
+        description: What the backfill is for.
+    """
+
+    BACKFILLS[name] = Backfill(name, table, statement, key, description)
+    return BACKFILLS[name]
+
+
+def _progress(connection, backfill):
+    # Locked for the whole batch, so runners started twice take turns
+    # instead of doing the same batch. Waiting for it is expected, it is
+    # taken before the short lock_timeout is set.
+    connection.execute(text(
+        'INSERT INTO backfill_progress (name, rows, batches, started_date) '
+        'VALUES (:name, 0, 0, now()) ON CONFLICT (name) DO NOTHING'),
+        {'name': backfill.name})
+    return connection.execute(text(
+        'SELECT last_key, rows, batches, finished_date '
+        'FROM backfill_progress WHERE name = :name FOR UPDATE'),
+        {'name': backfill.name}).first()
+
+
+def _run_batch(backfill, batch_size):
+    with db.engine.begin() as connection:
+        connection.execute(text(
+            "SET LOCAL statement_timeout = '{}'".format(STATEMENT_TIMEOUT)))
+        progress = _progress(connection, backfill)
+        if progress.finished_date is not None:
+            return None
+
+        connection.execute(text(
+            "SET LOCAL lock_timeout = '{}'".format(LOCK_TIMEOUT)))
+
+        low = progress.last_key
+        if low is None:
+            low = connection.execute(text('SELECT min({key}) - 1 FROM {table}'
+                                          .format(key=backfill.key,
+                                                  table=backfill.table))
+                                     ).scalar()
+        high = None
+        if low is not None:
+            high = connection.execute(text(
+                'SELECT max({key}) FROM (SELECT {key} FROM {table} '
+                'WHERE {key} > :low ORDER BY {key} LIMIT :limit) AS batch'
+                .format(key=backfill.key, table=backfill.table)),
+                {'low': low, 'limit': batch_size}).scalar()
+
+        if high is None:
+            connection.execute(text(
+                'UPDATE backfill_progress SET finished_date = now(), '
+                'updated_date = now() WHERE name = :name'),
+                {'name': backfill.name})
+            return None
+
+        rows = connection.execute(text(backfill.statement),
+                                  {'low': low, 'high': high}).rowcount
+        connection.execute(text(
+            'UPDATE backfill_progress SET last_key = :high, '
+            'rows = rows + :rows, batches = batches + 1, updated_date = now() '
+            'WHERE name = :name'),
+            {'high': high, 'rows': rows, 'name': backfill.name})
+        return high, rows, progress.rows + rows
+
+
+def run_backfill(backfill, batch_size=1000, pause=0.1, max_batches=None,
+                 report=None):
+    """ Runs a backfill batch by batch until every row is done.
+
+    Each batch updates the next batch_size keys and records how far it got
+    in the same transaction, so a run that is stopped or crashes resumes
+    where it left off. Batches that hit the lock timeout are retried.
+
+    Args:
+        backfill: The Backfill to run.
+        batch_size: The number of keys per batch.
+        pause: Seconds to sleep between batches, to leave the database
+            room for the site's queries.
+        max_batches: Stop after this many batches, or None to finish.
+        report: Called after every batch with a dict of the progress: the
+            last key done, the rows updated by the batch and in total, the
+            largest key when the run started and the rows per second.
+
+    Returns: True if the backfill is finished.
+    """
+
+    # Rows added after this are expected to be written correctly already.
+    max_key = db.session.execute(text('SELECT max({}) FROM {}'.format(
+        backfill.key, backfill.table))).scalar()
+    db.session.remove()
+
+    started = time.monotonic()
+    batches = 0
+    done = 0
+    while max_batches is None or batches < max_batches:
+        for attempt in range(1, ATTEMPTS + 1):
+            try:
+                result = _run_batch(backfill, batch_size)
+                break
+            except OperationalError as e:
+                if getattr(e.orig, 'pgcode', None) != LOCK_NOT_AVAILABLE or \
+                        attempt == ATTEMPTS:
+                    raise
+                time.sleep(pause * 2 ** attempt)
+        if result is None:
+            return True
+
+        last_key, rows, total = result
+        batches += 1
+        done += rows
+        if report is not None:
+            elapsed = time.monotonic() - started
+            report({
+                'name': backfill.name,
+                'last_key': last_key,
+                'rows': rows,
+                'total_rows': total,
+                'max_key': max_key,
+                'rows_per_second': round(done / elapsed) if elapsed else None,
+            })
+        time.sleep(pause)
+    return False
+
+
+def reset_backfill(name):
+    """ Forgets the progress of a backfill, so its next run starts over. """
+
+    BackfillProgress.query.filter_by(name=name).delete()
+    db.session.commit()
+
+
+def backfill_status():
+    """ Returns every registered backfill with its progress. """
+
+    progress = {row.name: row for row in BackfillProgress.query.all()}
+    status = []
+    for name, backfill in sorted(BACKFILLS.items()):
+        row = progress.get(name)
+        status.append({
+            'name': name,
+            'table': backfill.table,
+            'description': backfill.description,
+            'last_key': row and row.last_key,
+            'rows': row.rows if row else 0,
+            'started': row and row.started_date,
+            'finished': row and row.finished_date,
+            'updated': row and row.updated_date,
+        })
+    return status
@@ -0,0 +1,44 @@
+import sys
+
+from flask import current_app
+
+from extensions import image_store, task_queue, recent_feed, autocomplete
+from models import db, Venue, Artist
+
+
+@task_queue.task('image_variants')
+def generate_image_variants(filename):
+    """ Generates the resized variants of an uploaded image. """
+
+    image_store.generate_variants(filename)
+
+
+def start_task_queue():
+    # Started per worker process, after any fork, so tasks left over from a
+    # crash or restart are picked up.
+    task_queue.start()
+
+
+def build_recent_feed():
+    try:
+        recent_feed.rebuild('venues', Venue)
+        recent_feed.rebuild('artists', Artist)
+    except:
+        current_app.logger.error(sys.exc_info())
+    finally:
+        db.session.remove()
+
+
+def build_autocomplete():
+    try:
+        autocomplete.rebuild()
+    except:
+        current_app.logger.error(sys.exc_info())
+    finally:
+        db.session.remove()
+
+
+def init_app(app):
+    app.before_first_request(start_task_queue)
+    app.before_first_request(build_recent_feed)
+    app.before_first_request(build_autocomplete)
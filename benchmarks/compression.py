@@ -0,0 +1,78 @@
+""" Measures what compressing each page costs and saves.
+
+Every route is requested once uncompressed, then its body is compressed
+with gzip and, when the brotli package is installed, brotli at a range of
+levels. For each level it prints the compressed size, the ratio and the
+CPU time per response, which is what the Compressor adds to a request.
+
+Usage:
+    python benchmarks/compression.py [--runs 20] [--path /venues ...]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from compression import brotli, compress  # noqa: E402
+
+PATHS = ['/', '/venues', '/artists', '/shows', '/venues/1', '/artists/1',
+         '/analytics', '/analytics/data', '/autocomplete?q=the']
+LEVELS = {'gzip': [1, 6, 9], 'br': [1, 4, 6, 11]}
+
+
+def fetch(paths):
+    """ Returns the (path, status, body) of each page, uncompressed. """
+
+    import app
+
+    application = app.create_app(migrations=False)
+    client = application.test_client()
+    pages = []
+    for path in paths:
+        response = client.get(path, headers={'Accept-Encoding': 'identity'})
+        pages.append((path, response.status_code, response.get_data()))
+    return pages
+
+
+def measure(body, encoding, level, runs):
+    """ Returns the compressed size and the median time to compress, in ms.
+    """
+
+    times = []
+    for _ in range(runs):
+        start = time.process_time()
+        size = len(compress(body, encoding, level))
+        times.append(time.process_time() - start)
+    return size, sorted(times)[len(times) // 2] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--path', action='append', dest='paths',
+                        help='Page to measure, can be repeated.')
+    args = parser.parse_args()
+
+    encodings = ['gzip'] + (['br'] if brotli is not None else [])
+    print('{:<22} {:>6} {:>9}  {:<8} {:>9} {:>7} {:>8}'.format(
+        'path', 'status', 'bytes', 'encoding', 'bytes', 'ratio', 'ms'))
+    for path, status, body in fetch(args.paths or PATHS):
+        print('{:<22} {:>6} {:>9}'.format(path, status, len(body)))
+        if not body:
+            continue
+        for encoding in encodings:
+            for level in LEVELS[encoding]:
+                size, ms = measure(body, encoding, level, args.runs)
+                print('{:<40}  {:<8} {:>9} {:>6.1f}x {:>8.3f}'.format(
+                    '', '{}-{}'.format(encoding, level), size,
+                    len(body) / size, ms))
+    if brotli is None:
+        print('\nbrotli is not installed, only gzip was measured.')
+
+
+if __name__ == '__main__':
+    main()
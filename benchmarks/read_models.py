@@ -0,0 +1,159 @@
+""" Compares the read models with the ORM code the views used before.
+
+A venue, a hundred artists and --rows shows for them are inserted far in
+the future, inside a transaction that is rolled back at the end, so the
+database is left as it was. The show listing and the venue page are then
+built both ways. For each it prints the median CPU time and the peak
+memory allocated while building the page data, scaled to 10k rows.
+
+Usage:
+    python benchmarks/read_models.py [--rows 10000] [--runs 5]
+"""
+
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+ARTISTS = 100
+# Far enough ahead to miss every real booking, the rows go to the default
+# partition.
+FIRST_SHOW = datetime(2200, 1, 1)
+
+
+def seed(session, rows):
+    """ Adds the venue, artists and shows, returns the venue id. """
+
+    from models import Venue, Artist, Show
+
+    venue = Venue(name='Benchmark Venue', city='Nowhere', state='CA',
+                  genres=['Jazz'])
+    artists = [Artist(name='Benchmark Artist {}'.format(i), genres=['Jazz'])
+               for i in range(ARTISTS)]
+    session.add(venue)
+    session.add_all(artists)
+    session.flush()
+    # Three hours apart, so no venue or artist is double booked.
+    session.bulk_insert_mappings(Show, [{
+        'venue_id': venue.id,
+        'artist_id': artists[i % ARTISTS].id,
+        'start_time': FIRST_SHOW + timedelta(hours=3 * i),
+    } for i in range(rows)])
+    session.flush()
+    return venue.id
+
+
+def orm_shows():
+    from models import Show
+
+    return [{
+        'venue_id': show.venue_id,
+        'venue_name': show.venue.name,
+        'artist_id': show.artist_id,
+        'artist_name': show.artist.name,
+        'artist_image_link': show.artist.image_link,
+        'artist_image_file': show.artist.image_file,
+        'start_time': show.start_time,
+    } for show in Show.query.order_by(Show.start_time).all()]
+
+
+def orm_venue(venue_id):
+    from enums import Genre
+    from models import Venue
+
+    venue = Venue.query.get(venue_id)
+    past_shows = []
+    upcoming_shows = []
+    for show in venue.shows + venue.archived_shows:
+        temp_show = {
+            'artist_id': show.artist_id,
+            'artist_name': show.artist.name,
+            'artist_image_link': show.artist.image_link,
+            'artist_image_file': show.artist.image_file,
+            'start_time': show.start_time,
+        }
+        if show.start_time <= datetime.now():
+            past_shows.append(temp_show)
+        else:
+            upcoming_shows.append(temp_show)
+    data = dict(vars(venue))
+    data['past_shows'] = past_shows
+    data['upcoming_shows'] = upcoming_shows
+    data['past_shows_count'] = len(past_shows)
+    data['upcoming_shows_count'] = len(upcoming_shows)
+    data['genres'] = [Genre[genre].value for genre in venue.genres]
+    return data
+
+
+def measure(session, build, runs):
+    """ Returns the median CPU time in ms and the median peak of memory
+    allocated in KiB, each run starting from an empty identity map. """
+
+    times, peaks = [], []
+    for _ in range(runs):
+        session.expunge_all()
+        gc.collect()
+        tracemalloc.start()
+        start = time.process_time()
+        data = build()
+        elapsed = time.process_time() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        del data
+        times.append(elapsed * 1000)
+        peaks.append(peak / 1024)
+    return sorted(times)[len(times) // 2], sorted(peaks)[len(peaks) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    import app
+    import read_models
+    from models import db
+
+    application = app.create_app(migrations=False)
+    with application.app_context():
+        connection = db.engine.connect()
+        transaction = connection.begin()
+        # Everything runs on the one connection, in the seeding transaction.
+        session, db.session = db.session, db.create_scoped_session(
+            options={'bind': connection})
+        try:
+            venue_id = seed(db.session, args.rows)
+            cases = [
+                ('shows', orm_shows, read_models.show_listing),
+                ('venue', lambda: orm_venue(venue_id),
+                 lambda: read_models.venue_detail(venue_id)),
+            ]
+            scale = 10000 / args.rows
+            print('{:<8} {:<12} {:>14} {:>18}'.format(
+                'page', 'path', 'ms / 10k rows', 'peak KiB / 10k rows'))
+            for page, orm, read_model in cases:
+                results = {}
+                for path, build in (('orm', orm), ('read model', read_model)):
+                    ms, kib = measure(db.session, build, args.runs)
+                    results[path] = ms, kib
+                    print('{:<8} {:<12} {:>14.1f} {:>18.0f}'.format(
+                        page, path, ms * scale, kib * scale))
+                (orm_ms, orm_kib), (rm_ms, rm_kib) = results.values()
+                print('{:<8} {:<12} {:>13.1f}x {:>17.1f}x'.format(
+                    page, 'saved', orm_ms / rm_ms, orm_kib / rm_kib))
+        finally:
+            db.session.remove()
+            db.session = session
+            transaction.rollback()
+            connection.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+""" Measures the cold-start time of the app.
+
+Every run starts a fresh interpreter and times importing the app module,
+create_app() and the first request, which includes the before_first_request
+hooks. The slowest imports are taken from `python -X importtime`.
+
+Usage:
+    python benchmarks/startup.py [--runs 5] [--path /venues/create]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = '''
+import json, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+application = app.create_app(migrations=False)
+created = time.perf_counter()
+response = application.test_client().get({path!r})
+requested = time.perf_counter()
+print(json.dumps({{
+    'import': imported - start,
+    'create_app': created - imported,
+    'first_request': requested - created,
+    'status': response.status_code,
+}}))
+'''
+
+
+def run_child(path):
+    output = subprocess.run([sys.executable, '-c', CHILD.format(path=path)],
+                            cwd=ROOT, check=True, stdout=subprocess.PIPE,
+                            stderr=subprocess.DEVNULL,
+                            universal_newlines=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def slowest_imports(count):
+    """ Returns the (cumulative microseconds, module) of the slowest top-level
+    imports of the app module. """
+
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c',
+                             'import app'], cwd=ROOT, check=True,
+                            stderr=subprocess.PIPE,
+                            universal_newlines=True).stderr
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # Only modules imported directly by the app, not their own imports.
+        if len(name) - len(name.lstrip()) != 3:
+            continue
+        imports.append((int(cumulative), name.strip()))
+    return sorted(imports, reverse=True)[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--path', default='/venues/create',
+                        help='Page to request first.')
+    parser.add_argument('--imports', type=int, default=10,
+                        help='Number of slowest imports to list.')
+    args = parser.parse_args()
+
+    runs = [run_child(args.path) for _ in range(args.runs)]
+
+    print('{} runs, first request: GET {} ({})'.format(
+        args.runs, args.path, runs[0]['status']))
+    for phase in ('import', 'create_app', 'first_request'):
+        times = [run[phase] * 1000 for run in runs]
+        print('{:<14} median {:8.1f} ms   min {:8.1f} ms'.format(
+            phase, statistics.median(times), min(times)))
+    total = [sum(run[phase] for phase in ('import', 'create_app',
+                                          'first_request')) * 1000
+             for run in runs]
+    print('{:<14} median {:8.1f} ms'.format('total', statistics.median(total)))
+
+    print('\nSlowest imports:')
+    for cumulative, name in slowest_imports(args.imports):
+        print('{:8.1f} ms  {}'.format(cumulative / 1000, name))
+
+
+if __name__ == '__main__':
+    main()
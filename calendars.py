@@ -0,0 +1,282 @@
+import json
+import uuid
+from datetime import datetime, timedelta
+from itertools import chain, islice
+
+from flask import Response, request, stream_with_context, url_for
+from sqlalchemy import select
+
+from areas import area_condition, city_key
+from models import db, Venue, Artist, Show, Area
+
+# Columns that appear in the events, edits to others leave the feeds alone.
+EVENT_COLUMNS = {'name', 'address', 'city', 'state'}
+
+# Events per streamed chunk. Each chunk is flushed through the compressor,
+# so one event per chunk would compress poorly.
+CHUNK_EVENTS = 100
+
+
+def venue_scope(venue_id):
+    return 'venue:{}'.format(venue_id)
+
+
+def artist_scope(artist_id):
+    return 'artist:{}'.format(artist_id)
+
+
+def city_scope(city, state):
+    return 'city:{}:{}'.format((state or '').upper(), city_key(city))
+
+
+def city_condition(city, state):
+    """ Matches the venues of a city, by the id of its area. Backed by
+    ix_area_state_lower_city and ix_venue_area_id. """
+
+    return Venue.area_id == select(Area.id) \
+        .where(area_condition(city, state)).scalar_subquery()
+
+
+def upcoming_shows(condition, now, limit):
+    """ Selects the upcoming shows matching condition with their venue and
+    artist, soonest first.
+
+    For a venue or an artist the rows come from the (venue_id, start_time)
+    and (artist_id, start_time) indexes of the current show partitions,
+    archived shows are never upcoming.
+    """
+
+    return select(Show.id, Show.start_time, Show.duration_minutes,
+                  Show.venue_id, Venue.name.label('venue_name'),
+                  Venue.address, Venue.city, Venue.state,
+                  Artist.name.label('artist_name')) \
+        .join(Venue, Venue.id == Show.venue_id) \
+        .join(Artist, Artist.id == Show.artist_id) \
+        .where(condition, Show.start_time > now) \
+        .order_by(Show.start_time) \
+        .limit(limit)
+
+
+def _scopes(condition, now):
+    rows = db.session.execute(
+        select(Show.venue_id, Show.artist_id, Venue.city, Venue.state)
+        .distinct()
+        .join(Venue, Venue.id == Show.venue_id)
+        .where(condition, Show.start_time > now))
+    scopes = set()
+    for row in rows:
+        scopes.update((venue_scope(row.venue_id), artist_scope(row.artist_id),
+                       city_scope(row.city, row.state)))
+    return scopes
+
+
+def scopes_of_shows(show_ids, now=None):
+    """ Returns the feeds that list any of the shows. Call it before the
+    commit, it sees the session's own changes. """
+
+    if not show_ids:
+        return set()
+    return _scopes(Show.id.in_(show_ids), now or datetime.now())
+
+
+def scopes_of(model, ids, now=None):
+    """ Returns the feeds of venues or artists and every feed their
+    upcoming shows are listed in. Call it before they are deleted or
+    edited. """
+
+    column = Show.venue_id if model is Venue else Show.artist_id
+    scope = venue_scope if model is Venue else artist_scope
+    return {scope(obj_id) for obj_id in ids} | \
+        _scopes(column.in_(ids), now or datetime.now())
+
+
+# ---------------------------------------------------------------------#
+# iCalendar.
+# ---------------------------------------------------------------------#
+
+def _text(value):
+    # RFC 5545 3.3.11, TEXT values escape backslashes, separators and
+    # newlines.
+    return (value or '').replace('\\', '\\\\').replace(';', '\\;') \
+        .replace(',', '\\,').replace('\r\n', '\\n').replace('\n', '\\n')
+
+
+def _line(name, value):
+    # Content lines are folded at 75 octets, without splitting a character.
+    parts = []
+    current, size = '', 0
+    for char in '{}:{}'.format(name, value):
+        width = len(char.encode())
+        if size + width > 75:
+            parts.append(current)
+            current, size = ' ', 1
+        current += char
+        size += width
+    parts.append(current)
+    return '\r\n'.join(parts) + '\r\n'
+
+
+def _time(value):
+    # Shows are stored in the venue's local time, which iCalendar calls
+    # floating time.
+    return value.strftime('%Y%m%dT%H%M%S')
+
+
+def calendar_header(title):
+    return ''.join([
+        _line('BEGIN', 'VCALENDAR'),
+        _line('VERSION', '2.0'),
+        _line('PRODID', '-//Fyyur//Upcoming shows//EN'),
+        _line('CALSCALE', 'GREGORIAN'),
+        _line('METHOD', 'PUBLISH'),
+        _line('X-WR-CALNAME', _text(title)),
+    ])
+
+
+def calendar_footer():
+    return _line('END', 'VCALENDAR')
+
+
+def calendar_event(row, stamp):
+    """ Returns the VEVENT of an upcoming_shows() row. """
+
+    location = ', '.join(part for part in (row.venue_name, row.address,
+                                           row.city, row.state) if part)
+    end_time = row.start_time + timedelta(minutes=row.duration_minutes)
+    return ''.join([
+        _line('BEGIN', 'VEVENT'),
+        _line('UID', 'show-{}@{}'.format(row.id, request.host)),
+        _line('DTSTAMP', stamp),
+        _line('DTSTART', _time(row.start_time)),
+        _line('DTEND', _time(end_time)),
+        _line('SUMMARY', _text('{} at {}'.format(row.artist_name,
+                                                 row.venue_name))),
+        _line('LOCATION', _text(location)),
+        _line('URL', url_for('venues.show_venue', venue_id=row.venue_id,
+                             _external=True)),
+        _line('END', 'VEVENT'),
+    ])
+
+
+class CalendarFeeds:
+    """ iCalendar feeds of the upcoming shows of a venue, artist or city.
+
+    Every feed has a version in the shared store, which the write handlers
+    replace (touch) after committing anything that changes the feed. A
+    generated feed is cached under its version, so calendar clients
+    polling an unchanged feed are answered from the store, or with a 304
+    to their If-None-Match, without a database query.
+
+    A cached feed is also dropped when its first show starts, or after
+    CALENDAR_CACHE_TTL seconds, whichever comes first. Clients are told to
+    keep it CALENDAR_MAX_AGE seconds. With more than one app server,
+    CALENDAR_STORE_URL should point to a store they share, otherwise a
+    write is only seen by the feeds of the server that made it.
+    """
+
+    def __init__(self, store=None, max_age=900, cache_ttl=3600,
+                 max_events=500):
+        self.store = store
+        self.max_age = max_age
+        self.cache_ttl = cache_ttl
+        self.max_events = max_events
+
+    def init_app(self, app, store):
+        self.store = store
+        self.max_age = app.config.get('CALENDAR_MAX_AGE', self.max_age)
+        self.cache_ttl = app.config.get('CALENDAR_CACHE_TTL', self.cache_ttl)
+        self.max_events = app.config.get('CALENDAR_MAX_EVENTS',
+                                         self.max_events)
+
+    def _version_key(self, scope):
+        return 'calendar:version:' + scope
+
+    def _version(self, scope):
+        version = self.store.get(self._version_key(scope))
+        if version is None:
+            # Two workers may both start a version, the feed cached under
+            # the one that loses is never read.
+            version = uuid.uuid4().hex[:16]
+            self.store.set(self._version_key(scope), version)
+        return version
+
+    def touch(self, scopes):
+        """ Gives the feeds a new version, so they are generated again on
+        their next request. Call it after the write committed. """
+
+        for scope in scopes:
+            self.store.set(self._version_key(scope), uuid.uuid4().hex[:16])
+
+    def _response(self, body, etag):
+        response = Response(body, mimetype='text/calendar')
+        # Weak, the DTSTAMPs differ between generations of the same feed.
+        response.set_etag(etag, weak=True)
+        response.cache_control.public = True
+        response.cache_control.max_age = self.max_age
+        return response
+
+    def response(self, scope, title, condition):
+        """ Returns the feed of a scope, from the cache when it is current.
+
+        Args:
+            scope: The scope of the feed, see venue_scope(), artist_scope()
+                and city_scope().
+            title: Called on a cache miss, returns the calendar name, or
+                None if the venue, artist or city doesn't exist.
+            condition: Selects the shows of the feed.
+
+        Returns: The response, or None if title() returned None.
+        """
+
+        version = self._version(scope)
+        key = 'calendar:feed:{}:{}'.format(scope, version)
+
+        cached = self.store.get(key)
+        if cached is not None:
+            cached = json.loads(cached)
+            return self._response(cached['body'], cached['etag']) \
+                .make_conditional(request)
+
+        name = title()
+        if name is None:
+            return None
+
+        now = datetime.now()
+        result = db.session.execute(
+            upcoming_shows(condition, now, self.max_events),
+            execution_options={'stream_results': True})
+        first = result.fetchone()
+        # The feed changes with the version, or when its first show starts
+        # and drops out.
+        etag = '{}-{}'.format(version, _time(first.start_time)
+                              if first else 'none')
+        ttl = self.cache_ttl
+        if first is not None:
+            ttl = max(1, min(ttl, (first.start_time - now).total_seconds()))
+
+        if request.if_none_match.contains_weak(etag):
+            result.close()
+            response = self._response('', etag)
+            response.status_code = 304
+            return response
+
+        def generate():
+            stamp = datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')
+            rows = chain([first], result) if first is not None else iter(())
+            chunks = [calendar_header(name)]
+            yield chunks[0]
+            while True:
+                events = [calendar_event(row, stamp)
+                          for row in islice(rows, CHUNK_EVENTS)]
+                if not events:
+                    break
+                chunks.append(''.join(events))
+                yield chunks[-1]
+            chunks.append(calendar_footer())
+            yield chunks[-1]
+            # Only a feed that was sent in full is cached.
+            self.store.set(key, json.dumps({'etag': etag,
+                                            'body': ''.join(chunks)}),
+                           ttl=ttl)
+
+        return self._response(stream_with_context(generate()), etag)
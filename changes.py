@@ -0,0 +1,68 @@
+import json
+
+
+class ChangeLog:
+    """ Bounded log of the venue and artist ids changed by writes.
+
+    It lives in a store shared by the workers (CHANGELOG_STORE_URL, or the
+    local store of the host), so the in-memory indexes of every worker
+    (see matchmaking.py and autocomplete.py) can apply the changes made by
+    the others. Each index remembers the sequence
+    number it has seen and asks for the ids changed since.
+    """
+
+    def __init__(self, store=None, size=1000):
+        self.store = store
+        self.size = size
+
+    def init_app(self, app, store):
+        self.store = store
+        self.size = app.config.get('CHANGELOG_SIZE', self.size)
+
+    def _key(self, kind):
+        return 'changes:' + kind
+
+    def _load(self, value):
+        return {'seq': 0, 'entries': []} if value is None else \
+            json.loads(value)
+
+    def _read(self, kind):
+        return self._load(self.store.get(self._key(kind)))
+
+    def record(self, kind, ids):
+        """ Records venues or artists that were created, edited or deleted.
+        Call it after the write committed. """
+
+        ids = list(ids)
+
+        def append(value):
+            log = self._load(value)
+            for obj_id in ids:
+                log['seq'] += 1
+                log['entries'].append([log['seq'], obj_id])
+            log['entries'] = log['entries'][-self.size:]
+            return json.dumps(log)
+
+        self.store.modify(self._key(kind), append)
+
+    def since(self, kind, seq):
+        """ Returns the ids changed after a sequence number.
+
+        Args:
+            kind: 'venues' or 'artists'.
+            seq: The last sequence number seen, or None if nothing was.
+
+        Returns: The current sequence number and the list of changed ids,
+            or None instead of the list when the caller has to rebuild
+            because the changes it missed are no longer in the log.
+        """
+
+        log = self._read(kind)
+        if seq == log['seq']:
+            return seq, []
+
+        oldest = log['entries'][0][0] if log['entries'] else log['seq'] + 1
+        if seq is None or seq + 1 < oldest or seq > log['seq']:
+            return log['seq'], None
+        return log['seq'], [obj_id for entry_seq, obj_id in log['entries']
+                            if entry_seq > seq]
@@ -0,0 +1,227 @@
+import json
+from datetime import date, datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from analytics import backfill_rollups
+from assets import build_assets
+from backfills import BACKFILLS, run_backfill, reset_backfill, \
+    backfill_status
+from duplicates import catalog_rows, duplicate_groups, BANDS, ROWS
+from extensions import slow_query_log
+from models import db, Venue, Artist
+from partitions import create_show_partitions, archive_show_partitions, \
+    add_months, month_start
+from slowlog import slow_query_report, format_plan
+
+shows_cli = AppGroup('shows', help='Maintain the partitioned show table.')
+
+
+@shows_cli.command('create-partitions')
+@click.option('--months', default=3, show_default=True,
+              help='Number of months, from the current one, to cover.')
+def create_partitions_command(months):
+    """ Creates the monthly show partitions ahead of time. """
+
+    with db.engine.begin() as connection:
+        created = create_show_partitions(connection, date.today(), months)
+
+    for name in created:
+        click.echo('Created ' + name)
+    if not created:
+        click.echo('All partitions already exist.')
+
+
+@shows_cli.command('archive')
+@click.option('--keep-months', default=12, show_default=True,
+              help='Number of past months to keep in the show table.')
+def archive_command(keep_months):
+    """ Moves shows older than --keep-months into show_archive. """
+
+    cutoff = add_months(month_start(date.today()), -keep_months)
+
+    with db.engine.begin() as connection:
+        archived = archive_show_partitions(connection, cutoff)
+
+    for name, count in archived:
+        click.echo('Archived {} shows from {}'.format(count, name))
+    if not archived:
+        click.echo('Nothing to archive before ' + str(cutoff))
+
+
+assets_cli = AppGroup('assets', help='Build the static assets.')
+
+
+@assets_cli.command('build')
+def build_assets_command():
+    """ Bundles, fingerprints and precompresses the static assets. """
+
+    manifest = build_assets(current_app.static_folder)
+
+    for name, hashed in manifest['bundles'].items():
+        click.echo('{} -> {}'.format(name, hashed))
+    for image, srcset in manifest['images'].items():
+        click.echo('{} -> {} WebP variants'.format(image, len(srcset)))
+
+
+slow_queries_cli = AppGroup('slow-queries', help='Inspect the slow query log.')
+
+
+@slow_queries_cli.command('report')
+@click.option('--hours', type=int, default=None,
+              help='Only count the last N hours.')
+@click.option('--top', default=10, show_default=True,
+              help='Number of statement shapes to show.')
+@click.option('--plans/--no-plans', default=False, show_default=True,
+              help='Print the plan of the slowest explained execution.')
+@click.option('--json', 'as_json', is_flag=True,
+              help='Print the report as JSON.')
+def slow_query_report_command(hours, top, plans, as_json):
+    """ Lists the statement shapes that spent the most time being slow. """
+
+    since = datetime.now() - timedelta(hours=hours) if hours else None
+    try:
+        report = slow_query_report(slow_query_log.path, since)[:top]
+    except FileNotFoundError:
+        click.echo('No slow queries logged yet.')
+        return
+
+    if as_json:
+        click.echo(json.dumps(report, indent=2))
+        return
+
+    for i, shape in enumerate(report, 1):
+        click.echo('{}. {} runs, total {} ms, mean {} ms, p95 {} ms, '
+                   'max {} ms'.format(i, shape['count'], shape['total_ms'],
+                                      shape['mean_ms'], shape['p95_ms'],
+                                      shape['max_ms']))
+        click.echo('   routes: ' + ', '.join(shape['routes']))
+        click.echo('   ' + shape['shape'])
+        if plans and shape['plan']:
+            click.echo('   plan' + (' (analyzed):' if shape['analyzed']
+                                    else ':'))
+            for line in format_plan(shape['plan']):
+                click.echo('     ' + line)
+        click.echo()
+
+
+analytics_cli = AppGroup('analytics', help='Maintain the booking rollups.')
+
+
+@analytics_cli.command('backfill')
+@click.option('--since', type=click.DateTime(formats=['%Y-%m']),
+              default=None, help='Only rebuild from this month (YYYY-MM) on.')
+def backfill_command(since):
+    """ Rebuilds the booking rollups from the show tables. """
+
+    with db.engine.begin() as connection:
+        counts = backfill_rollups(connection, since and since.date())
+
+    for table, count in counts.items():
+        click.echo('{}: {} rows'.format(table, count))
+
+
+backfill_cli = AppGroup('backfill', help='Run batched data backfills.')
+
+
+@backfill_cli.command('list')
+def list_backfills_command():
+    """ Lists the registered backfills and how far each got. """
+
+    for status in backfill_status():
+        state = 'finished' if status['finished'] else \
+            'started' if status['started'] else 'not started'
+        click.echo('{} ({}): {}, {} rows, last key {}'.format(
+            status['name'], status['table'], state, status['rows'],
+            status['last_key']))
+        if status['description']:
+            click.echo('   ' + status['description'])
+    if not BACKFILLS:
+        click.echo('No backfills are registered.')
+
+
+@backfill_cli.command('run')
+@click.argument('name')
+@click.option('--batch-size', default=1000, show_default=True,
+              help='Keys per batch.')
+@click.option('--pause', default=0.1, show_default=True,
+              help='Seconds to sleep between batches.')
+@click.option('--max-batches', type=int, default=None,
+              help='Stop after this many batches.')
+def run_backfill_command(name, batch_size, pause, max_batches):
+    """ Runs a backfill, resuming where the last run stopped. """
+
+    if name not in BACKFILLS:
+        raise click.BadParameter('No backfill named ' + name, param_hint='NAME')
+
+    def report(progress):
+        share = ''
+        if progress['max_key']:
+            share = ' ({:.0%})'.format(
+                min(progress['last_key'] / progress['max_key'], 1))
+        click.echo('Up to key {} of {}{}: {} rows, {} in total, {} rows/s'
+                   .format(progress['last_key'], progress['max_key'], share,
+                           progress['rows'], progress['total_rows'],
+                           progress['rows_per_second']))
+
+    finished = run_backfill(BACKFILLS[name], batch_size, pause, max_batches,
+                            report)
+    click.echo('Finished.' if finished else
+               'Stopped, run it again to resume.')
+
+
+@backfill_cli.command('reset')
+@click.argument('name')
+def reset_backfill_command(name):
+    """ Forgets the progress of a backfill, so it runs again from the
+    start. """
+
+    reset_backfill(name)
+    click.echo('Reset ' + name)
+
+
+duplicates_cli = AppGroup('duplicates',
+                          help='Find venues and artists listed twice.')
+
+
+@duplicates_cli.command('report')
+@click.argument('kind', type=click.Choice(['venues', 'artists']))
+@click.option('--threshold', default=0.5, show_default=True,
+              help='Least Jaccard similarity of name trigrams, city and '
+                   'phone.')
+@click.option('--bands', default=BANDS, show_default=True,
+              help='LSH bands, more find more candidates.')
+@click.option('--rows', default=ROWS, show_default=True,
+              help='Signature rows per band, more find fewer.')
+@click.option('--json', 'as_json', is_flag=True,
+              help='Print the report as JSON.')
+def duplicates_report_command(kind, threshold, bands, rows, as_json):
+    """ Lists the groups of venues or artists that look like duplicates.
+    """
+
+    model = Venue if kind == 'venues' else Artist
+    report = duplicate_groups(catalog_rows(model), threshold, bands, rows)
+
+    if as_json:
+        click.echo(json.dumps(report, indent=2))
+        return
+
+    for group in report['groups']:
+        click.echo(', '.join('{} ({})'.format(name, obj_id)
+                             for obj_id, name in group))
+    click.echo('{} groups among {} {}, {} candidate pairs compared{}.'.format(
+        len(report['groups']), report['entries'], kind,
+        report['candidate_pairs'],
+        ', {} crowded buckets skipped'.format(report['skipped_buckets'])
+        if report['skipped_buckets'] else ''))
+
+
+def init_app(app):
+    app.cli.add_command(shows_cli)
+    app.cli.add_command(assets_cli)
+    app.cli.add_command(slow_queries_cli)
+    app.cli.add_command(analytics_cli)
+    app.cli.add_command(backfill_cli)
+    app.cli.add_command(duplicates_cli)
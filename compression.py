@@ -0,0 +1,129 @@
+import gzip
+import zlib
+
+from flask import request
+
+# Brotli is optional, without it responses are only gzipped.
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Types worth compressing. Images, fonts and the like are compressed
+# already.
+COMPRESSIBLE_TYPES = {
+    'text/html', 'text/css', 'text/plain', 'text/calendar', 'text/csv',
+    'application/json', 'application/javascript', 'image/svg+xml',
+}
+
+
+def compress(data, encoding, level):
+    """ Compresses a whole response body.
+
+    Args:
+        data: The body, as bytes.
+        encoding: 'br' or 'gzip'.
+        level: Brotli quality (0-11) or gzip level (1-9).
+
+    Returns: The compressed body.
+    """
+
+    if encoding == 'br':
+        return brotli.compress(data, quality=level)
+    return gzip.compress(data, level, mtime=0)
+
+
+def compress_stream(chunks, encoding, level):
+    """ Compresses a streamed body chunk by chunk.
+
+    Every chunk is flushed, so the client gets each one as soon as it is
+    produced rather than when the compressor's buffer fills.
+    """
+
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=level)
+        finish = compressor.finish
+
+        def flush(chunk):
+            return compressor.process(chunk) + compressor.flush()
+    else:
+        # wbits 31 writes a gzip header and trailer around the deflate data.
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        finish = compressor.flush
+
+        def flush(chunk):
+            return compressor.compress(chunk) + \
+                compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            if chunk:
+                yield flush(chunk)
+        yield finish()
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+class Compressor:
+    """ Compresses HTML, JSON and other text responses on the fly.
+
+    The encoding is negotiated per request from Accept-Encoding, brotli
+    first when the brotli package is installed, then gzip. Responses that
+    are already encoded, sent as files (static and built assets, which
+    have precompressed variants), or smaller than COMPRESS_MIN_SIZE bytes
+    go out as they are. Streamed responses are compressed as they stream.
+
+    COMPRESS_LEVEL is the gzip level and COMPRESS_BR_LEVEL the brotli
+    quality. Run benchmarks/compression.py to see what each costs.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.min_size = app.config.get('COMPRESS_MIN_SIZE', 500)
+        self.levels = {'gzip': app.config.get('COMPRESS_LEVEL', 6),
+                       'br': app.config.get('COMPRESS_BR_LEVEL', 4)}
+        self.encodings = ['br', 'gzip'] if brotli is not None else ['gzip']
+
+        app.after_request(self._compress)
+
+    def _compress(self, response):
+        if response.mimetype not in COMPRESSIBLE_TYPES or \
+                response.direct_passthrough or \
+                'Content-Encoding' in response.headers or \
+                response.status_code < 200 or \
+                response.status_code in (204, 304) or \
+                'no-transform' in response.headers.get('Cache-Control', ''):
+            return response
+
+        # Caches must keep encoded and plain copies apart even when this
+        # one wasn't compressed.
+        response.vary.add('Accept-Encoding')
+
+        encoding = request.accept_encodings.best_match(self.encodings)
+        if encoding is None or request.method == 'HEAD':
+            return response
+        level = self.levels[encoding]
+
+        if response.is_streamed:
+            response.response = compress_stream(response.response, encoding,
+                                                level)
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < self.min_size:
+                return response
+            response.set_data(compress(data, encoding, level))
+
+        response.headers['Content-Encoding'] = encoding
+        # The bytes differ from the identity response, a weak ETag still
+        # matches it in If-None-Match.
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
@@ -0,0 +1,235 @@
+""" Finding venues and artists that are listed twice.
+
+Names are compared by their key, normalized_name() in the database:
+lower case, punctuation and the words "the", "a", "an" and "and" dropped,
+so "The Musical Hop" and "Musical Hop, The" share the key "musical hop".
+The key is stored in name_key, kept in line with name by a trigger, and
+indexed with pg_trgm, which finds the entries whose key is similar to a
+new name without comparing it to every row (find_duplicates).
+
+The catalog-wide report (duplicate_groups) uses MinHash signatures over
+the name trigrams, city and phone, and locality-sensitive hashing to only
+compare entries that share a bucket, instead of every pair.
+"""
+
+import random
+import re
+import zlib
+from collections import defaultdict
+from typing import NamedTuple, Optional
+
+from sqlalchemy import select, func
+
+from models import db
+
+# Trigram similarity (0-1) of the name keys above which entries are
+# reported. pg_trgm's % operator uses the index for it.
+SIMILARITY_THRESHOLD = 0.5
+MAX_CANDIDATES = 5
+
+# MinHash signature length is BANDS * ROWS. Pairs whose shingles have a
+# Jaccard similarity s share a bucket with probability
+# 1 - (1 - s^ROWS)^BANDS, about 0.5 at s = (1/BANDS)^(1/ROWS).
+BANDS = 20
+ROWS = 4
+# Buckets holding more entries than this are skipped, they come from
+# shingles so common that they say nothing about duplicates.
+MAX_BUCKET = 100
+# A Mersenne prime larger than any shingle hash, for the permutations.
+PRIME = (1 << 61) - 1
+
+class DuplicateCandidate(NamedTuple):
+    id: int
+    name: str
+    city: Optional[str]
+    state: Optional[str]
+    phone: Optional[str]
+    similarity: float
+    same_city: bool
+    same_phone: bool
+
+
+def phone_digits(phone):
+    return re.sub(r'\D', '', phone or '')[-10:]
+
+
+def _same_city(row, city, state):
+    return bool(city) and (row.city or '').strip().lower() == \
+        city.strip().lower() and row.state == state
+
+
+def find_duplicates(model, name, city=None, state=None, phone=None,
+                    exclude_id=None, limit=MAX_CANDIDATES,
+                    threshold=SIMILARITY_THRESHOLD):
+    """ Finds the venues or artists a new or edited entry may duplicate.
+
+    The name decides, through the trigram index on name_key. The city and
+    phone are reported along, a match on either makes a duplicate more
+    likely.
+
+    Args:
+        model: Venue or Artist.
+        name: The name entered.
+        city: The city entered.
+        state: The state code entered.
+        phone: The phone number entered.
+        exclude_id: The id of the entry being edited.
+        limit: The most candidates to return.
+        threshold: The least trigram similarity of the name keys.
+
+    Returns: A list of DuplicateCandidates, most similar first.
+    """
+
+    key = func.normalized_name(name)
+    # Sets the threshold of the % operator for this transaction.
+    db.session.execute(select(func.set_config(
+        'pg_trgm.similarity_threshold', str(threshold), True)))
+
+    query = select(model.id, model.name, model.city, model.state,
+                   model.phone,
+                   func.similarity(model.name_key, key).label('similarity')) \
+        .where(model.name_key.op('%')(key)) \
+        .order_by(db.desc('similarity'), model.id) \
+        .limit(limit)
+    if exclude_id is not None:
+        query = query.where(model.id != exclude_id)
+
+    digits = phone_digits(phone)
+    return [DuplicateCandidate(
+        *row, same_city=_same_city(row, city, state),
+        same_phone=bool(digits) and phone_digits(row.phone) == digits)
+        for row in db.session.execute(query)]
+
+
+# ---------------------------------------------------------------------#
+# Catalog report.
+# ---------------------------------------------------------------------#
+
+def shingles(key, city, state, phone):
+    """ Returns the set of features an entry is compared by: the trigrams
+    of its name key, its city and its phone number. """
+
+    padded = '  {} '.format(key or '')
+    features = {padded[i:i + 3] for i in range(len(padded) - 2)}
+    if city:
+        features.add('city:{}:{}'.format(city.strip().lower(), state))
+    digits = phone_digits(phone)
+    if digits:
+        features.add('phone:' + digits)
+    return features
+
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if a or b else 0.0
+
+
+class MinHasher:
+    """ MinHash signatures of shingle sets, from BANDS * ROWS random
+    permutations (a * h + b) mod PRIME of the shingle hashes. """
+
+    def __init__(self, bands=BANDS, rows=ROWS, seed=1):
+        import numpy as np
+
+        self.bands = bands
+        self.rows = rows
+        generator = random.Random(seed)
+        size = bands * rows
+        self.a = np.array([generator.randrange(1, 1 << 31)
+                           for _ in range(size)], dtype=np.uint64)
+        self.b = np.array([generator.randrange(0, 1 << 31)
+                           for _ in range(size)], dtype=np.uint64)
+
+    def signature(self, features):
+        import numpy as np
+
+        hashes = np.array([zlib.crc32(feature.encode())
+                           for feature in features], dtype=np.uint64)
+        # a and the hashes are below 2^32, so a * h fits in 64 bits.
+        return ((np.outer(self.a, hashes) + self.b[:, None]) % PRIME) \
+            .min(axis=1)
+
+    def band_keys(self, signature):
+        """ Returns one bucket key per band. """
+
+        return [(band, signature[band * self.rows:
+                                 (band + 1) * self.rows].tobytes())
+                for band in range(self.bands)]
+
+
+def catalog_rows(model):
+    """ Streams the id, name, key, city, state and phone of every venue or
+    artist. """
+
+    return db.session.execute(
+        select(model.id, model.name, model.name_key, model.city, model.state,
+               model.phone)
+        .order_by(model.id),
+        execution_options={'stream_results': True})
+
+
+def duplicate_groups(rows, threshold=SIMILARITY_THRESHOLD, bands=BANDS,
+                     rows_per_band=ROWS):
+    """ Groups the entries that are likely the same venue or artist.
+
+    Every entry is hashed into one bucket per band of its MinHash
+    signature. Only entries that share a bucket are compared, by the
+    Jaccard similarity of their shingles, so the work grows with the number
+    of entries and candidate pairs rather than with every pair.
+
+    Args:
+        rows: (id, name, key, city, state, phone) tuples, see catalog_rows().
+        threshold: The least Jaccard similarity of a duplicate pair.
+        bands: The number of LSH bands.
+        rows_per_band: The signature rows per band.
+
+    Returns: A dict with the groups, largest first, each a list of
+        (id, name) tuples, and the counts of entries, candidate pairs and
+        skipped buckets.
+    """
+
+    hasher = MinHasher(bands, rows_per_band)
+    names = {}
+    features = {}
+    buckets = defaultdict(list)
+    for obj_id, name, key, city, state, phone in rows:
+        names[obj_id] = name
+        features[obj_id] = shingles(key, city, state, phone)
+        if not features[obj_id]:
+            continue
+        for bucket in hasher.band_keys(hasher.signature(features[obj_id])):
+            buckets[bucket].append(obj_id)
+
+    candidates = set()
+    skipped = 0
+    for ids in buckets.values():
+        if len(ids) > MAX_BUCKET:
+            skipped += 1
+            continue
+        for i, first in enumerate(ids):
+            for second in ids[i + 1:]:
+                candidates.add((first, second))
+
+    # Union-find over the confirmed pairs.
+    parent = {}
+
+    def root(obj_id):
+        while parent.setdefault(obj_id, obj_id) != obj_id:
+            parent[obj_id] = parent[parent[obj_id]]
+            obj_id = parent[obj_id]
+        return obj_id
+
+    for first, second in candidates:
+        if jaccard(features[first], features[second]) >= threshold:
+            parent[root(second)] = root(first)
+
+    groups = defaultdict(list)
+    for obj_id in parent:
+        groups[root(obj_id)].append(obj_id)
+    return {
+        'groups': sorted(([(obj_id, names[obj_id]) for obj_id in sorted(ids)]
+                          for ids in groups.values()),
+                         key=lambda group: (-len(group), group[0][0])),
+        'entries': len(names),
+        'candidate_pairs': len(candidates),
+        'skipped_buckets': skipped,
+    }
@@ -0,0 +1,228 @@
+import json
+import threading
+import uuid
+from collections import Counter, namedtuple
+from datetime import datetime
+
+from sqlalchemy import event, select
+from sqlalchemy.sql import operators, visitors
+from sqlalchemy.sql.elements import BinaryExpression, BindParameter
+
+from models import db, Venue, Artist
+
+# Models whose rows are cached, by table name.
+CACHED_MODELS = {model.__tablename__: model for model in (Venue, Artist)}
+
+# Key of the pending invalidations in Session.info.
+PENDING = 'entity_cache_pending'
+# Stands for every row of a table, when a statement's ids are unknown.
+ALL = '*'
+
+
+def _row_class(model):
+    return namedtuple(model.__name__ + 'Row', model.__table__.columns.keys())
+
+
+ROW_CLASSES = {model: _row_class(model) for model in CACHED_MODELS.values()}
+
+
+def _encode(row):
+    return {name: value.isoformat() if isinstance(value, datetime) else value
+            for name, value in row._asdict().items()}
+
+
+def _decode(model, values):
+    for column in model.__table__.columns:
+        if isinstance(column.type, db.DateTime) and \
+                values[column.key] is not None:
+            values[column.key] = datetime.fromisoformat(values[column.key])
+    return ROW_CLASSES[model](**values)
+
+
+def _statement_ids(whereclause, table):
+    # The ids of `id = :x` and `id IN (:x)` criteria, or None if the
+    # statement may touch other rows too. The ORM's columns are annotated
+    # copies, so they are matched by table and name.
+    if whereclause is None:
+        return None
+    ids = set()
+    for element in visitors.iterate(whereclause):
+        if isinstance(element, BinaryExpression) and \
+                getattr(element.left, 'table', None) is table and \
+                element.left.name == 'id' and \
+                isinstance(element.right, BindParameter):
+            value = element.right.effective_value
+            if element.operator is operators.eq:
+                ids.add(value)
+            elif element.operator is operators.in_op:
+                ids.update(value)
+    return ids or None
+
+
+class EntityCache:
+    """ Second-level cache of venue and artist rows, by id.
+
+    The column values are kept as JSON in ENTITY_CACHE_STORE_URL, a store
+    shared by every app server, so a write on any of them invalidates the
+    entry for all. Without it the cache is kept in the local store, which
+    is only shared by the workers of one host: with more than one app
+    server, the others would serve a stale row for up to ENTITY_CACHE_TTL
+    seconds. Rows are returned as read-only named tuples with the model's
+    column names.
+
+    Writes made through the session are tracked by session events: the
+    ORM's flushes, and the UPDATE and DELETE statements of updates.py, by
+    the ids in their WHERE clause (a whole table when those can't be told).
+    Their cache entries are replaced by tombstones once the transaction
+    commits. A worker refilling an entry only writes it if the entry it
+    missed is still there, so a row read before a concurrent commit never
+    lands in the cache after that commit's invalidation.
+
+    Writes that bypass the session (migrations, backfills, psql) are only
+    picked up when entries expire, after ENTITY_CACHE_TTL seconds.
+    """
+
+    def __init__(self, store=None, ttl=300):
+        self.store = store
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.stats = Counter()
+
+    def init_app(self, app, store):
+        self.store = store
+        self.ttl = app.config.get('ENTITY_CACHE_TTL', self.ttl)
+
+        if not event.contains(db.session, 'after_commit', self._after_commit):
+            event.listen(db.session, 'after_flush', self._after_flush)
+            event.listen(db.session, 'do_orm_execute', self._do_orm_execute)
+            event.listen(db.session, 'after_commit', self._after_commit)
+            event.listen(db.session, 'after_transaction_end',
+                         self._after_transaction_end)
+
+    def _key(self, model, obj_id):
+        return 'entity:{}:{}'.format(model.__tablename__, obj_id)
+
+    def _generation(self, model):
+        # Part of every key, bumped to drop a whole table at once.
+        key = 'entity:{}:generation'.format(model.__tablename__)
+        generation = self.store.get(key)
+        if generation is None:
+            # The first worker to start one wins, the others use it too.
+            self.store.set_if(key, None, uuid.uuid4().hex[:8])
+            generation = self.store.get(key)
+        return generation
+
+    def _count(self, model, name, count=1):
+        with self._lock:
+            self.stats[model.__tablename__, name] += count
+
+    def get(self, model, obj_id):
+        """ Returns the row of a venue or artist, from the cache if it
+        holds it, or None if there is no such row.
+
+        Args:
+            model: Venue or Artist.
+            obj_id: The id of the row.
+        """
+
+        key = '{}:{}'.format(self._key(model, obj_id),
+                             self._generation(model))
+        seen = self.store.get(key)
+        if seen is not None:
+            values = json.loads(seen).get('row')
+            # Entries cached before a column was added are missed.
+            if values is not None and \
+                    values.keys() == set(ROW_CLASSES[model]._fields):
+                self._count(model, 'hits')
+                return _decode(model, values)
+        self._count(model, 'misses')
+
+        row = db.session.execute(
+            select(*model.__table__.columns).where(model.id == obj_id)) \
+            .first()
+        if row is None:
+            return None
+        row = ROW_CLASSES[model](*row)
+
+        # Skipped if the entry was invalidated since it was missed.
+        self.store.set_if(key, seen, json.dumps({'row': _encode(row)}),
+                          ttl=self.ttl)
+        return row
+
+    def invalidate(self, model, ids):
+        """ Drops rows from the cache. Call it after the write committed.
+
+        Args:
+            model: Venue or Artist.
+            ids: The ids of the rows, or ALL for the whole table.
+        """
+
+        if ids == ALL:
+            self.store.set('entity:{}:generation'.format(model.__tablename__),
+                           uuid.uuid4().hex[:8])
+            self._count(model, 'evictions')
+            return
+
+        generation = self._generation(model)
+        tombstone = json.dumps({'tombstone': uuid.uuid4().hex[:8]})
+        for obj_id in ids:
+            self.store.set('{}:{}'.format(self._key(model, obj_id),
+                                          generation),
+                           tombstone, ttl=self.ttl)
+        self._count(model, 'evictions', len(ids))
+
+    def metrics(self):
+        """ Returns the hits, misses and evictions of this worker, per
+        model. """
+
+        with self._lock:
+            stats = dict(self.stats)
+        metrics = {}
+        for table in CACHED_MODELS:
+            hits = stats.get((table, 'hits'), 0)
+            misses = stats.get((table, 'misses'), 0)
+            metrics[table] = {
+                'hits': hits,
+                'misses': misses,
+                'evictions': stats.get((table, 'evictions'), 0),
+                'hit_rate': round(hits / (hits + misses), 3)
+                if hits + misses else None,
+            }
+        return metrics
+
+    # Session events.
+
+    def _pending(self, session):
+        return session.info.setdefault(PENDING, {})
+
+    def _after_flush(self, session, flush_context):
+        for obj in list(session.dirty) + list(session.deleted):
+            model = CACHED_MODELS.get(getattr(obj, '__tablename__', None))
+            if model is not None and obj.id is not None:
+                ids = self._pending(session).setdefault(model, set())
+                if ids != ALL:
+                    ids.add(obj.id)
+
+    def _do_orm_execute(self, orm_execute_state):
+        if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+            return
+        statement = orm_execute_state.statement
+        model = CACHED_MODELS.get(getattr(statement.table, 'name', None))
+        if model is None:
+            return
+        ids = _statement_ids(statement.whereclause, model.__table__)
+        pending = self._pending(orm_execute_state.session)
+        if ids is None:
+            pending[model] = ALL
+        elif pending.get(model) != ALL:
+            pending.setdefault(model, set()).update(ids)
+
+    def _after_commit(self, session):
+        pending = session.info.pop(PENDING, None)
+        for model, ids in (pending or {}).items():
+            self.invalidate(model, ids)
+
+    def _after_transaction_end(self, session, transaction):
+        # Rolled back or closed, the writes never happened.
+        if transaction.parent is None:
+            session.info.pop(PENDING, None)
@@ -0,0 +1,32 @@
+from flask_wtf import CSRFProtect
+
+from assets import Assets
+from autocomplete import Autocomplete
+from calendars import CalendarFeeds
+from changes import ChangeLog
+from compression import Compressor
+from entity_cache import EntityCache
+from feed import RecentFeed
+from images import ImageStore
+from loadshed import LoadShedder
+from matchmaking import Matchmaker
+from profiling import Profiler
+from slowlog import SlowQueryLog
+from tasks import TaskQueue
+
+# Created unbound and attached to an app by create_app, so views and tasks
+# can import them without importing the app.
+csrf = CSRFProtect()
+profiler = Profiler()
+slow_query_log = SlowQueryLog()
+load_shedder = LoadShedder()
+compressor = Compressor()
+assets = Assets()
+image_store = ImageStore()
+task_queue = TaskQueue()
+recent_feed = RecentFeed()
+changelog = ChangeLog()
+matchmaker = Matchmaker()
+autocomplete = Autocomplete()
+calendar_feeds = CalendarFeeds()
+entity_cache = EntityCache()
@@ -0,0 +1,102 @@
+import json
+
+from models import db
+
+# Columns kept per entry, enough for the home page.
+FEED_COLUMNS = ['id', 'name', 'image_link', 'image_file', 'city', 'state',
+                'created_date']
+
+
+def recently_listed(model, limit):
+    """ Loads the newest venues or artists as plain dicts.
+
+    Uses a column projection so none of their shows are loaded.
+    """
+
+    rows = db.session.query(*[getattr(model, name) for name in FEED_COLUMNS]) \
+        .order_by(db.desc(model.created_date)).limit(limit)
+    return [feed_entry(row) for row in rows]
+
+
+def feed_entry(obj):
+    entry = {name: getattr(obj, name) for name in FEED_COLUMNS}
+    entry['created_date'] = entry['created_date'].isoformat(sep=' ')
+    return entry
+
+
+class RecentFeed:
+    """ Bounded lists of the most recently listed venues and artists.
+
+    The lists live in a store shared by the workers (FEED_STORE_URL, or the
+    local store of the host), so every worker sees the same feed. They are built from the database on startup and then kept
+    current by the create, edit and delete handlers, which means the home
+    page normally doesn't query the database at all.
+    """
+
+    def __init__(self, store=None, size=10):
+        self.store = store
+        self.size = size
+
+    def init_app(self, app, store):
+        self.store = store
+        self.size = app.config.get('RECENT_FEED_SIZE', self.size)
+
+    def _key(self, kind):
+        return 'recent:' + kind
+
+    def get(self, kind):
+        """ Returns the feed for 'venues' or 'artists', or None if it has not
+        been built yet. """
+
+        value = self.store.get(self._key(kind))
+        return None if value is None else json.loads(value)
+
+    def rebuild(self, kind, model):
+        entries = recently_listed(model, self.size)
+        self.store.set(self._key(kind), json.dumps(entries))
+        return entries
+
+    def _modify(self, kind, change):
+        def modified(value):
+            if value is None:
+                # Not built yet, the next rebuild will pick the change up.
+                return None
+            return json.dumps(change(json.loads(value)))
+
+        value = self.store.modify(self._key(kind), modified)
+        return None if value is None else json.loads(value)
+
+    def push(self, kind, entry):
+        """ Adds a newly created venue or artist (see feed_entry) to the top
+        of the feed. """
+
+        def change(entries):
+            entries = [e for e in entries if e['id'] != entry['id']]
+            return [entry] + entries[:self.size - 1]
+        self._modify(kind, change)
+
+    def update(self, kind, obj_id, changes):
+        """ Applies edited columns to an entry, if it is in the feed. """
+
+        changes = {name: value for name, value in changes.items()
+                   if name in FEED_COLUMNS}
+        if not changes:
+            return
+
+        def change(entries):
+            for entry in entries:
+                if entry['id'] == obj_id:
+                    entry.update(changes)
+            return entries
+        self._modify(kind, change)
+
+    def discard(self, kind, obj_ids, model):
+        """ Removes deleted venues or artists, refilling the feed from the
+        database if that leaves it short. """
+
+        obj_ids = set(obj_ids)
+        entries = self._modify(
+            kind, lambda entries: [e for e in entries
+                                   if e['id'] not in obj_ids])
+        if entries is not None and len(entries) < self.size:
+            self.rebuild(kind, model)
@@ -1,10 +1,14 @@
 from datetime import datetime
 from flask_wtf import FlaskForm as Form
+from flask_wtf.file import FileField, FileAllowed
 from wtforms import StringField, SelectField, SelectMultipleField, \
-    DateTimeField, BooleanField
-from wtforms.validators import DataRequired, URL
+    DateTimeField, BooleanField, IntegerField, TextAreaField, FloatField
+from wtforms.validators import DataRequired, URL, Optional, NumberRange, \
+    InputRequired
+from wtforms.widgets import HiddenInput
 from wtforms.fields.html5 import TelField
 from enums import Genre, State
+from images import ALLOWED_EXTENSIONS
 import re
 
 
@@ -38,6 +42,57 @@ class ShowForm(Form):
         validators=[DataRequired()],
         default=datetime.today()
     )
+    duration_minutes = IntegerField(
+        'duration_minutes',
+        validators=[DataRequired(), NumberRange(min=1, max=24 * 60)],
+        default=120
+    )
+
+
+class TourForm(Form):
+    artist_id = IntegerField(
+        'artist_id', validators=[DataRequired()]
+    )
+    duration_minutes = IntegerField(
+        'duration_minutes',
+        validators=[DataRequired(), NumberRange(min=1, max=24 * 60)],
+        default=120
+    )
+    # One "venue id, YYYY-MM-DD HH:MM" pair per line.
+    dates = TextAreaField(
+        'dates', validators=[DataRequired()]
+    )
+
+    def validate(self):
+        """ Parses the dates into self.entries, a list of
+        (line number, venue id, start time) tuples. """
+        rv = Form.validate(self)
+        if not rv:
+            return False
+
+        self.entries = []
+        for number, line in enumerate(self.dates.data.splitlines(), 1):
+            if not line.strip():
+                continue
+            venue_id, _, start_time = line.partition(',')
+            try:
+                self.entries.append((
+                    number,
+                    int(venue_id),
+                    datetime.strptime(start_time.strip(), '%Y-%m-%d %H:%M')
+                ))
+            except ValueError:
+                self.dates.errors.append(
+                    'Line {}: expected "venue id, YYYY-MM-DD HH:MM".'
+                    .format(number))
+
+        if self.dates.errors:
+            return False
+        if not self.entries:
+            self.dates.errors.append('No dates given.')
+            return False
+        # if pass validation
+        return True
 
 
 class VenueForm(Form):
@@ -54,12 +109,22 @@ class VenueForm(Form):
     address = StringField(
         'address', validators=[DataRequired()]
     )
+    latitude = FloatField(
+        'latitude', validators=[Optional(), NumberRange(-90, 90)]
+    )
+    longitude = FloatField(
+        'longitude', validators=[Optional(), NumberRange(-180, 180)]
+    )
     phone = TelField(
         'phone', validators=[DataRequired()]
     )
     image_link = StringField(
         'image_link'
     )
+    image_upload = FileField(
+        'image_upload',
+        validators=[FileAllowed(ALLOWED_EXTENSIONS, 'Images only.')]
+    )
     genres = SelectMultipleField(
         'genres', validators=[DataRequired()],
         choices=Genre.choices()
@@ -77,6 +142,15 @@ class VenueForm(Form):
         'seeking_description'
     )
 
+    # The version_id the edit form was rendered with.
+    version = IntegerField(
+        'version', validators=[Optional()], widget=HiddenInput()
+    )
+
+    # Ticked to list it even though similar entries exist (see
+    # duplicates.py).
+    not_duplicate = BooleanField('not_duplicate')
+
     def validate(self):
         """Define a custom validate method in your Form:"""
         rv = Form.validate(self)
@@ -91,10 +165,20 @@ class VenueForm(Form):
         if self.state.data not in dict(State.choices()).keys():
             self.state.errors.append('Invalid state.')
             return False
+        if (self.latitude.data is None) != (self.longitude.data is None):
+            self.latitude.errors.append('Enter both latitude and longitude.')
+            return False
         # if pass validation
         return True
 
 
+class EditVenueForm(VenueForm):
+    # Edits are only saved against the version they were made on.
+    version = IntegerField(
+        'version', validators=[InputRequired()], widget=HiddenInput()
+    )
+
+
 class ArtistForm(Form):
     name = StringField(
         'name', validators=[DataRequired()]
@@ -110,7 +194,11 @@ class ArtistForm(Form):
         'phone', validators=[DataRequired()]
     )
     image_link = StringField(
-        'image_link', validators=[URL()]
+        'image_link', validators=[Optional(), URL()]
+    )
+    image_upload = FileField(
+        'image_upload',
+        validators=[FileAllowed(ALLOWED_EXTENSIONS, 'Images only.')]
     )
     genres = SelectMultipleField(
         'genres', validators=[DataRequired()],
@@ -130,6 +218,15 @@ class ArtistForm(Form):
         'seeking_description'
     )
 
+    # The version_id the edit form was rendered with.
+    version = IntegerField(
+        'version', validators=[Optional()], widget=HiddenInput()
+    )
+
+    # Ticked to list it even though similar entries exist (see
+    # duplicates.py).
+    not_duplicate = BooleanField('not_duplicate')
+
     def validate(self):
         """Define a custom validate method in your Form:"""
         rv = Form.validate(self)
@@ -146,3 +243,10 @@ class ArtistForm(Form):
             return False
         # if pass validation
         return True
+
+
+class EditArtistForm(ArtistForm):
+    # Edits are only saved against the version they were made on.
+    version = IntegerField(
+        'version', validators=[InputRequired()], widget=HiddenInput()
+    )
@@ -0,0 +1,71 @@
+from datetime import datetime
+
+from sqlalchemy import text
+
+from models import db
+
+# Largest number of venues a single nearby search returns.
+MAX_RESULTS = 100
+
+# ll_to_earth() places points on a sphere in metres. The GiST index on
+# ll_to_earth(latitude, longitude) answers both the earth_box() bounding box
+# test and the nearest-first <-> ordering, so only the venues that end up
+# in the result are visited.
+NEAREST_VENUES = '''
+SELECT v.id, v.name, v.city, v.state, v.address, v.latitude, v.longitude,
+    earth_distance(ll_to_earth(v.latitude, v.longitude),
+                   ll_to_earth(:latitude, :longitude)) AS distance,
+    (SELECT count(*) FROM show s
+     WHERE s.venue_id = v.id AND s.start_time > :now) AS num_upcoming_shows
+FROM venue v
+WHERE v.latitude IS NOT NULL {radius_filter}
+ORDER BY ll_to_earth(v.latitude, v.longitude) <-> ll_to_earth(:latitude,
+                                                              :longitude)
+LIMIT :limit
+'''
+
+# earth_box() is a cube around the circle, so it is followed by the exact
+# distance test.
+RADIUS_FILTER = '''
+    AND earth_box(ll_to_earth(:latitude, :longitude), :radius)
+        @> ll_to_earth(v.latitude, v.longitude)
+    AND earth_distance(ll_to_earth(v.latitude, v.longitude),
+                       ll_to_earth(:latitude, :longitude)) <= :radius
+'''
+
+
+def venues_near(latitude, longitude, radius_km=None, limit=20):
+    """ Finds the venues closest to a point, nearest first.
+
+    Args:
+        latitude: Latitude of the point, in degrees.
+        longitude: Longitude of the point, in degrees.
+        radius_km: Only return venues within this distance, or None for the
+            nearest venues however far away they are.
+        limit: The number of venues to return at most.
+
+    Returns: A list of dicts with the venue, its distance in kilometres and
+        its number of upcoming shows.
+    """
+
+    values = {'latitude': latitude, 'longitude': longitude,
+              'limit': min(limit, MAX_RESULTS), 'now': datetime.now()}
+    radius_filter = ''
+    if radius_km is not None:
+        radius_filter = RADIUS_FILTER
+        values['radius'] = radius_km * 1000
+
+    rows = db.session.execute(
+        text(NEAREST_VENUES.format(radius_filter=radius_filter)), values)
+
+    return [{
+        'id': row.id,
+        'name': row.name,
+        'city': row.city,
+        'state': row.state,
+        'address': row.address,
+        'latitude': row.latitude,
+        'longitude': row.longitude,
+        'distance_km': round(row.distance / 1000, 3),
+        'num_upcoming_shows': row.num_upcoming_shows,
+    } for row in rows]
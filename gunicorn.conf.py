@@ -0,0 +1,22 @@
+import gc
+import os
+
+wsgi_app = 'wsgi:app'
+bind = '0.0.0.0:' + os.environ.get('PORT', '8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+# Threaded workers, so a worker can keep serving cheap pages while its
+# expensive ones wait for a slot (see loadshed.py).
+threads = int(os.environ.get('GUNICORN_THREADS', 16))
+
+# Import and create the app once in the master, the workers are forked from
+# it and share its memory copy-on-write.
+preload_app = True
+
+
+def when_ready(server):
+    # Runs in the master after the app is loaded and before any worker is
+    # forked. Moving everything allocated so far out of the collector's
+    # reach stops the workers' garbage collections from writing to, and so
+    # copying, the shared pages.
+    gc.collect()
+    gc.freeze()
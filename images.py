@@ -0,0 +1,152 @@
+import hashlib
+import os
+from io import BytesIO
+
+from flask import url_for
+
+# Slot name -> (width, height). Thumbnails are cropped to fill the slot
+# exactly, a height of None keeps the aspect ratio of the original.
+SIZES = {
+    'thumb': (160, 160),
+    'tile': (320, 240),
+    'large': (640, None),
+}
+# Smallest slot first, used to pick the smallest variant that fits.
+SLOT_ORDER = sorted(SIZES, key=lambda slot: SIZES[slot][0])
+
+FORMATS = {'jpg': 'JPEG', 'webp': 'WEBP'}
+QUALITY = 82
+
+ALLOWED_EXTENSIONS = ['jpg', 'jpeg', 'png', 'gif', 'webp']
+
+
+class ImageStore:
+    """ Content-addressed store for uploaded venue and artist images.
+
+    Files are named after the SHA-256 of their content, so uploading the same
+    image twice stores it once. Originals are written synchronously; the
+    resized JPEG and WebP variants are generated in the background by the
+    'image_variants' task (see tasks.py).
+
+    Layout below the upload folder:
+        original/ab/abcdef....png
+        <slot>/ab/abcdef....<jpg|webp>
+    """
+
+    def __init__(self, app=None):
+        self.folder = None
+        # Variants known to exist, so templates don't stat files on every
+        # render.
+        self._existing = set()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.folder = app.config.get(
+            'IMAGE_UPLOAD_FOLDER', os.path.join(app.static_folder, 'uploads'))
+        self.url_prefix = os.path.relpath(self.folder, app.static_folder)
+
+        app.jinja_env.globals['image_url'] = self.image_url
+        app.jinja_env.globals['image_variant_url'] = self.variant_url
+
+    def _path(self, kind, digest, extension):
+        return os.path.join(self.folder, kind, digest[:2],
+                            digest + '.' + extension)
+
+    def _url(self, path):
+        relative = os.path.relpath(path, self.folder).replace(os.sep, '/')
+        return url_for('static', filename=self.url_prefix + '/' + relative)
+
+    def save(self, file_storage):
+        """ Stores the original of an uploaded image.
+
+        Args:
+            file_storage: The uploaded file from the form.
+
+        Returns: The stored filename (digest and extension) to keep on the
+            venue or artist.
+
+        Raises:
+            ValueError: If the upload is not an image Pillow can read.
+        """
+
+        from PIL import Image, UnidentifiedImageError
+
+        content = file_storage.read()
+        try:
+            with Image.open(BytesIO(content)) as image:
+                image_format = image.format.lower()
+                image.verify()
+        except (UnidentifiedImageError, OSError, SyntaxError):
+            raise ValueError('Uploaded file is not a valid image.')
+
+        extension = 'jpg' if image_format == 'jpeg' else image_format
+        digest = hashlib.sha256(content).hexdigest()
+        filename = digest + '.' + extension
+
+        path = self._path('original', digest, extension)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write under a temporary name so a half-written file is never
+            # mistaken for a stored original.
+            with open(path + '.tmp', 'wb') as f:
+                f.write(content)
+            os.replace(path + '.tmp', path)
+
+        return filename
+
+    def generate_variants(self, filename):
+        """ Writes every missing size/format variant of a stored original. """
+
+        from PIL import Image, ImageOps
+
+        digest, extension = filename.split('.', 1)
+        with Image.open(self._path('original', digest, extension)) as image:
+            image = ImageOps.exif_transpose(image).convert('RGB')
+
+            for slot, (width, height) in SIZES.items():
+                if height is None:
+                    resized = image.copy()
+                    resized.thumbnail((width, width * 4), Image.LANCZOS)
+                else:
+                    resized = ImageOps.fit(image, (width, height),
+                                           Image.LANCZOS)
+
+                for extension, image_format in FORMATS.items():
+                    path = self._path(slot, digest, extension)
+                    if os.path.exists(path):
+                        continue
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    resized.save(path + '.tmp', image_format,
+                                 quality=QUALITY, optimize=True)
+                    os.replace(path + '.tmp', path)
+
+    def variant_url(self, filename, slot, extension='jpg'):
+        """ Returns the url of the smallest variant that fills the slot, or
+        None when there is no upload or its variants aren't ready yet. """
+
+        if not filename:
+            return None
+
+        digest = filename.split('.', 1)[0]
+        for candidate in SLOT_ORDER[SLOT_ORDER.index(slot):]:
+            path = self._path(candidate, digest, extension)
+            if path in self._existing or os.path.exists(path):
+                self._existing.add(path)
+                return self._url(path)
+        return None
+
+    def image_url(self, filename, image_link, slot):
+        """ Returns the best url to show an image in the given slot.
+
+        Prefers a resized local variant, then the uploaded original, and
+        finally falls back to the remote image link.
+        """
+
+        url = self.variant_url(filename, slot)
+        if url:
+            return url
+        if filename:
+            digest, extension = filename.split('.', 1)
+            return self._url(self._path('original', digest, extension))
+        return image_link
@@ -0,0 +1,158 @@
+import threading
+import time
+from collections import Counter
+
+from flask import g, request, current_app, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from models import db
+
+# SQLSTATE of a statement cancelled by statement_timeout.
+QUERY_CANCELED = '57014'
+
+DEFAULT_CLASSES = {
+    'default': {'limit': None, 'queue': 16, 'wait': 2.0,
+                'statement_timeout_ms': 2000},
+}
+
+
+class LoadShedder:
+    """ Limits how many requests of each route class a worker runs at once.
+
+    A worker runs at most LOAD_SHED_CAPACITY requests together, about the
+    number of database connections it should hold. Views are put in a
+    class with the route_class decorator, the others are 'default'. Each
+    class in ROUTE_CLASSES sets:
+
+        limit                 requests of the class running at once, None
+                              for no limit but the capacity
+        queue                 requests that may wait for a slot, any more
+                              are turned away at once
+        wait                  seconds a request waits before it is turned
+                              away
+        statement_timeout_ms  Postgres statement_timeout of its queries
+
+    As long as the limits of the expensive classes add up to less than the
+    capacity, the slots left over can only be taken by the other routes,
+    so a burst of searches never keeps the detail pages from loading.
+    Turned away requests get a 503 with a Retry-After header. Counters of
+    every class are shown at /metrics/load (see METRICS_TOKEN).
+    """
+
+    def __init__(self, app=None):
+        self.classes = DEFAULT_CLASSES
+        self._condition = threading.Condition()
+        self.active = Counter()
+        self.waiting = Counter()
+        self.stats = Counter()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.capacity = app.config.get('LOAD_SHED_CAPACITY', 8)
+        self.classes = dict(DEFAULT_CLASSES,
+                            **app.config.get('ROUTE_CLASSES', {}))
+        self.retry_after = app.config.get('LOAD_SHED_RETRY_AFTER', 1)
+
+        app.before_request(self._admit)
+        app.teardown_request(self._release)
+
+        # The session and engines are shared by every app, only listen once.
+        if not event.contains(db.session, 'after_begin', _after_begin):
+            event.listen(db.session, 'after_begin', _after_begin)
+            event.listen(Engine, 'handle_error', self._handle_error)
+
+    def route_class(self, name):
+        """ Puts a view in a route class. None exempts it from the limits.
+        """
+
+        def decorator(view):
+            view.route_class = name
+            return view
+
+        return decorator
+
+    def _route_class(self):
+        if request.endpoint is None or request.endpoint == 'static':
+            return None
+        view = current_app.view_functions[request.endpoint]
+        return getattr(view, 'route_class', 'default')
+
+    def _admissible(self, name, settings):
+        if sum(self.active.values()) >= self.capacity:
+            return False
+        return settings['limit'] is None or \
+            self.active[name] < settings['limit']
+
+    def _admit(self):
+        name = self._route_class()
+        if name is None:
+            return
+        settings = self.classes[name]
+
+        with self._condition:
+            if not self._admissible(name, settings):
+                if self.waiting[name] >= settings['queue']:
+                    return self._shed(name, 'shed_full')
+
+                self.waiting[name] += 1
+                self.stats[name, 'queued'] += 1
+                deadline = time.monotonic() + settings['wait']
+                try:
+                    while not self._admissible(name, settings):
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            return self._shed(name, 'shed_timeout')
+                        self._condition.wait(remaining)
+                finally:
+                    self.waiting[name] -= 1
+
+            self.active[name] += 1
+            self.stats[name, 'admitted'] += 1
+        g.route_class = name
+        g.statement_timeout_ms = settings['statement_timeout_ms']
+
+    def _shed(self, name, reason):
+        self.stats[name, reason] += 1
+        return 'The site is busy, please try again in a moment.', 503, \
+            {'Retry-After': str(self.retry_after)}
+
+    def _release(self, error):
+        name = g.pop('route_class', None)
+        if name is None:
+            return
+        with self._condition:
+            self.active[name] -= 1
+            self._condition.notify_all()
+
+    def _handle_error(self, context):
+        if getattr(context.original_exception, 'pgcode', None) == \
+                QUERY_CANCELED and has_request_context():
+            self.stats[g.get('route_class'), 'statement_timeouts'] += 1
+
+    def metrics(self):
+        """ Returns the load of this worker, per route class. """
+
+        with self._condition:
+            classes = {}
+            for name, settings in self.classes.items():
+                classes[name] = dict(
+                    limit=settings['limit'],
+                    active=self.active[name],
+                    waiting=self.waiting[name],
+                    **{counter: self.stats[name, counter] for counter in (
+                        'admitted', 'queued', 'shed_full', 'shed_timeout',
+                        'statement_timeouts')})
+            return {'capacity': self.capacity,
+                    'active': sum(self.active.values()),
+                    'classes': classes}
+
+
+def _after_begin(session, transaction, connection):
+    # SET LOCAL lasts until the transaction ends, so it has to be repeated
+    # for every transaction of the request.
+    timeout = g.get('statement_timeout_ms') if has_request_context() else None
+    if timeout and connection.dialect.name == 'postgresql':
+        connection.exec_driver_sql(
+            'SET LOCAL statement_timeout = %d' % int(timeout))
@@ -0,0 +1,228 @@
+import threading
+
+from sqlalchemy import select
+
+from enums import Genre
+from models import db, Venue, Artist
+
+# Column of each side that says it is looking for the other side.
+SEEKING_COLUMNS = {'venues': 'seeking_talent', 'artists': 'seeking_venue'}
+MODELS = {'venues': Venue, 'artists': Artist}
+OTHER_SIDE = {'venues': 'artists', 'artists': 'venues'}
+
+# Score of a candidate: the share of the subject's genres it plays, plus a
+# bonus for being in the same city or state and for looking for a match.
+GENRE_WEIGHT = 3.0
+CITY_WEIGHT = 2.0
+STATE_WEIGHT = 1.0
+SEEKING_WEIGHT = 1.5
+
+GENRE_INDEX = {genre.name: i for i, genre in enumerate(Genre)}
+
+# Largest number of matches a single lookup returns.
+MAX_MATCHES = 100
+
+
+def _normalize(value):
+    return (value or '').strip().lower()
+
+
+class Catalog:
+    """ Every venue or artist as rows of NumPy arrays.
+
+    Genres are a 0/1 matrix with a column per Genre, so the genre overlap
+    with every candidate is a single matrix-vector product. Cities and
+    states are stored as integer codes. Rows are updated in place when a
+    venue or artist changes and deleted ones are only marked inactive, so
+    keeping the catalog current never means rebuilding it.
+    """
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.model = MODELS[kind]
+        self.seq = None
+        self.rows = {}
+        self.cities = {}
+        self.states = {}
+        self.size = 0
+
+    def _columns(self):
+        model = self.model
+        return [model.id, model.genres, model.city, model.state,
+                getattr(model, SEEKING_COLUMNS[self.kind])]
+
+    def _allocate(self, capacity):
+        import numpy as np
+
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.genres = np.zeros((capacity, len(GENRE_INDEX)), dtype=np.float32)
+        self.city = np.full(capacity, -1, dtype=np.int32)
+        self.state = np.full(capacity, -1, dtype=np.int32)
+        self.seeking = np.zeros(capacity, dtype=np.float32)
+        self.active = np.zeros(capacity, dtype=bool)
+
+    def _grow(self):
+        import numpy as np
+
+        old = (self.ids, self.genres, self.city, self.state, self.seeking,
+               self.active)
+        self._allocate(max(2 * len(self.ids), 1024))
+        new = (self.ids, self.genres, self.city, self.state, self.seeking,
+               self.active)
+        for source, target in zip(old, new):
+            np.copyto(target[:len(source)], source)
+
+    def _code(self, codes, value):
+        return codes.setdefault(_normalize(value), len(codes))
+
+    def _set(self, row):
+        obj_id, genres, city, state, seeking = row
+        index = self.rows.get(obj_id)
+        if index is None:
+            if self.size == len(self.ids):
+                self._grow()
+            index = self.rows[obj_id] = self.size
+            self.size += 1
+
+        self.ids[index] = obj_id
+        self.genres[index] = 0
+        for genre in genres or []:
+            if genre in GENRE_INDEX:
+                self.genres[index, GENRE_INDEX[genre]] = 1
+        self.city[index] = self._code(self.cities, city)
+        self.state[index] = self._code(self.states, state)
+        self.seeking[index] = 1 if seeking else 0
+        self.active[index] = True
+
+    def load(self, seq):
+        """ Builds the catalog from every row of the table. """
+
+        rows = db.session.execute(select(*self._columns())).all()
+        self.rows = {}
+        self.cities = {}
+        self.states = {}
+        self.size = 0
+        self._allocate(max(len(rows), 1024))
+        for row in rows:
+            self._set(row)
+        self.seq = seq
+
+    def refresh(self, ids, seq):
+        """ Reloads the given rows, deactivating the ones that are gone. """
+
+        rows = db.session.execute(
+            select(*self._columns()).where(self.model.id.in_(ids))).all()
+        for row in rows:
+            self._set(row)
+        for obj_id in set(ids) - {row[0] for row in rows}:
+            index = self.rows.get(obj_id)
+            if index is not None:
+                self.active[index] = False
+        self.seq = seq
+
+    def top(self, genres, city, state, limit):
+        """ Scores every active row against a subject.
+
+        Returns: A list of (id, score) tuples, best first.
+        """
+
+        import numpy as np
+
+        size = self.size
+        query = np.zeros(len(GENRE_INDEX), dtype=np.float32)
+        for genre in genres or []:
+            if genre in GENRE_INDEX:
+                query[GENRE_INDEX[genre]] = 1
+
+        scores = SEEKING_WEIGHT * self.seeking[:size]
+        if query.any():
+            scores += (GENRE_WEIGHT / query.sum()) * \
+                (self.genres[:size] @ query)
+        city_code = self.cities.get(_normalize(city))
+        if city_code is not None:
+            scores += CITY_WEIGHT * (self.city[:size] == city_code)
+        state_code = self.states.get(_normalize(state))
+        if state_code is not None:
+            scores += STATE_WEIGHT * (self.state[:size] == state_code)
+        scores[~self.active[:size]] = -np.inf
+
+        limit = min(limit, int(self.active[:size].sum()))
+        if limit <= 0:
+            return []
+        # Partial sort: only the best `limit` rows get ordered.
+        best = np.argpartition(-scores, limit - 1)[:limit]
+        best = best[np.argsort(-scores[best], kind='stable')]
+        return [(int(self.ids[i]), round(float(scores[i]), 3)) for i in best]
+
+
+class Matchmaker:
+    """ Recommends artists for a venue and venues for an artist.
+
+    Each worker keeps a Catalog of both sides in memory, built on first use.
+    Before answering it applies the entries of the shared ChangeLog it
+    hasn't seen yet, so a lookup only reloads the rows that changed.
+    """
+
+    def __init__(self, changelog=None):
+        self.changelog = changelog
+        self.catalogs = {kind: Catalog(kind) for kind in MODELS}
+        self._lock = threading.Lock()
+
+    def init_app(self, app, changelog):
+        self.changelog = changelog
+
+    def _sync(self, kind):
+        catalog = self.catalogs[kind]
+        seq, ids = self.changelog.since(kind, catalog.seq)
+        if ids is None:
+            catalog.load(seq)
+        elif ids:
+            catalog.refresh(ids, seq)
+
+    def matches(self, kind, subject, limit=10):
+        """ Finds the best matches of a venue or artist on the other side.
+
+        Args:
+            kind: The side of the subject, 'venues' or 'artists'.
+            subject: The venue or artist (or a row with its genres, city
+                and state).
+            limit: The number of matches to return.
+
+        Returns: A list of (id, score) tuples of the other side, best first.
+        """
+
+        other = OTHER_SIDE[kind]
+        with self._lock:
+            self._sync(other)
+            return self.catalogs[other].top(subject.genres, subject.city,
+                                            subject.state, limit)
+
+    def recommend(self, kind, obj_id, limit=10):
+        """ Finds the best matches of a venue or artist by id.
+
+        Returns: A list of dicts describing the matches, with their score,
+            or None if there is no such venue or artist.
+        """
+
+        model = MODELS[kind]
+        subject = db.session.execute(
+            select(model.genres, model.city, model.state)
+            .where(model.id == obj_id)).first()
+        if subject is None:
+            return None
+
+        scored = self.matches(kind, subject, min(limit, MAX_MATCHES))
+
+        other_kind = OTHER_SIDE[kind]
+        other = MODELS[other_kind]
+        rows = db.session.execute(
+            select(other.id, other.name, other.city, other.state,
+                   other.genres, other.image_link,
+                   getattr(other, SEEKING_COLUMNS[other_kind])
+                   .label('seeking'),
+                   other.seeking_description)
+            .where(other.id.in_([obj_id for obj_id, _ in scored])))
+        details = {row.id: dict(row._mapping) for row in rows}
+
+        return [dict(details[obj_id], score=score)
+                for obj_id, score in scored if obj_id in details]
@@ -0,0 +1,266 @@
+""" Operations for migrations that must not block the live site.
+
+Every migration runs in its own transaction (see migrations/env.py). The
+helpers here commit it and run their DDL outside of it:
+
+    locking_ddl(...)                DDL that needs a strong lock, retried
+                                    with a short lock_timeout so it never
+                                    queues in front of the site's queries
+    create_index_concurrently(...)  CREATE INDEX CONCURRENTLY, on each
+                                    partition of a partitioned table
+    drop_index_concurrently(...)
+    add_constraint_not_valid(...)   a CHECK or FOREIGN KEY that is only
+    validate_constraint(...)        checked for new rows, then validated
+                                    without blocking writes
+    batched_update(...)             an UPDATE of every row, in keyed
+                                    batches committed one by one
+
+Long rewrites of existing rows belong in a batched backfill (see
+backfills.py), not in a migration. batched_update() is for tables small
+enough to rewrite during the deploy, when the rest of the migration needs
+the rows filled in.
+"""
+
+import logging
+import time
+
+from alembic import op
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+logger = logging.getLogger('alembic.env')
+
+# SQLSTATE of a statement that gave up waiting for a lock.
+LOCK_NOT_AVAILABLE = '55P03'
+
+BATCH_SIZE = 1000
+
+LOCK_TIMEOUT = '2s'
+ATTEMPTS = 10
+# Seconds before the first retry, doubled after every attempt.
+RETRY_DELAY = 1.0
+MAX_RETRY_DELAY = 30.0
+
+
+def _offline():
+    return op.get_context().as_sql
+
+
+def locking_ddl(*statements, lock_timeout=LOCK_TIMEOUT,
+                statement_timeout=None, attempts=ATTEMPTS):
+    """ Runs DDL that takes an ACCESS EXCLUSIVE lock, in a transaction of
+    its own.
+
+    A statement waiting for a lock blocks every query behind it, so the
+    lock is only waited for lock_timeout. On timeout the transaction is
+    rolled back, and retried after a growing delay. Statements that
+    rewrite the table need a statement_timeout too, or better a different
+    approach.
+
+    Args:
+        statements: The SQL statements, run together.
+        lock_timeout: Postgres interval to wait for each lock.
+        statement_timeout: Postgres interval each statement may run, or
+            None for no limit.
+        attempts: The number of tries before giving up.
+
+    Raises:
+        OperationalError: If the lock could not be taken in any attempt.
+    """
+
+    settings = ["SET LOCAL lock_timeout = '{}'".format(lock_timeout)]
+    if statement_timeout is not None:
+        settings.append("SET LOCAL statement_timeout = '{}'".format(
+            statement_timeout))
+
+    if _offline():
+        for statement in settings + list(statements):
+            op.execute(statement)
+        return
+
+    with op.get_context().autocommit_block():
+        _retry_locking(op.get_bind().engine, settings + list(statements),
+                       attempts)
+
+
+def _retry_locking(engine, statements, attempts=ATTEMPTS):
+    # The retry loop of locking_ddl(), for callers already outside of the
+    # migration's transaction. statements include the SET LOCAL timeouts.
+    delay = RETRY_DELAY
+    for attempt in range(1, attempts + 1):
+        try:
+            with engine.begin() as connection:
+                for statement in statements:
+                    connection.execute(text(statement))
+            return
+        except OperationalError as e:
+            if getattr(e.orig, 'pgcode', None) != LOCK_NOT_AVAILABLE or \
+                    attempt == attempts:
+                raise
+        logger.warning('Lock not available, retrying in %.0fs (%d/%d)',
+                       delay, attempt, attempts)
+        time.sleep(delay)
+        delay = min(delay * 2, MAX_RETRY_DELAY)
+
+
+def _is_partitioned(connection, table):
+    return connection.execute(text(
+        "SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(:table)"),
+        {'table': table}).scalar()
+
+
+def _partitions(connection, table):
+    return [row[0] for row in connection.execute(text(
+        'SELECT child.relname FROM pg_inherits '
+        'JOIN pg_class child ON child.oid = pg_inherits.inhrelid '
+        'WHERE pg_inherits.inhparent = to_regclass(:table) '
+        'ORDER BY child.relname'), {'table': table})]
+
+
+def _drop_invalid_index(connection, name):
+    # A CREATE INDEX CONCURRENTLY that failed leaves an invalid index
+    # behind, which IF NOT EXISTS would take for a finished one.
+    invalid = connection.execute(text(
+        'SELECT NOT indisvalid FROM pg_index '
+        'WHERE indexrelid = to_regclass(:name)'), {'name': name}).scalar()
+    if invalid:
+        connection.execute(text(
+            'DROP INDEX CONCURRENTLY IF EXISTS {}'.format(name)))
+
+
+def _create_index(connection, name, table, create, definition):
+    if not _is_partitioned(connection, table):
+        _drop_invalid_index(connection, name)
+        connection.execute(text(
+            create + 'CONCURRENTLY IF NOT EXISTS {} ON {}{}'.format(
+                name, table, definition)))
+        return
+
+    # Both lock the table, so they are retried with a short lock_timeout
+    # like locking_ddl(). This runs in its autocommit block already.
+    lock_timeout = "SET LOCAL lock_timeout = '{}'".format(LOCK_TIMEOUT)
+    _retry_locking(connection.engine, [
+        lock_timeout,
+        create + 'IF NOT EXISTS {} ON ONLY {}{}'.format(name, table,
+                                                         definition)])
+    for partition in _partitions(connection, table):
+        partition_index = '{}_{}'.format(partition, name)[:63]
+        _drop_invalid_index(connection, partition_index)
+        connection.execute(text(
+            create + 'CONCURRENTLY IF NOT EXISTS {} ON {}{}'.format(
+                partition_index, partition, definition)))
+        attached = connection.execute(text(
+            'SELECT 1 FROM pg_inherits '
+            'WHERE inhrelid = to_regclass(:index)'),
+            {'index': partition_index}).scalar()
+        if not attached:
+            _retry_locking(connection.engine, [
+                lock_timeout,
+                'ALTER INDEX {} ATTACH PARTITION {}'.format(
+                    name, partition_index)])
+
+
+def create_index_concurrently(name, table, columns, unique=False,
+                              using=None, where=None):
+    """ Builds an index without blocking writes to the table.
+
+    Partitioned tables can't be indexed concurrently, so their index is
+    created on the parent alone, built concurrently on every partition and
+    then attached, which makes it valid once all partitions are. Creating
+    and attaching lock the table, they are retried like locking_ddl().
+
+    Args:
+        name: The index name.
+        table: The table name.
+        columns: The SQL of the indexed columns or expressions, e.g.
+            'venue_id, start_time' or 'lower(name)'.
+        unique: Whether to create a unique index.
+        using: The index method, e.g. 'gist', or None for btree.
+        where: The predicate of a partial index.
+    """
+
+    definition = '{} ({}){}'.format(
+        ' USING ' + using if using else '', columns,
+        ' WHERE ' + where if where else '')
+    create = 'CREATE {}INDEX '.format('UNIQUE ' if unique else '')
+
+    if _offline():
+        op.execute(create + 'CONCURRENTLY IF NOT EXISTS {} ON {}{}'.format(
+            name, table, definition))
+        return
+
+    with op.get_context().autocommit_block():
+        connection = op.get_bind()
+        # Building the index may take long, but never holds up writes.
+        connection.execute(text('SET statement_timeout = 0'))
+        try:
+            _create_index(connection, name, table, create, definition)
+        finally:
+            connection.execute(text('RESET statement_timeout'))
+
+
+def drop_index_concurrently(name):
+    """ Drops an index without blocking the queries on its table.
+
+    The index of a partitioned table can only be dropped with a lock on
+    the table, which is taken with locking_ddl().
+    """
+
+    if not _offline() and op.get_bind().execute(text(
+            "SELECT relkind = 'I' FROM pg_class "
+            "WHERE oid = to_regclass(:name)"), {'name': name}).scalar():
+        locking_ddl('DROP INDEX IF EXISTS {}'.format(name))
+        return
+
+    with op.get_context().autocommit_block():
+        op.execute('DROP INDEX CONCURRENTLY IF EXISTS {}'.format(name))
+
+
+def add_constraint_not_valid(table, name, definition, **kwargs):
+    """ Adds a CHECK or FOREIGN KEY constraint that only new and updated
+    rows are checked against, which needs no scan of the table. Follow it
+    with validate_constraint().
+
+    Args:
+        table: The table name.
+        name: The constraint name.
+        definition: The SQL of the constraint, e.g.
+            'CHECK (latitude IS NOT NULL)'.
+        kwargs: Passed on to locking_ddl().
+    """
+
+    locking_ddl('ALTER TABLE {} ADD CONSTRAINT {} {} NOT VALID'.format(
+        table, name, definition), **kwargs)
+
+
+def validate_constraint(table, name):
+    """ Checks the existing rows against a NOT VALID constraint. It only
+    takes a SHARE UPDATE EXCLUSIVE lock, reads and writes go on. """
+
+    locking_ddl('ALTER TABLE {} VALIDATE CONSTRAINT {}'.format(table, name),
+                statement_timeout=0)
+
+
+def batched_update(table, statement, batch_size=BATCH_SIZE):
+    """ Runs an UPDATE over every row of a table in batches of ids, each in
+    a transaction of its own, so row locks are only held for one batch.
+
+    Args:
+        table: The table name.
+        statement: The UPDATE, bounded by :low and :high on id like a
+            backfill's (see backfills.register_backfill()).
+        batch_size: The range of ids per batch.
+    """
+
+    if _offline():
+        op.execute(text(statement).bindparams(low=-2 ** 31, high=2 ** 31))
+        return
+
+    with op.get_context().autocommit_block():
+        connection = op.get_bind()
+        low, high = connection.execute(text(
+            'SELECT min(id) - 1, max(id) FROM {}'.format(table))).first()
+        while high is not None and low < high:
+            connection.execute(text(statement),
+                               {'low': low, 'high': low + batch_size})
+            low += batch_size
@@ -78,6 +78,10 @@ def run_migrations_online():
             connection=connection,
             target_metadata=target_metadata,
             process_revision_directives=process_revision_directives,
+            # A transaction per migration, not one for the whole upgrade, so
+            # the locks a migration takes are released when it is done and
+            # the helpers in migration_helpers.py can step outside of it.
+            transaction_per_migration=True,
             **current_app.extensions['migrate'].configure_args
         )
 
@@ -0,0 +1,126 @@
+"""Partition show by start_time and add show_archive.
+
+Revision ID: 5a1c9e2f7b3d
+Revises: 3467634bebf4
+Create Date: 2026-10-19 09:12:31.442107
+
+"""
+from datetime import date
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5a1c9e2f7b3d'
+down_revision = '3467634bebf4'
+branch_labels = None
+depends_on = None
+
+# Number of months, starting with the current one, to create partitions for.
+# Later months are created by `flask shows create-partitions`.
+MONTHS_AHEAD = 3
+
+
+def _add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _create_partition(month):
+    op.execute(
+        f'CREATE TABLE show_y{month.year:04d}m{month.month:02d} '
+        f'PARTITION OF show '
+        f"FOR VALUES FROM ('{month}') TO ('{_add_months(month, 1)}')"
+    )
+
+
+def upgrade():
+    connection = op.get_bind()
+
+    # Keep the id sequence alive when the old table is dropped.
+    op.execute('ALTER SEQUENCE show_id_seq OWNED BY NONE')
+    op.rename_table('show', 'show_unpartitioned')
+    op.execute('ALTER TABLE show_unpartitioned '
+               'RENAME CONSTRAINT show_pkey TO show_unpartitioned_pkey')
+
+    # The partition key has to be part of the primary key.
+    op.execute(
+        "CREATE TABLE show ("
+        "id INTEGER NOT NULL DEFAULT nextval('show_id_seq'), "
+        "artist_id INTEGER NOT NULL, "
+        "venue_id INTEGER NOT NULL, "
+        "start_time TIMESTAMP WITHOUT TIME ZONE NOT NULL, "
+        "CONSTRAINT show_pkey PRIMARY KEY (id, start_time), "
+        "CONSTRAINT show_artist_id_fkey FOREIGN KEY (artist_id) "
+        "REFERENCES artist (id), "
+        "CONSTRAINT show_venue_id_fkey FOREIGN KEY (venue_id) "
+        "REFERENCES venue (id)"
+        ") PARTITION BY RANGE (start_time)"
+    )
+    op.execute('ALTER SEQUENCE show_id_seq OWNED BY show.id')
+    op.execute('CREATE TABLE show_default PARTITION OF show DEFAULT')
+
+    # One partition for every past month that has shows, then a contiguous
+    # run from the current month onwards.
+    current = date.today().replace(day=1)
+    months = {row[0].date() for row in connection.execute(sa.text(
+        "SELECT DISTINCT date_trunc('month', start_time) "
+        "FROM show_unpartitioned WHERE start_time < :current"),
+        {'current': current})}
+    months.update(_add_months(current, i) for i in range(MONTHS_AHEAD))
+    for month in sorted(months):
+        _create_partition(month)
+
+    op.create_index('ix_show_venue_id_start_time', 'show',
+                    ['venue_id', 'start_time'])
+    op.create_index('ix_show_artist_id_start_time', 'show',
+                    ['artist_id', 'start_time'])
+
+    op.execute('INSERT INTO show (id, artist_id, venue_id, start_time) '
+               'SELECT id, artist_id, venue_id, start_time '
+               'FROM show_unpartitioned')
+    op.drop_table('show_unpartitioned')
+
+    op.create_table('show_archive',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('start_time', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['artist_id'], ['artist.id'], ),
+    sa.ForeignKeyConstraint(['venue_id'], ['venue.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_show_archive_venue_id', 'show_archive', ['venue_id'])
+    op.create_index('ix_show_archive_artist_id', 'show_archive',
+                    ['artist_id'])
+
+
+def downgrade():
+    op.execute('ALTER SEQUENCE show_id_seq OWNED BY NONE')
+    op.rename_table('show', 'show_partitioned')
+    op.execute('ALTER TABLE show_partitioned '
+               'RENAME CONSTRAINT show_pkey TO show_partitioned_pkey')
+
+    op.create_table('show',
+    sa.Column('id', sa.Integer(), nullable=False,
+              server_default=sa.text("nextval('show_id_seq')")),
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('start_time', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['artist_id'], ['artist.id'], ),
+    sa.ForeignKeyConstraint(['venue_id'], ['venue.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.execute('ALTER SEQUENCE show_id_seq OWNED BY show.id')
+
+    op.execute('INSERT INTO show (id, artist_id, venue_id, start_time) '
+               'SELECT id, artist_id, venue_id, start_time '
+               'FROM show_partitioned '
+               'UNION ALL '
+               'SELECT id, artist_id, venue_id, start_time '
+               'FROM show_archive')
+
+    op.drop_table('show_archive')
+    # Dropping the parent drops every partition with it.
+    op.drop_table('show_partitioned')
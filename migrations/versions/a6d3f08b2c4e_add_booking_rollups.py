@@ -0,0 +1,48 @@
+"""Add booking rollups.
+
+Revision ID: a6d3f08b2c4e
+Revises: f4a8c2d61e07
+Create Date: 2026-10-19 18:40:12.604219
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a6d3f08b2c4e'
+down_revision = 'f4a8c2d61e07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # No foreign keys: the counts of deleted venues and artists are taken
+    # out by analytics.py before the DELETE. Fill the tables with
+    # `flask analytics backfill` once the app maintaining them is deployed.
+    op.create_table('venue_month_rollup',
+    sa.Column('month', sa.Date(), nullable=False),
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('shows', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('month', 'venue_id')
+    )
+    op.create_table('artist_month_rollup',
+    sa.Column('month', sa.Date(), nullable=False),
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.Column('shows', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('month', 'artist_id')
+    )
+    op.create_table('city_genre_month_rollup',
+    sa.Column('month', sa.Date(), nullable=False),
+    sa.Column('city', sa.String(length=120), nullable=False),
+    sa.Column('state', sa.String(length=120), nullable=False),
+    sa.Column('genre', sa.String(), nullable=False),
+    sa.Column('shows', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('month', 'city', 'state', 'genre')
+    )
+
+
+def downgrade():
+    op.drop_table('city_genre_month_rollup')
+    op.drop_table('artist_month_rollup')
+    op.drop_table('venue_month_rollup')
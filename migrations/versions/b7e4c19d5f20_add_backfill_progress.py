@@ -0,0 +1,33 @@
+"""Add backfill_progress.
+
+Revision ID: b7e4c19d5f20
+Revises: a6d3f08b2c4e
+Create Date: 2026-10-19 19:55:48.120937
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e4c19d5f20'
+down_revision = 'a6d3f08b2c4e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('backfill_progress',
+    sa.Column('name', sa.String(length=120), nullable=False),
+    sa.Column('last_key', sa.BigInteger(), nullable=True),
+    sa.Column('rows', sa.BigInteger(), nullable=False),
+    sa.Column('batches', sa.Integer(), nullable=False),
+    sa.Column('started_date', sa.DateTime(), nullable=False),
+    sa.Column('updated_date', sa.DateTime(), nullable=True),
+    sa.Column('finished_date', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('backfill_progress')
@@ -0,0 +1,27 @@
+"""Index venues by state and lower-cased city for the city calendars.
+
+Revision ID: c3f1a7e92d64
+Revises: b7e4c19d5f20
+Create Date: 2026-10-19 21:12:05.664810
+
+"""
+from migration_helpers import create_index_concurrently, \
+    drop_index_concurrently
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3f1a7e92d64'
+down_revision = 'b7e4c19d5f20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Matches calendars.city_condition(), the shows of each venue found are
+    # then read from ix_show_venue_id_start_time.
+    create_index_concurrently('ix_venue_state_lower_city', 'venue',
+                              'state, lower(city)')
+
+
+def downgrade():
+    drop_index_concurrently('ix_venue_state_lower_city')
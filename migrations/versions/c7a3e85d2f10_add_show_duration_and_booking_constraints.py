@@ -0,0 +1,58 @@
+"""Add show duration and double-booking exclusion constraints.
+
+Revision ID: c7a3e85d2f10
+Revises: b41f7d0c9e25
+Create Date: 2026-10-19 12:41:19.604713
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7a3e85d2f10'
+down_revision = 'b41f7d0c9e25'
+branch_labels = None
+depends_on = None
+
+# Postgres can't put an exclusion constraint on a partitioned table, so each
+# partition gets its own. Keep in sync with partitions.BOOKING_CONSTRAINT.
+BOOKING_CONSTRAINT = (
+    'ALTER TABLE {partition} ADD CONSTRAINT {partition}_{column}_excl '
+    'EXCLUDE USING gist ({column}_id WITH =, '
+    "tsrange(start_time, start_time + duration_minutes * interval '1 minute')"
+    ' WITH &&)'
+)
+
+
+def _partitions():
+    rows = op.get_bind().execute(sa.text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE pg_inherits.inhparent = 'show'::regclass"))
+    return [row[0] for row in rows]
+
+
+def upgrade():
+    # Needed for the integer equality part of the GiST constraints.
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+
+    # show_archive mirrors show column for column, partitions are moved into
+    # it with INSERT ... SELECT *.
+    for table in ('show', 'show_archive'):
+        op.add_column(table, sa.Column('duration_minutes', sa.Integer(),
+                                       nullable=False, server_default='120'))
+
+    for partition in _partitions():
+        for column in ('venue', 'artist'):
+            op.execute(BOOKING_CONSTRAINT.format(partition=partition,
+                                                 column=column))
+
+
+def downgrade():
+    for partition in _partitions():
+        for column in ('venue', 'artist'):
+            op.drop_constraint(f'{partition}_{column}_excl', partition)
+
+    for table in ('show_archive', 'show'):
+        op.drop_column(table, 'duration_minutes')
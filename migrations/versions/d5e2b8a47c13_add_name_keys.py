@@ -0,0 +1,74 @@
+"""Add trigram indexed name keys to find duplicate venues and artists.
+
+Revision ID: d5e2b8a47c13
+Revises: c3f1a7e92d64
+Create Date: 2026-10-19 22:40:17.302518
+
+"""
+from alembic import op
+
+from migration_helpers import locking_ddl, create_index_concurrently, \
+    drop_index_concurrently, batched_update
+
+
+# revision identifiers, used by Alembic.
+revision = 'd5e2b8a47c13'
+down_revision = 'c3f1a7e92d64'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+
+    # Lower case, punctuation to spaces, and "the", "a", "an" and "and"
+    # dropped, so word order and articles don't hide a duplicate.
+    op.execute(r"""
+        CREATE OR REPLACE FUNCTION normalized_name(name text) RETURNS text
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+            SELECT btrim(regexp_replace(regexp_replace(regexp_replace(
+                lower(name), '[^[:alnum:]]+', ' ', 'g'),
+                '\m(the|a|an|and)\M', ' ', 'g'), '\s+', ' ', 'g'))
+        $$""")
+
+    # Keeps name_key in line with name on every write, from the app before
+    # and after this deploy or from anywhere else.
+    op.execute("""
+        CREATE OR REPLACE FUNCTION set_name_key() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            NEW.name_key := normalized_name(NEW.name);
+            RETURN NEW;
+        END
+        $$""")
+
+    # No default, so the columns are added without rewriting the tables.
+    for table in ('venue', 'artist'):
+        locking_ddl('ALTER TABLE {} ADD COLUMN IF NOT EXISTS name_key varchar'
+                    .format(table))
+        locking_ddl('CREATE TRIGGER {0}_name_key '
+                    'BEFORE INSERT OR UPDATE OF name ON {0} '
+                    'FOR EACH ROW EXECUTE FUNCTION set_name_key()'
+                    .format(table))
+
+        # The existing rows. The UPDATE doesn't fire the trigger, it leaves
+        # name alone.
+        batched_update(
+            table,
+            'UPDATE {} SET name_key = normalized_name(name) '
+            'WHERE id > :low AND id <= :high '
+            'AND name_key IS DISTINCT FROM normalized_name(name)'
+            .format(table))
+
+        create_index_concurrently('ix_{}_name_key_trgm'.format(table), table,
+                                  'name_key gin_trgm_ops', using='gin')
+
+
+def downgrade():
+    for table in ('artist', 'venue'):
+        drop_index_concurrently('ix_{}_name_key_trgm'.format(table))
+        locking_ddl('DROP TRIGGER IF EXISTS {0}_name_key ON {0}'.format(table),
+                    'ALTER TABLE {} DROP COLUMN IF EXISTS name_key'
+                    .format(table))
+    op.execute('DROP FUNCTION IF EXISTS set_name_key()')
+    op.execute('DROP FUNCTION IF EXISTS normalized_name(text)')
@@ -0,0 +1,38 @@
+"""Cascade deletes of venues and artists to their shows.
+
+Revision ID: e2c5a9173b46
+Revises: d9b6f14a3c82
+Create Date: 2026-10-19 15:02:37.095114
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2c5a9173b46'
+down_revision = 'd9b6f14a3c82'
+branch_labels = None
+depends_on = None
+
+FOREIGN_KEYS = [
+    ('show', 'artist'),
+    ('show', 'venue'),
+    ('show_archive', 'artist'),
+    ('show_archive', 'venue'),
+]
+
+
+def _recreate_foreign_keys(ondelete):
+    for table, referred in FOREIGN_KEYS:
+        name = f'{table}_{referred}_id_fkey'
+        op.drop_constraint(name, table, type_='foreignkey')
+        op.create_foreign_key(name, table, referred, [f'{referred}_id'],
+                              ['id'], ondelete=ondelete)
+
+
+def upgrade():
+    _recreate_foreign_keys('CASCADE')
+
+
+def downgrade():
+    _recreate_foreign_keys(None)
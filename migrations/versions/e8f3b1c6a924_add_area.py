@@ -0,0 +1,144 @@
+"""Add area, the normalized city and state of venues and artists.
+
+Revision ID: e8f3b1c6a924
+Revises: d5e2b8a47c13
+Create Date: 2026-10-19 23:58:41.907214
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from migration_helpers import locking_ddl, create_index_concurrently, \
+    drop_index_concurrently, add_constraint_not_valid, validate_constraint, \
+    batched_update
+
+
+# revision identifiers, used by Alembic.
+revision = 'e8f3b1c6a924'
+down_revision = 'd5e2b8a47c13'
+branch_labels = None
+depends_on = None
+
+# The codes of enums.State when the type was created.
+STATES = ('AL AK AZ AR CA CO CT DE DC FL GA HI ID IL IN IA KS KY LA ME MT NE '
+          'NV NH NJ NM NY NC ND OH OK OR MD MA MI MN MS MO PA RI SC SD TN TX '
+          'UT VT VA WA WV WI WY').split()
+
+
+def upgrade():
+    op.create_table(
+        'area',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('city', sa.String(length=120), nullable=False),
+        sa.Column('state', sa.Enum(*STATES, name='state_code'),
+                  nullable=False),
+        sa.PrimaryKeyConstraint('id'))
+    op.execute('CREATE UNIQUE INDEX ix_area_state_lower_city '
+               'ON area (state, lower(city))')
+
+    # The area of a city and state, created if it is new. Spaces are
+    # trimmed and collapsed, case is ignored. NULL for a blank city or a
+    # state that isn't a code.
+    op.execute(r"""
+        CREATE OR REPLACE FUNCTION area_id(entered_city text,
+                                           entered_state text)
+        RETURNS integer LANGUAGE plpgsql AS $$
+        DECLARE
+            area_city text := regexp_replace(btrim(entered_city), '\s+', ' ',
+                                             'g');
+            area_state text := upper(btrim(entered_state));
+            found integer;
+        BEGIN
+            IF coalesce(area_city, '') = '' OR NOT coalesce(
+                    area_state = ANY (enum_range(NULL::state_code)::text[]),
+                    false) THEN
+                RETURN NULL;
+            END IF;
+
+            SELECT id INTO found FROM area
+            WHERE area.state = area_state::state_code
+                AND lower(area.city) = lower(area_city);
+            IF found IS NULL THEN
+                INSERT INTO area (city, state)
+                VALUES (area_city, area_state::state_code)
+                ON CONFLICT (state, lower(city)) DO NOTHING
+                RETURNING id INTO found;
+            END IF;
+            IF found IS NULL THEN
+                -- Inserted by a concurrent transaction since.
+                SELECT id INTO found FROM area
+                WHERE area.state = area_state::state_code
+                    AND lower(area.city) = lower(area_city);
+            END IF;
+            RETURN found;
+        END
+        $$""")
+
+    # One area per city of the existing venues and artists, spelled as most
+    # of them spell it.
+    op.execute(r"""
+        INSERT INTO area (city, state)
+        SELECT DISTINCT ON (lower(city), state) city, state::state_code
+        FROM (
+            SELECT regexp_replace(btrim(city), '\s+', ' ', 'g') AS city,
+                upper(btrim(state)) AS state, count(*) AS entries
+            FROM (SELECT city, state FROM venue
+                  UNION ALL SELECT city, state FROM artist) AS entered
+            GROUP BY 1, 2
+        ) AS spellings
+        WHERE city <> ''
+            AND state = ANY (enum_range(NULL::state_code)::text[])
+        ORDER BY lower(city), state, entries DESC, city""")
+
+    # Keeps area_id in line with city and state on every write, from the
+    # app before and after this deploy or from anywhere else.
+    op.execute("""
+        CREATE OR REPLACE FUNCTION set_area_id() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            NEW.area_id := area_id(NEW.city, NEW.state);
+            RETURN NEW;
+        END
+        $$""")
+
+    # No default, so the columns are added without rewriting the tables.
+    for table in ('venue', 'artist'):
+        locking_ddl('ALTER TABLE {} ADD COLUMN IF NOT EXISTS area_id integer'
+                    .format(table))
+        add_constraint_not_valid(
+            table, '{}_area_id_fkey'.format(table),
+            'FOREIGN KEY (area_id) REFERENCES area (id)')
+        validate_constraint(table, '{}_area_id_fkey'.format(table))
+        locking_ddl('CREATE TRIGGER {0}_area_id '
+                    'BEFORE INSERT OR UPDATE OF city, state ON {0} '
+                    'FOR EACH ROW EXECUTE FUNCTION set_area_id()'
+                    .format(table))
+
+        # The existing rows, before the listings and city calendars start
+        # relying on area_id. The UPDATE doesn't fire the trigger, it
+        # leaves city and state alone.
+        batched_update(
+            table,
+            'UPDATE {} SET area_id = area_id(city, state) '
+            'WHERE id > :low AND id <= :high '
+            'AND area_id IS DISTINCT FROM area_id(city, state)'.format(table))
+
+        create_index_concurrently('ix_{}_area_id'.format(table), table,
+                                  'area_id')
+
+    # City calendars find their venues by area_id now.
+    drop_index_concurrently('ix_venue_state_lower_city')
+
+
+def downgrade():
+    create_index_concurrently('ix_venue_state_lower_city', 'venue',
+                              'state, lower(city)')
+    for table in ('artist', 'venue'):
+        drop_index_concurrently('ix_{}_area_id'.format(table))
+        locking_ddl('DROP TRIGGER IF EXISTS {0}_area_id ON {0}'.format(table),
+                    'ALTER TABLE {} DROP COLUMN IF EXISTS area_id'
+                    .format(table))
+    op.execute('DROP FUNCTION IF EXISTS set_area_id()')
+    op.execute('DROP FUNCTION IF EXISTS area_id(text, text)')
+    op.drop_table('area')
+    op.execute('DROP TYPE IF EXISTS state_code')
@@ -0,0 +1,79 @@
+"""Check double bookings across show partition boundaries.
+
+Revision ID: f1b7d4e60a3c
+Revises: e8f3b1c6a924
+Create Date: 2026-10-20 10:14:52.381046
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1b7d4e60a3c'
+down_revision = 'e8f3b1c6a924'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The exclusion constraints of each partition only compare the shows
+    # within it. A show that starts within MAX_SHOW_MINUTES of the start
+    # of its month, or runs into the next one, is checked here against the
+    # neighbouring months. Keep in sync with partitions.near_month_boundary.
+    #
+    # Bookings near the same boundary take the same advisory lock, so two
+    # of them can't both pass the check before either commits.
+    op.execute(r"""
+        CREATE OR REPLACE FUNCTION show_booking_check() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        DECLARE
+            max_length interval := interval '1440 minutes';
+            month_start timestamp := date_trunc('month', NEW.start_time);
+            next_month timestamp := month_start + interval '1 month';
+            end_time timestamp := NEW.start_time +
+                NEW.duration_minutes * interval '1 minute';
+            side text;
+        BEGIN
+            IF NEW.duration_minutes > 1440 THEN
+                RAISE EXCEPTION 'Shows last at most 1440 minutes.'
+                    USING ERRCODE = 'check_violation';
+            END IF;
+            IF NEW.start_time >= month_start + max_length AND
+                    end_time <= next_month THEN
+                RETURN NEW;
+            END IF;
+
+            PERFORM pg_advisory_xact_lock(
+                hashtext('show_booking'),
+                (extract(epoch FROM CASE WHEN end_time > next_month
+                    THEN next_month ELSE month_start END) / 86400)::integer);
+
+            SELECT CASE WHEN venue_id = NEW.venue_id
+                        THEN 'venue' ELSE 'artist' END INTO side
+            FROM show
+            WHERE (venue_id = NEW.venue_id OR artist_id = NEW.artist_id)
+                AND (start_time < month_start OR start_time >= next_month)
+                AND start_time >= NEW.start_time - max_length
+                AND start_time < end_time
+                AND start_time + duration_minutes * interval '1 minute' >
+                    NEW.start_time
+                AND id <> NEW.id
+            ORDER BY venue_id = NEW.venue_id DESC
+            LIMIT 1;
+
+            IF side IS NOT NULL THEN
+                RAISE EXCEPTION 'The % is already booked at that time.', side
+                    USING ERRCODE = 'exclusion_violation',
+                          CONSTRAINT = 'show_' || side || '_excl';
+            END IF;
+            RETURN NEW;
+        END
+        $$""")
+    op.execute('CREATE TRIGGER show_booking_check '
+               'BEFORE INSERT OR UPDATE ON show '
+               'FOR EACH ROW EXECUTE FUNCTION show_booking_check()')
+
+
+def downgrade():
+    op.execute('DROP TRIGGER IF EXISTS show_booking_check ON show')
+    op.execute('DROP FUNCTION IF EXISTS show_booking_check()')
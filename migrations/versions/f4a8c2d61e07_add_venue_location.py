@@ -0,0 +1,38 @@
+"""Add venue latitude/longitude with an earthdistance index.
+
+Revision ID: f4a8c2d61e07
+Revises: e2c5a9173b46
+Create Date: 2026-10-19 16:02:37.418305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f4a8c2d61e07'
+down_revision = 'e2c5a9173b46'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS cube')
+    op.execute('CREATE EXTENSION IF NOT EXISTS earthdistance')
+
+    op.add_column('venue', sa.Column('latitude', sa.Float(), nullable=True))
+    op.add_column('venue', sa.Column('longitude', sa.Float(), nullable=True))
+    op.create_check_constraint(
+        'venue_location_check', 'venue',
+        '(latitude IS NULL) = (longitude IS NULL)')
+
+    # Supports both earth_box() radius filters and <-> nearest-first ordering.
+    op.execute('CREATE INDEX ix_venue_location ON venue '
+               'USING gist (ll_to_earth(latitude, longitude))')
+
+
+def downgrade():
+    op.drop_index('ix_venue_location', table_name='venue')
+    op.drop_constraint('venue_location_check', 'venue')
+    op.drop_column('venue', 'longitude')
+    op.drop_column('venue', 'latitude')
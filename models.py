@@ -1,26 +1,68 @@
+from datetime import timedelta
+
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.sql import func
 
+from enums import State
+
 db = SQLAlchemy()
 
 
+class Area(db.Model):
+    # A city, that venues and artists refer to by id (see areas.py). Unique
+    # on the state and the lower-cased city.
+    __tablename__ = 'area'
+    id = db.Column(db.Integer, primary_key=True)
+    city = db.Column(db.String(120), nullable=False)
+    state = db.Column(db.Enum(*[state.name for state in State],
+                              name='state_code'), nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_area_state_lower_city', state, func.lower(city),
+                 unique=True),
+    )
+
+
 class Venue(db.Model):
     __tablename__ = 'venue'
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False)
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
+    # The area of city and state, set by a trigger (see areas.py).
+    area_id = db.Column(db.Integer, db.ForeignKey('area.id'), index=True,
+                        server_default=db.FetchedValue(),
+                        server_onupdate=db.FetchedValue())
     address = db.Column(db.String(120))
+    # Optional, both or neither. Indexed with earthdistance for nearby
+    # searches (see geo.py).
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
     phone = db.Column(db.String(120))
     image_link = db.Column(db.String(500))
+    # Uploaded image in the content-addressed ImageStore (see images.py)
+    image_file = db.Column(db.String(80))
     facebook_link = db.Column(db.String(120))
     website_link = db.Column(db.String(120))
     seeking_talent = db.Column(db.Boolean, default=False)
     seeking_description = db.Column(db.String(300))
     genres = db.Column(db.ARRAY(db.String()))
+    # normalized_name(name), set by a trigger and trigram indexed to find
+    # duplicates (see duplicates.py).
+    name_key = db.Column(db.String, server_default=db.FetchedValue(),
+                         server_onupdate=db.FetchedValue())
+    # Shows are deleted by ON DELETE CASCADE, not one by one by the ORM.
     shows = db.relationship('Show', backref='venue', lazy='joined',
-                            cascade="all, delete")
+                            cascade="all, delete", passive_deletes=True)
+    archived_shows = db.relationship('ArchivedShow', backref='venue',
+                                     cascade="all, delete",
+                                     passive_deletes=True)
     created_date = db.Column(db.DateTime, nullable=False, default=func.now())
+    # Bumped on every update so concurrent edits are detected (updates.py).
+    version_id = db.Column(db.Integer, nullable=False, server_default='1')
+
+    # eager_defaults returns created_date from the INSERT itself.
+    __mapper_args__ = {'version_id_col': version_id, 'eager_defaults': True}
 
 
 class Artist(db.Model):
@@ -29,22 +71,121 @@ class Artist(db.Model):
     name = db.Column(db.String, nullable=False)
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
+    # The area of city and state, set by a trigger (see areas.py).
+    area_id = db.Column(db.Integer, db.ForeignKey('area.id'), index=True,
+                        server_default=db.FetchedValue(),
+                        server_onupdate=db.FetchedValue())
     phone = db.Column(db.String(120))
     image_link = db.Column(db.String(500))
+    # Uploaded image in the content-addressed ImageStore (see images.py)
+    image_file = db.Column(db.String(80))
     facebook_link = db.Column(db.String(120))
     website_link = db.Column(db.String(120))
     seeking_venue = db.Column(db.Boolean, default=False)
     seeking_description = db.Column(db.String(300))
     genres = db.Column(db.ARRAY(db.String()))
+    # normalized_name(name), set by a trigger and trigram indexed to find
+    # duplicates (see duplicates.py).
+    name_key = db.Column(db.String, server_default=db.FetchedValue(),
+                         server_onupdate=db.FetchedValue())
+    # Shows are deleted by ON DELETE CASCADE, not one by one by the ORM.
     shows = db.relationship('Show', backref='artist', lazy='joined',
-                            cascade="all, delete")
+                            cascade="all, delete", passive_deletes=True)
+    archived_shows = db.relationship('ArchivedShow', backref='artist',
+                                     cascade="all, delete",
+                                     passive_deletes=True)
     created_date = db.Column(db.DateTime, nullable=False, default=func.now())
+    # Bumped on every update so concurrent edits are detected (updates.py).
+    version_id = db.Column(db.Integer, nullable=False, server_default='1')
+
+    # eager_defaults returns created_date from the INSERT itself.
+    __mapper_args__ = {'version_id_col': version_id, 'eager_defaults': True}
 
 
 class Show(db.Model):
+    # Range-partitioned by month on start_time (see partitions.py), which is
+    # why start_time has to be part of the primary key.
     __tablename__ = 'show'
-    id = db.Column(db.Integer, primary_key=True)
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    artist_id = db.Column(db.Integer,
+                          db.ForeignKey("artist.id", ondelete='CASCADE'),
+                          nullable=False)
+    venue_id = db.Column(db.Integer,
+                         db.ForeignKey("venue.id", ondelete='CASCADE'),
+                         nullable=False)
+    start_time = db.Column(db.DateTime, primary_key=True)
+    # Each partition has exclusion constraints that stop a venue or artist
+    # from being booked for overlapping shows.
+    duration_minutes = db.Column(db.Integer, nullable=False, default=120,
+                                 server_default='120')
+
+    @property
+    def end_time(self):
+        return self.start_time + timedelta(minutes=self.duration_minutes)
+
+
+class ArchivedShow(db.Model):
+    # Cold storage for shows moved out of old show partitions by
+    # `flask shows archive`.
+    __tablename__ = 'show_archive'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
     artist_id = db.Column(db.Integer,
-                          db.ForeignKey("artist.id"), nullable=False)
-    venue_id = db.Column(db.Integer, db.ForeignKey("venue.id"), nullable=False)
+                          db.ForeignKey("artist.id", ondelete='CASCADE'),
+                          nullable=False)
+    venue_id = db.Column(db.Integer,
+                         db.ForeignKey("venue.id", ondelete='CASCADE'),
+                         nullable=False)
     start_time = db.Column(db.DateTime, nullable=False)
+    duration_minutes = db.Column(db.Integer, nullable=False, default=120,
+                                 server_default='120')
+
+
+# Booking rollups, kept current by analytics.py as shows are booked and
+# deleted, so reports never scan the show tables.
+class VenueMonthRollup(db.Model):
+    __tablename__ = 'venue_month_rollup'
+    month = db.Column(db.Date, primary_key=True)
+    venue_id = db.Column(db.Integer, primary_key=True)
+    shows = db.Column(db.Integer, nullable=False)
+
+
+class ArtistMonthRollup(db.Model):
+    __tablename__ = 'artist_month_rollup'
+    month = db.Column(db.Date, primary_key=True)
+    artist_id = db.Column(db.Integer, primary_key=True)
+    shows = db.Column(db.Integer, nullable=False)
+
+
+class CityGenreMonthRollup(db.Model):
+    __tablename__ = 'city_genre_month_rollup'
+    month = db.Column(db.Date, primary_key=True)
+    city = db.Column(db.String(120), primary_key=True)
+    state = db.Column(db.String(120), primary_key=True)
+    genre = db.Column(db.String, primary_key=True)
+    shows = db.Column(db.Integer, nullable=False)
+
+
+class BackfillProgress(db.Model):
+    # How far each batched backfill got, see backfills.py.
+    __tablename__ = 'backfill_progress'
+    name = db.Column(db.String(120), primary_key=True)
+    last_key = db.Column(db.BigInteger)
+    rows = db.Column(db.BigInteger, nullable=False, default=0)
+    batches = db.Column(db.Integer, nullable=False, default=0)
+    started_date = db.Column(db.DateTime, nullable=False, default=func.now())
+    updated_date = db.Column(db.DateTime)
+    finished_date = db.Column(db.DateTime)
+
+
+class OutboxTask(db.Model):
+    # Background tasks queued by a write, see tasks.py.
+    __tablename__ = 'outbox_task'
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(120), nullable=False)
+    payload = db.Column(db.JSON, nullable=False, default=dict)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    available_at = db.Column(db.DateTime, nullable=False, default=func.now(),
+                             index=True)
+    last_error = db.Column(db.Text)
+    failed_date = db.Column(db.DateTime)
+    created_date = db.Column(db.DateTime, nullable=False, default=func.now())
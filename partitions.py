@@ -0,0 +1,181 @@
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy import text
+
+# Partitions are named after the month they hold, e.g. show_y2021m09.
+PARTITION_NAME = 'show_y%04dm%02d'
+DEFAULT_PARTITION = 'show_default'
+
+# SQLSTATE of an exclusion constraint violation.
+EXCLUSION_VIOLATION = '23P01'
+
+# The longest show, enforced by the show_booking_check trigger.
+MAX_SHOW_MINUTES = 24 * 60
+
+# Exclusion constraints can't be declared on a partitioned table, so every
+# partition gets its own pair: a venue or artist can't have two shows whose
+# time ranges overlap within the partition. Shows near a month boundary
+# (near_month_boundary) are checked against the neighbouring partitions by
+# the show_booking_check trigger, which raises the same error.
+BOOKING_CONSTRAINT = (
+    'ALTER TABLE {partition} ADD CONSTRAINT {partition}_{column}_excl '
+    'EXCLUDE USING gist ({column}_id WITH =, '
+    "tsrange(start_time, start_time + duration_minutes * interval '1 minute')"
+    ' WITH &&)'
+)
+
+
+def month_start(value):
+    """ Returns the first day of the month that value falls in. """
+    return date(value.year, value.month, 1)
+
+
+def add_months(month, count):
+    """ Moves a first-of-month date forwards (or backwards) by count months.
+    """
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return PARTITION_NAME % (month.year, month.month)
+
+
+def near_month_boundary(start_time, duration_minutes):
+    """ Tells whether a show may overlap shows of another partition: it
+    starts within MAX_SHOW_MINUTES of the start of its month, or runs into
+    the next month. """
+
+    month = month_start(start_time)
+    lower = datetime.combine(month, time())
+    upper = datetime.combine(add_months(month, 1), time())
+    return start_time < lower + timedelta(minutes=MAX_SHOW_MINUTES) or \
+        start_time + timedelta(minutes=duration_minutes) > upper
+
+
+def booking_conflict(error):
+    """ Tells which side of a show was double booked.
+
+    Args:
+        error: The IntegrityError raised when inserting a show.
+
+    Returns: 'venue' or 'artist', or None when the error is not a booking
+        conflict.
+    """
+
+    if getattr(error.orig, 'pgcode', None) != EXCLUSION_VIOLATION:
+        return None
+
+    constraint = error.orig.diag.constraint_name or ''
+    for side in ('venue', 'artist'):
+        if constraint.endswith('_{}_excl'.format(side)):
+            return side
+    return None
+
+
+def add_booking_constraints(connection, partition):
+    for column in ('venue', 'artist'):
+        connection.execute(text(BOOKING_CONSTRAINT.format(
+            partition=partition, column=column)))
+
+
+def existing_partitions(connection):
+    """ Returns the names of the partitions currently attached to show. """
+    rows = connection.execute(text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE pg_inherits.inhparent = 'show'::regclass"))
+    return {row[0] for row in rows}
+
+
+def create_show_partition(connection, month):
+    """ Creates the partition holding the shows of a single month.
+
+    Rows for that month may already sit in the default partition (shows
+    booked further ahead than the partitions created so far), and Postgres
+    refuses to attach a partition whose range the default partition already
+    holds rows for, so they are moved out first and re-inserted afterwards.
+
+    Args:
+        connection: A connection with an open transaction.
+        month: The first day of the month to create the partition for.
+    """
+
+    name = partition_name(month)
+    bounds = {'lower': month, 'upper': add_months(month, 1)}
+
+    connection.execute(text(
+        f'CREATE TEMPORARY TABLE {name}_pending AS '
+        f'WITH moved AS (DELETE FROM {DEFAULT_PARTITION} '
+        'WHERE start_time >= :lower AND start_time < :upper RETURNING *) '
+        'SELECT * FROM moved'), bounds)
+    connection.execute(text(
+        f'CREATE TABLE {name} PARTITION OF show '
+        f"FOR VALUES FROM ('{bounds['lower']}') TO ('{bounds['upper']}')"))
+    add_booking_constraints(connection, name)
+    connection.execute(text(f'INSERT INTO show SELECT * FROM {name}_pending'))
+    connection.execute(text(f'DROP TABLE {name}_pending'))
+
+
+def create_show_partitions(connection, start, months):
+    """ Makes sure the partitions for the coming months exist.
+
+    Args:
+        connection: A connection with an open transaction.
+        start: Any date within the first month to cover.
+        months: The number of months (including the first one) to cover.
+
+    Returns: The names of the partitions that were created.
+    """
+
+    existing = existing_partitions(connection)
+    created = []
+
+    month = month_start(start)
+    for _ in range(months):
+        if partition_name(month) not in existing:
+            create_show_partition(connection, month)
+            created.append(partition_name(month))
+        month = add_months(month, 1)
+
+    return created
+
+
+def archive_show_partitions(connection, before):
+    """ Moves every show older than the given month into show_archive.
+
+    Whole monthly partitions are detached, copied into the archive table and
+    dropped, so the hot table and its indexes only keep recent history.
+    Old rows that ended up in the default partition are moved as well.
+
+    Args:
+        connection: A connection with an open transaction.
+        before: Shows from months before the month of this date are archived.
+
+    Returns: A list of (partition name, archived row count) tuples.
+    """
+
+    cutoff = month_start(before)
+    archived = []
+
+    for name in sorted(existing_partitions(connection)):
+        if name == DEFAULT_PARTITION:
+            continue
+        if name >= partition_name(cutoff):
+            continue
+
+        connection.execute(text(f'ALTER TABLE show DETACH PARTITION {name}'))
+        result = connection.execute(text(
+            f'INSERT INTO show_archive SELECT * FROM {name}'))
+        connection.execute(text(f'DROP TABLE {name}'))
+        archived.append((name, result.rowcount))
+
+    result = connection.execute(text(
+        'WITH moved AS ('
+        f'DELETE FROM {DEFAULT_PARTITION} WHERE start_time < :cutoff '
+        'RETURNING *) INSERT INTO show_archive SELECT * FROM moved'),
+        {'cutoff': cutoff})
+    if result.rowcount:
+        archived.append((DEFAULT_PARTITION, result.rowcount))
+
+    return archived
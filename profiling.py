@@ -0,0 +1,168 @@
+import cProfile
+import hmac
+import io
+import json
+import os
+import pstats
+import random
+import re
+import time
+from datetime import datetime
+
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Functions listed in the text report, by cumulative time.
+REPORT_FUNCTIONS = 40
+
+
+class Profiler:
+    """ Profiles single requests on demand, or a random sample of them.
+
+    A request is profiled when it carries the PROFILE_TOKEN, either in the
+    X-Profile-Token header or the `profile` query arg, or when it is picked
+    at random with probability PROFILE_SAMPLE_RATE. The view, including the
+    template rendering, runs under cProfile and every SQL statement it
+    sends is timed. Both are written to PROFILE_FOLDER:
+
+        <time>-<method>-<path>.prof  pstats data, e.g. for snakeviz
+        <time>-<method>-<path>.json  request, SQL timings and top functions
+
+    Requests that are not profiled only pay for a random() call and an
+    attribute lookup per SQL statement.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.token = app.config.get('PROFILE_TOKEN')
+        self.sample_rate = app.config.get('PROFILE_SAMPLE_RATE', 0)
+        self.folder = app.config.get('PROFILE_FOLDER') or os.path.join(
+            app.instance_path, 'profiles')
+        self.logger = app.logger
+
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        app.teardown_request(self._teardown)
+
+        if not event.contains(Engine, 'before_cursor_execute',
+                              _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute',
+                         _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute',
+                         _after_cursor_execute)
+
+    def _requested(self):
+        if not self.token:
+            return False
+        token = request.headers.get('X-Profile-Token') or \
+            request.args.get('profile')
+        # As bytes, compare_digest refuses non-ASCII strings.
+        return token is not None and \
+            hmac.compare_digest(token.encode(), self.token.encode())
+
+    def _start(self):
+        requested = self._requested()
+        if not requested and not (self.sample_rate and
+                                  random.random() < self.sample_rate):
+            return
+
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another request of this process is already being profiled.
+            return
+        g.profile = {
+            'profile': profile,
+            'requested': requested,
+            'started': time.perf_counter(),
+            'queries': [],
+        }
+
+    def _finish(self, response):
+        state = g.pop('profile', None)
+        if state is None:
+            return response
+
+        state['profile'].disable()
+        elapsed = time.perf_counter() - state['started']
+        try:
+            name = self._write(state, elapsed, response)
+        except OSError:
+            self.logger.exception('Writing the profile failed')
+            return response
+
+        self.logger.info('Profiled %s %s in %.1f ms: %s', request.method,
+                         request.path, elapsed * 1000, name)
+        if state['requested']:
+            response.headers['X-Profile'] = name
+        return response
+
+    def _teardown(self, error):
+        # The view raised, after_request didn't run.
+        state = g.pop('profile', None)
+        if state is not None:
+            state['profile'].disable()
+
+    def _write(self, state, elapsed, response):
+        os.makedirs(self.folder, exist_ok=True)
+        slug = re.sub(r'[^A-Za-z0-9]+', '_', request.path).strip('_')
+        name = '{}-{}-{}'.format(
+            datetime.now().strftime('%Y%m%d-%H%M%S-%f'), request.method,
+            slug or 'index')
+        path = os.path.join(self.folder, name)
+
+        stats = pstats.Stats(state['profile'])
+        stats.dump_stats(path + '.prof')
+
+        functions = io.StringIO()
+        stats.stream = functions
+        stats.sort_stats('cumulative').print_stats(REPORT_FUNCTIONS)
+
+        queries = state['queries']
+        # Leave the token out of the report.
+        args = [(key, value) for key, value in request.args.items(multi=True)
+                if key != 'profile']
+        report = {
+            'method': request.method,
+            'path': request.path,
+            'args': args,
+            'endpoint': request.endpoint,
+            'status': response.status_code,
+            'sampled': not state['requested'],
+            'total_ms': round(elapsed * 1000, 3),
+            'sql_ms': round(sum(q['ms'] for q in queries), 3),
+            'sql_count': len(queries),
+            'queries': queries,
+            'functions': functions.getvalue().splitlines(),
+        }
+        with open(path + '.json', 'w') as f:
+            json.dump(report, f, indent=2)
+        return name
+
+
+def _profiled():
+    return has_request_context() and 'profile' in g
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    if _profiled():
+        conn.info.setdefault('profile_started', []).append(
+            time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    if not _profiled() or not conn.info.get('profile_started'):
+        return
+    started = conn.info['profile_started'].pop()
+    g.profile['queries'].append({
+        'statement': statement,
+        'ms': round((time.perf_counter() - started) * 1000, 3),
+        'rows': cursor.rowcount,
+    })
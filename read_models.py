@@ -0,0 +1,244 @@
+""" Read models for the listing, search and detail pages.
+
+The rows are selected as plain column projections with Core select() and
+turned straight into named tuples, so no ORM instances, identity map
+entries or instance state are built for pages that only display data.
+Upcoming show counts are computed by the database in the same query.
+The venue and artist of a detail page come from the entity cache.
+"""
+
+from datetime import datetime
+from itertools import groupby
+from typing import List, NamedTuple, Optional
+
+from sqlalchemy import select, func, union_all, literal
+
+from enums import Genre
+from extensions import entity_cache
+from models import db, Venue, Artist, Show, ArchivedShow, \
+    Area as AreaModel
+
+
+class VenueSummary(NamedTuple):
+    id: int
+    name: str
+    num_upcoming_shows: int
+
+
+class ArtistSummary(NamedTuple):
+    id: int
+    name: str
+    num_upcoming_shows: int
+
+
+class ArtistListing(NamedTuple):
+    id: int
+    name: str
+
+
+class Area(NamedTuple):
+    city: Optional[str]
+    state: Optional[str]
+    venues: List[VenueSummary]
+
+
+class ShowListing(NamedTuple):
+    venue_id: int
+    venue_name: str
+    artist_id: int
+    artist_name: str
+    artist_image_link: Optional[str]
+    artist_image_file: Optional[str]
+    start_time: datetime
+
+
+class VenueShow(NamedTuple):
+    artist_id: int
+    artist_name: str
+    artist_image_link: Optional[str]
+    artist_image_file: Optional[str]
+    start_time: datetime
+
+
+class ArtistShow(NamedTuple):
+    venue_id: int
+    venue_name: str
+    venue_image_link: Optional[str]
+    venue_image_file: Optional[str]
+    start_time: datetime
+
+
+class VenueDetail(NamedTuple):
+    id: int
+    name: str
+    genres: List[str]
+    address: Optional[str]
+    city: Optional[str]
+    state: Optional[str]
+    phone: Optional[str]
+    website_link: Optional[str]
+    facebook_link: Optional[str]
+    seeking_talent: bool
+    seeking_description: Optional[str]
+    image_link: Optional[str]
+    image_file: Optional[str]
+    past_shows: List[VenueShow]
+    upcoming_shows: List[VenueShow]
+    past_shows_count: int
+    upcoming_shows_count: int
+
+
+class ArtistDetail(NamedTuple):
+    id: int
+    name: str
+    genres: List[str]
+    city: Optional[str]
+    state: Optional[str]
+    phone: Optional[str]
+    website_link: Optional[str]
+    facebook_link: Optional[str]
+    seeking_venue: bool
+    seeking_description: Optional[str]
+    image_link: Optional[str]
+    image_file: Optional[str]
+    past_shows: List[ArtistShow]
+    upcoming_shows: List[ArtistShow]
+    past_shows_count: int
+    upcoming_shows_count: int
+
+
+def _upcoming_shows(column, now):
+    # Correlated count, answered from the (venue_id, start_time) and
+    # (artist_id, start_time) indexes of the show partitions.
+    return select(func.count()).where(column, Show.start_time > now) \
+        .scalar_subquery()
+
+
+def _genre_names(genres):
+    return [Genre[genre].value for genre in genres or []]
+
+
+def venue_areas(now=None):
+    """ Returns every venue with its number of upcoming shows, as a list of
+    Areas grouped by area_id and sorted by city and state. Venues without
+    an area (no city, or an unknown state) come last, in one Area whose
+    city and state are None.
+    """
+
+    now = now or datetime.now()
+    rows = db.session.execute(
+        select(Venue.area_id, AreaModel.city, AreaModel.state, Venue.id,
+               Venue.name, _upcoming_shows(Show.venue_id == Venue.id, now))
+        .outerjoin(AreaModel, AreaModel.id == Venue.area_id)
+        .order_by(Venue.area_id, Venue.id))
+    areas = []
+    for _, group in groupby(rows, lambda row: row.area_id):
+        group = list(group)
+        areas.append(Area(group[0].city, group[0].state,
+                          [VenueSummary(*row[3:]) for row in group]))
+    # The few areas are sorted once grouped, not every venue by name.
+    areas.sort(key=lambda area: (area.city is None, area.city or '',
+                                 area.state or ''))
+    return areas
+
+
+def artist_list():
+    """ Returns every artist, by id. """
+
+    return [ArtistListing(*row) for row in db.session.execute(
+        select(Artist.id, Artist.name).order_by(Artist.id))]
+
+
+def search_venues(term, now=None):
+    """ Returns the venues whose name contains term, ignoring case. """
+
+    now = now or datetime.now()
+    return [VenueSummary(*row) for row in db.session.execute(
+        select(Venue.id, Venue.name,
+               _upcoming_shows(Show.venue_id == Venue.id, now))
+        .where(Venue.name.ilike(f'%{term}%'))
+        .order_by(Venue.id))]
+
+
+def search_artists(term, now=None):
+    """ Returns the artists whose name contains term, ignoring case. """
+
+    now = now or datetime.now()
+    return [ArtistSummary(*row) for row in db.session.execute(
+        select(Artist.id, Artist.name,
+               _upcoming_shows(Show.artist_id == Artist.id, now))
+        .where(Artist.name.ilike(f'%{term}%'))
+        .order_by(Artist.id))]
+
+
+def show_listing():
+    """ Returns every show with its venue and artist, by start time. """
+
+    return [ShowListing(*row) for row in db.session.execute(
+        select(Show.venue_id, Venue.name, Show.artist_id, Artist.name,
+               Artist.image_link, Artist.image_file, Show.start_time)
+        .join(Venue, Venue.id == Show.venue_id)
+        .join(Artist, Artist.id == Show.artist_id)
+        .order_by(Show.start_time))]
+
+
+def _shows_of(column, other, now):
+    # Live and archived shows of a venue or artist, with the other side.
+    # Archived shows are always in the past.
+    shows = union_all(
+        select(Show.venue_id, Show.artist_id, Show.start_time)
+        .where(column(Show)),
+        select(ArchivedShow.venue_id, ArchivedShow.artist_id,
+               ArchivedShow.start_time)
+        .where(column(ArchivedShow))).subquery()
+    other_id = shows.c.artist_id if other is Artist else shows.c.venue_id
+    rows = db.session.execute(
+        select(other.id, other.name, other.image_link, other.image_file,
+               shows.c.start_time, shows.c.start_time > literal(now))
+        .join(other, other.id == other_id)
+        .order_by(shows.c.start_time))
+
+    past, upcoming = [], []
+    for row in rows:
+        (upcoming if row[-1] else past).append(row[:-1])
+    return past, upcoming
+
+
+def venue_detail(venue_id, now=None):
+    """ Returns a venue with its past and upcoming shows, or None. """
+
+    now = now or datetime.now()
+    venue = entity_cache.get(Venue, venue_id)
+    if venue is None:
+        return None
+
+    past, upcoming = _shows_of(lambda table: table.venue_id == venue_id,
+                               Artist, now)
+    past = [VenueShow(*show) for show in past]
+    upcoming = [VenueShow(*show) for show in upcoming]
+    return VenueDetail(venue.id, venue.name, _genre_names(venue.genres),
+                       venue.address, venue.city, venue.state, venue.phone,
+                       venue.website_link, venue.facebook_link,
+                       venue.seeking_talent, venue.seeking_description,
+                       venue.image_link, venue.image_file,
+                       past, upcoming, len(past), len(upcoming))
+
+
+def artist_detail(artist_id, now=None):
+    """ Returns an artist with its past and upcoming shows, or None. """
+
+    now = now or datetime.now()
+    artist = entity_cache.get(Artist, artist_id)
+    if artist is None:
+        return None
+
+    past, upcoming = _shows_of(lambda table: table.artist_id == artist_id,
+                               Venue, now)
+    past = [ArtistShow(*show) for show in past]
+    upcoming = [ArtistShow(*show) for show in upcoming]
+    return ArtistDetail(artist.id, artist.name, _genre_names(artist.genres),
+                        artist.city, artist.state, artist.phone,
+                        artist.website_link, artist.facebook_link,
+                        artist.seeking_venue, artist.seeking_description,
+                        artist.image_link, artist.image_file,
+                        past, upcoming, len(past), len(upcoming))
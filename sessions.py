@@ -0,0 +1,131 @@
+import os
+import random
+import secrets
+
+from flask.sessions import SessionInterface, SessionMixin
+from flask.json.tag import TaggedJSONSerializer
+from itsdangerous import Signer, BadSignature
+from werkzeug.datastructures import CallbackDict
+
+# Chance that saving a session also deletes the expired ones, which a
+# SQLiteStore otherwise keeps.
+PURGE_CHANCE = 0.01
+
+
+def signing_keys(app):
+    """ Returns the keys signatures are checked with, oldest first. New
+    signatures are made with the last one, SECRET_KEY. """
+
+    return list(app.config.get('SECRET_KEY_FALLBACKS') or []) + \
+        [app.secret_key]
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    """ Session data loaded from the session store. """
+
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(self):
+            self.modified = True
+
+        CallbackDict.__init__(self, initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+
+
+class ServerSideSessionInterface(SessionInterface):
+    """ Keeps the session (flashed messages, the CSRF token) in a store
+    shared by the app servers, so a user's next request can land on any
+    of them.
+
+    The cookie only holds a random session id, signed like Flask signs its
+    cookie sessions. Ids that aren't in the store are never reused, a new
+    session gets a new id. A session is only written when it changed, and
+    deleted with its cookie once it is emptied.
+    """
+
+    serializer = TaggedJSONSerializer()
+    salt = 'session-id'
+
+    def __init__(self, store):
+        self.store = store
+
+    def _key(self, sid):
+        return 'session:' + sid
+
+    def _signer(self, app):
+        return Signer(signing_keys(app), salt=self.salt,
+                      key_derivation='hmac', digest_method='sha1')
+
+    def open_session(self, app, request):
+        if not app.secret_key:
+            return None
+
+        signed = request.cookies.get(self.get_cookie_name(app))
+        if signed:
+            try:
+                sid = self._signer(app).unsign(signed).decode()
+            except BadSignature:
+                sid = None
+            value = sid and self.store.get(self._key(sid))
+            if value is not None:
+                return ServerSideSession(self.serializer.loads(value),
+                                         sid=sid)
+        return ServerSideSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if not session:
+            if session.modified and not session.new:
+                self.store.delete(self._key(session.sid))
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        if session.accessed:
+            response.vary.add('Cookie')
+        if not self.should_set_cookie(app, session):
+            return
+
+        self.store.set(self._key(session.sid),
+                       self.serializer.dumps(dict(session)),
+                       ttl=app.permanent_session_lifetime.total_seconds())
+        if random.random() < PURGE_CHANCE:
+            self.store.purge_expired()
+
+        response.set_cookie(
+            name, self._signer(app).sign(session.sid).decode(),
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+
+def init_app(app, store):
+    """ Sets up the signing keys and the server-side sessions.
+
+    Every app server has to sign with the same SECRET_KEY, or the CSRF
+    tokens and session cookies one issues are rejected by the others. To
+    rotate it, move the old key to SECRET_KEY_FALLBACKS: signatures made
+    with it stay valid while new ones use the new key.
+
+    Args:
+        app: The application.
+        store: Where the sessions are kept (see stores.py).
+    """
+
+    if not app.secret_key:
+        if not app.debug:
+            raise RuntimeError('SECRET_KEY must be set, and be the same on '
+                               'every app server')
+        app.logger.warning('SECRET_KEY is not set, using a random key')
+        app.secret_key = os.urandom(32)
+
+    # Flask-WTF accepts a list of keys like any itsdangerous serializer.
+    app.config['WTF_CSRF_SECRET_KEY'] = signing_keys(app)
+    app.session_interface = ServerSideSessionInterface(store)
@@ -0,0 +1,250 @@
+import json
+import os
+import queue
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from flask import request, has_request_context
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import NullPool
+
+from models import db
+
+# Slow statements waiting to be explained and written. When the writer
+# can't keep up, further ones are dropped rather than slowing requests.
+QUEUE_SIZE = 100
+
+# Upper bound for an EXPLAIN ANALYZE, which runs the statement again.
+ANALYZE_TIMEOUT_MS = 10000
+
+
+def statement_shape(statement):
+    """ Reduces a statement to its shape, so executions that only differ in
+    their parameters, literals or IN list lengths are grouped together. """
+
+    shape = re.sub(r'\(\s*%\(\w+\)s(\s*,\s*%\(\w+\)s)*\s*\)', '(?)',
+                   statement)
+    shape = re.sub(r'%\(\w+\)s|%s', '?', shape)
+    shape = re.sub(r"'(?:[^']|'')*'", '?', shape)
+    shape = re.sub(r'\b\d+(\.\d+)?\b', '?', shape)
+    return re.sub(r'\s+', ' ', shape).strip()
+
+
+def _route():
+    if not has_request_context():
+        return None
+    rule = request.url_rule.rule if request.url_rule else request.path
+    return request.method + ' ' + rule
+
+
+class SlowQueryLog:
+    """ Logs every SQL statement slower than SLOW_QUERY_THRESHOLD_MS.
+
+    Each entry holds the statement, its parameters, its duration and the
+    route that ran it, and is appended as a JSON line to SLOW_QUERY_LOG.
+    SELECTs also get their plan captured with EXPLAIN. A share of them
+    (SLOW_QUERY_ANALYZE_RATE) gets EXPLAIN ANALYZE instead, which runs the
+    statement again; that only happens against SLOW_QUERY_EXPLAIN_URI (a
+    replica) or in debug mode.
+
+    Plans are captured and entries written by a background thread, so the
+    request only pays for timing its statements. `flask slow-queries
+    report` aggregates the log by statement shape.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._queue = queue.Queue(QUEUE_SIZE)
+        self._lock = threading.Lock()
+        self._pid = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.threshold = app.config.get('SLOW_QUERY_THRESHOLD_MS', 200)
+        self.path = app.config.get('SLOW_QUERY_LOG') or os.path.join(
+            app.instance_path, 'slow_queries.jsonl')
+        self.explain_uri = app.config.get('SLOW_QUERY_EXPLAIN_URI')
+        self.analyze_rate = app.config.get('SLOW_QUERY_ANALYZE_RATE', 0)
+        if not self.explain_uri and not app.debug:
+            self.analyze_rate = 0
+        self._engine = None
+
+        if self.threshold is None:
+            return
+        if not event.contains(Engine, 'before_cursor_execute',
+                              self._before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute',
+                         self._before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute',
+                         self._after_cursor_execute)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters,
+                               context, executemany):
+        conn.info.setdefault('slowlog_started', []).append(
+            time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters,
+                              context, executemany):
+        started = conn.info.get('slowlog_started')
+        if not started:
+            return
+        elapsed = (time.perf_counter() - started.pop()) * 1000
+        if elapsed < self.threshold:
+            return
+
+        entry = {
+            'time': datetime.now().isoformat(sep=' '),
+            'ms': round(elapsed, 3),
+            'route': _route(),
+            'statement': statement,
+            'parameters': None if executemany else parameters,
+            'rows': cursor.rowcount,
+        }
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            pass
+
+    def _ensure_started(self):
+        # Threads don't survive a fork, start one per process.
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(QUEUE_SIZE)
+            self._engine = None
+            threading.Thread(target=self._work, daemon=True,
+                             name='slow-query-log').start()
+            self._pid = os.getpid()
+
+    def _work(self):
+        while True:
+            entry = self._queue.get()
+            try:
+                self._explain(entry)
+                self._write(entry)
+            except Exception:
+                self.app.logger.exception('Logging a slow query failed')
+
+    def _connect(self):
+        # A raw DBAPI connection, so the EXPLAINs don't go through the
+        # engine events and get logged themselves.
+        if self._engine is None:
+            if self.explain_uri:
+                self._engine = create_engine(self.explain_uri,
+                                             poolclass=NullPool)
+            else:
+                with self.app.app_context():
+                    self._engine = db.engine
+        return self._engine.raw_connection()
+
+    def _explain(self, entry):
+        statement = entry['statement'].lstrip()
+        if entry['parameters'] is None or \
+                not re.match(r'(SELECT|WITH)\b', statement, re.I):
+            return
+
+        analyze = random.random() < self.analyze_rate
+        connection = self._connect()
+        try:
+            cursor = connection.cursor()
+            if analyze:
+                cursor.execute('SET LOCAL statement_timeout = %s',
+                               (ANALYZE_TIMEOUT_MS,))
+            cursor.execute(
+                ('EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) ' if analyze else
+                 'EXPLAIN (FORMAT JSON) ') + statement, entry['parameters'])
+            entry['plan'] = cursor.fetchone()[0]
+            entry['analyzed'] = analyze
+        except Exception as e:
+            entry['plan_error'] = repr(e)
+        finally:
+            # Never keep anything an EXPLAIN ANALYZE did.
+            connection.rollback()
+            connection.close()
+
+    def _write(self, entry):
+        entry['shape'] = statement_shape(entry['statement'])
+        self.app.logger.warning('Slow query (%.1f ms) in %s: %s',
+                                entry['ms'], entry['route'],
+                                entry['shape'][:200])
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(entry, default=str) + '\n')
+
+
+def slow_query_report(path, since=None):
+    """ Aggregates a slow query log by statement shape.
+
+    Args:
+        path: The SLOW_QUERY_LOG file.
+        since: Only count entries logged at or after this datetime.
+
+    Returns: A list of dicts per shape, with the number of executions, the
+        total, mean, 95th percentile and max duration, the routes that ran
+        it and the plan of its slowest explained execution. Worst total
+        time first.
+    """
+
+    groups = defaultdict(list)
+    with open(path) as f:
+        for line in f:
+            entry = json.loads(line)
+            if since and entry['time'] < since.isoformat(sep=' '):
+                continue
+            groups[entry['shape']].append(entry)
+
+    report = []
+    for shape, entries in groups.items():
+        durations = sorted(entry['ms'] for entry in entries)
+        explained = [entry for entry in entries if entry.get('plan')]
+        slowest = max(explained, key=lambda entry: entry['ms'],
+                      default=None)
+        report.append({
+            'shape': shape,
+            'count': len(entries),
+            'total_ms': round(sum(durations), 3),
+            'mean_ms': round(sum(durations) / len(durations), 3),
+            'p95_ms': durations[int(0.95 * (len(durations) - 1))],
+            'max_ms': durations[-1],
+            'routes': sorted({entry['route'] or '-' for entry in entries}),
+            'plan': slowest and slowest['plan'],
+            'analyzed': bool(slowest and slowest.get('analyzed')),
+        })
+    return sorted(report, key=lambda shape: shape['total_ms'], reverse=True)
+
+
+def format_plan(plan):
+    """ Renders an EXPLAIN (FORMAT JSON) plan as an indented tree. """
+
+    lines = []
+
+    def walk(node, depth):
+        text = node['Node Type']
+        if 'Relation Name' in node:
+            text += ' on ' + node['Relation Name']
+        if 'Index Name' in node:
+            text += ' using ' + node['Index Name']
+        text += '  (cost={Total Cost} rows={Plan Rows})'.format(**node)
+        if 'Actual Total Time' in node:
+            text += ' (actual time={Actual Total Time} rows={Actual Rows} ' \
+                    'loops={Actual Loops})'.format(**node)
+        lines.append('  ' * depth + text)
+        for key in ('Filter', 'Index Cond', 'Hash Cond', 'Join Filter'):
+            if key in node:
+                lines.append('  ' * depth + '    ' + key + ': ' + node[key])
+        for child in node.get('Plans', []):
+            walk(child, depth + 1)
+
+    walk(plan[0]['Plan'], 0)
+    return lines
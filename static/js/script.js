@@ -2,3 +2,62 @@ window.parseISOString = function parseISOString(s) {
   var b = s.split(/\D+/);
   return new Date(Date.UTC(b[0], --b[1], b[2], b[3], b[4], b[5], b[6]));
 };
+
+// Typeahead for the navbar search boxes, answered by /autocomplete.
+$(function() {
+  $('form.search').each(function() {
+    var form = $(this);
+    var input = form.find('input[name=search_term]').attr('autocomplete', 'off');
+    var kind = form.attr('action').indexOf('/venues') === 0 ? 'venues' : 'artists';
+    var list = $('<ul class="dropdown-menu autocomplete"></ul>').appendTo(form);
+    var timer = null;
+    var latest = 0;
+
+    function item(href, text, detail) {
+      var link = $('<a></a>').attr('href', href).text(text);
+      if (detail) {
+        link.append($('<small></small>').text(' ' + detail));
+      }
+      return $('<li></li>').append(link);
+    }
+
+    function render(data) {
+      list.empty();
+      $.each(data[kind], function(i, match) {
+        list.append(item('/' + kind + '/' + match.id, match.name,
+                         [match.city, match.state].join(', ')));
+      });
+      if (kind === 'venues') {
+        $.each(data.cities, function(i, city) {
+          var anchor = city.state + '-' + city.city.toLowerCase().replace(/ /g, '-');
+          list.append(item('/venues#' + anchor, city.city + ', ' + city.state));
+        });
+      }
+      list.toggle(list.children().length > 0);
+    }
+
+    input.on('input', function() {
+      var q = $.trim(input.val());
+      clearTimeout(timer);
+      if (!q) {
+        list.hide();
+        return;
+      }
+      // Wait for a pause in typing, and ignore answers that arrive after a
+      // newer request was sent.
+      timer = setTimeout(function() {
+        var request = ++latest;
+        $.getJSON('/autocomplete', {q: q}, function(data) {
+          if (request === latest) {
+            render(data);
+          }
+        });
+      }, 80);
+    });
+
+    input.on('blur', function() {
+      // Let a click on a suggestion land before hiding the list.
+      setTimeout(function() { list.hide(); }, 150);
+    });
+  });
+});
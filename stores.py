@@ -0,0 +1,198 @@
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# Redis is optional, it is only needed for a redis:// store URL.
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+class SQLiteStore:
+    """ Small key/value store in a local SQLite file.
+
+    Every worker process on the host opens the same file, which makes it a
+    cheap way to share state between workers without a network round trip.
+    Values are strings, callers serialize what they store.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with self.transaction() as connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS store ('
+                'key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)')
+
+    def _connection(self):
+        # SQLite connections must not cross a fork or be shared by threads.
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5,
+                                         isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    @contextmanager
+    def transaction(self):
+        """ Runs a read-modify-write sequence under the database write lock.
+        """
+
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    def get(self, key, connection=None):
+        row = (connection or self._connection()).execute(
+            'SELECT value, expires_at FROM store WHERE key = ?',
+            (key,)).fetchone()
+        if row is None or (row[1] is not None and row[1] < time.time()):
+            return None
+        return row[0]
+
+    def set(self, key, value, ttl=None, connection=None):
+        expires_at = time.time() + ttl if ttl else None
+        (connection or self._connection()).execute(
+            'INSERT OR REPLACE INTO store (key, value, expires_at) '
+            'VALUES (?, ?, ?)', (key, value, expires_at))
+
+    def set_if(self, key, expected, value, ttl=None):
+        """ Sets key to value only if it currently holds expected (None
+        for no value). Returns whether it did. """
+
+        with self.transaction() as connection:
+            if self.get(key, connection) != expected:
+                return False
+            self.set(key, value, ttl=ttl, connection=connection)
+        return True
+
+    def modify(self, key, change, ttl=None):
+        """ Replaces the value of key with change(value), value being None
+        when there is none, atomically. change() returns None to leave the
+        value as it is.
+
+        Returns: The new value, or None if it was left.
+        """
+
+        with self.transaction() as connection:
+            value = change(self.get(key, connection))
+            if value is not None:
+                self.set(key, value, ttl=ttl, connection=connection)
+        return value
+
+    def delete(self, *keys, connection=None):
+        (connection or self._connection()).executemany(
+            'DELETE FROM store WHERE key = ?', [(key,) for key in keys])
+
+    def purge_expired(self):
+        """ Deletes the entries whose time to live has passed. """
+
+        self._connection().execute(
+            'DELETE FROM store WHERE expires_at < ?', (time.time(),))
+
+
+# Compare-and-set in one round trip, atomic on the server. ARGV: whether a
+# value is expected, the expected value, the new value, the TTL or ''.
+SET_IF_SCRIPT = '''
+local current = redis.call('GET', KEYS[1])
+if ARGV[1] == '1' then
+    if current ~= ARGV[2] then return 0 end
+elseif current then
+    return 0
+end
+if ARGV[4] ~= '' then
+    redis.call('SET', KEYS[1], ARGV[3], 'EX', ARGV[4])
+else
+    redis.call('SET', KEYS[1], ARGV[3])
+end
+return 1
+'''
+
+
+class RedisStore:
+    """ The same key/value interface over a Redis server.
+
+    Unlike SQLiteStore it is shared by every host, for state that has to
+    follow a user from one app server to the next (see sessions.py), or
+    be invalidated on all of them at once (see entity_cache.py). It has no
+    transaction(), read-modify-write sequences use set_if() or modify().
+    """
+
+    def __init__(self, url):
+        if redis is None:
+            raise RuntimeError('A redis:// store needs the redis package')
+        self.url = url
+        self.client = redis.Redis.from_url(url)
+        self._set_if = self.client.register_script(SET_IF_SCRIPT)
+
+    def get(self, key, connection=None):
+        value = self.client.get(key)
+        return None if value is None else value.decode()
+
+    def set(self, key, value, ttl=None, connection=None):
+        self.client.set(key, value, ex=int(ttl) if ttl else None)
+
+    def set_if(self, key, expected, value, ttl=None):
+        """ Sets key to value only if it currently holds expected (None
+        for no value). Returns whether it did. """
+
+        return bool(self._set_if(keys=[key], args=[
+            '0' if expected is None else '1', expected or '', value,
+            str(max(1, int(ttl))) if ttl else '']))
+
+    def modify(self, key, change, ttl=None):
+        """ Replaces the value of key with change(value), value being None
+        when there is none, atomically. change() returns None to leave the
+        value as it is. It runs again if another client writes the key in
+        between (WATCH).
+
+        Returns: The new value, or None if it was left.
+        """
+
+        def attempt(pipe):
+            current = pipe.get(key)
+            value = change(None if current is None else current.decode())
+            if value is not None:
+                pipe.multi()
+                pipe.set(key, value, ex=int(ttl) if ttl else None)
+            return value
+
+        return self.client.transaction(attempt, key, value_from_callable=True)
+
+    def delete(self, *keys, connection=None):
+        if keys:
+            self.client.delete(*keys)
+
+    def purge_expired(self):
+        # Redis expires keys itself.
+        pass
+
+
+def open_store(url):
+    """ Opens a key/value store from its URL.
+
+    Args:
+        url: sqlite:///<path> for a SQLiteStore, redis:// or rediss:// for
+            a RedisStore.
+
+    Returns: The store.
+    """
+
+    if url.startswith('sqlite:///'):
+        return SQLiteStore(os.path.abspath(url[len('sqlite:///'):]))
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisStore(url)
+    raise ValueError('Unsupported store URL: ' + url)
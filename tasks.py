@@ -0,0 +1,223 @@
+import os
+import queue
+import threading
+import time
+from collections import Counter
+
+from sqlalchemy import event, inspect, text
+
+from models import db, OutboxTask
+
+# Session.info key holding the tasks enqueued in the current transaction.
+PENDING_KEY = 'outbox_tasks'
+
+
+class TaskQueue:
+    """ In-process background queue for side effects of writes.
+
+    Tasks are written to the outbox_task table in the same transaction as
+    the write that caused them, so they are never lost and never run for a
+    write that was rolled back. Once the session commits, an after_commit
+    listener hands the new task ids to a pool of worker threads. A poller
+    thread picks up anything left behind by a crashed process and retries
+    that are due.
+
+    Workers claim a task with a lease before running it, so several
+    processes can share one outbox table without running a task twice.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.handlers = {}
+        self.stats = Counter()
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._pid = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.workers = app.config.get('TASK_WORKERS', 2)
+        self.max_attempts = app.config.get('TASK_MAX_ATTEMPTS', 5)
+        self.retry_delay = app.config.get('TASK_RETRY_DELAY', 5)
+        self.lease = app.config.get('TASK_LEASE', 300)
+        self.poll_interval = app.config.get('TASK_POLL_INTERVAL', 30)
+
+        # The session is shared by every app, only listen once.
+        if not event.contains(db.session, 'after_commit', self._after_commit):
+            event.listen(db.session, 'after_commit', self._after_commit)
+            event.listen(db.session, 'after_rollback', self._after_rollback)
+
+    def task(self, name):
+        """ Registers a function as the handler of a task name.
+
+        The handler is called with the task payload as keyword arguments,
+        inside an application context.
+        """
+
+        def decorator(func):
+            self.handlers[name] = func
+            return func
+        return decorator
+
+    def enqueue(self, name, **payload):
+        """ Adds a task to the outbox as part of the current transaction.
+
+        Args:
+            name: The name of a registered task.
+            payload: JSON-serializable keyword arguments for the handler.
+        """
+
+        if name not in self.handlers:
+            raise KeyError('Unknown task ' + name)
+
+        task = OutboxTask(name=name, payload=payload)
+        db.session.add(task)
+        db.session.info.setdefault(PENDING_KEY, []).append(task)
+        self.stats['enqueued'] += 1
+
+    def _after_commit(self, session):
+        tasks = session.info.pop(PENDING_KEY, [])
+        if not tasks:
+            return
+
+        self._ensure_started()
+        for task in tasks:
+            # The instance is expired after commit and no SQL may be emitted
+            # here, so read the id from the identity key.
+            self._queue.put(inspect(task).identity[0])
+
+    def _after_rollback(self, session):
+        session.info.pop(PENDING_KEY, None)
+
+    def _ensure_started(self):
+        """ Starts the worker threads on first use in each process.
+
+        Threads don't survive a fork, so a preloaded app starts them again
+        in every worker process.
+        """
+
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue()
+            for i in range(self.workers):
+                threading.Thread(target=self._work, daemon=True,
+                                 name='task-worker-{}'.format(i)).start()
+            threading.Thread(target=self._poll, daemon=True,
+                             name='task-poller').start()
+            self._pid = os.getpid()
+
+    def start(self):
+        """ Starts processing, including tasks left over from earlier runs.
+        """
+
+        self._ensure_started()
+
+    def _poll(self):
+        while True:
+            try:
+                with self.app.app_context():
+                    with db.engine.begin() as connection:
+                        due = connection.execute(text(
+                            'SELECT id FROM outbox_task '
+                            'WHERE failed_date IS NULL '
+                            'AND available_at <= now() '
+                            'ORDER BY available_at LIMIT 100')).scalars().all()
+                for task_id in due:
+                    self._queue.put(task_id)
+            except Exception:
+                self.app.logger.exception('Polling the outbox failed')
+            time.sleep(self.poll_interval)
+
+    def _work(self):
+        while True:
+            task_id = self._queue.get()
+            try:
+                with self.app.app_context():
+                    self.run(task_id)
+            except Exception:
+                self.app.logger.exception('Task %s crashed', task_id)
+            finally:
+                self._queue.task_done()
+
+    def _claim(self, task_id):
+        """ Leases a due task so no other worker or process runs it. """
+
+        with db.engine.begin() as connection:
+            return connection.execute(text(
+                'UPDATE outbox_task '
+                'SET attempts = attempts + 1, '
+                "available_at = now() + :lease * interval '1 second' "
+                'WHERE id = :id AND failed_date IS NULL '
+                'AND available_at <= now() '
+                'RETURNING name, payload, attempts'),
+                {'id': task_id, 'lease': self.lease}).first()
+
+    def run(self, task_id):
+        """ Runs a single task, deleting it on success and scheduling a retry
+        with exponential backoff on failure. """
+
+        claimed = self._claim(task_id)
+        if claimed is None:
+            # Already done, running elsewhere or not due yet.
+            return
+        name, payload, attempts = claimed
+
+        try:
+            self.handlers[name](**payload)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            self._fail(task_id, name, attempts, e)
+            return
+        finally:
+            db.session.remove()
+
+        with db.engine.begin() as connection:
+            connection.execute(text('DELETE FROM outbox_task WHERE id = :id'),
+                               {'id': task_id})
+        self.stats['processed'] += 1
+
+    def _fail(self, task_id, name, attempts, error):
+        self.app.logger.error('Task %s (%s) failed on attempt %s: %r',
+                              task_id, name, attempts, error)
+
+        values = {'id': task_id, 'error': repr(error)}
+        if attempts >= self.max_attempts:
+            # Give up but keep the row around for inspection.
+            sql = 'failed_date = now()'
+            self.stats['dead'] += 1
+        else:
+            sql = "available_at = now() + :delay * interval '1 second'"
+            values['delay'] = self.retry_delay * 2 ** (attempts - 1)
+            self.stats['retried'] += 1
+        self.stats['failed'] += 1
+
+        with db.engine.begin() as connection:
+            connection.execute(text(
+                'UPDATE outbox_task SET last_error = :error, ' + sql +
+                ' WHERE id = :id'), values)
+
+    def metrics(self):
+        """ Returns the queue depth and task counters of this process, plus
+        the backlog of the shared outbox table. """
+
+        outbox = db.session.execute(text(
+            'SELECT count(*) FILTER (WHERE failed_date IS NULL), '
+            'count(*) FILTER (WHERE failed_date IS NOT NULL) '
+            'FROM outbox_task')).first()
+
+        return {
+            'queue_depth': self._queue.qsize(),
+            'outbox_pending': outbox[0],
+            'outbox_dead': outbox[1],
+            'enqueued': self.stats['enqueued'],
+            'processed': self.stats['processed'],
+            'failed': self.stats['failed'],
+            'retried': self.stats['retried'],
+            'dead': self.stats['dead'],
+        }
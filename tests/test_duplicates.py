@@ -0,0 +1,58 @@
+import duplicates
+from duplicates import shingles, jaccard, duplicate_groups
+
+# "The Musical Hop" and "Musical Hop, The" both have the key
+# normalized_name() gives them in the database.
+ROWS = [
+    (1, 'The Musical Hop', 'musical hop', 'San Francisco', 'CA',
+     '123-123-1234'),
+    (2, 'Musical Hop, The', 'musical hop', 'san francisco ', 'CA',
+     '(123) 123-1234'),
+    (3, 'Park Square Live Music & Coffee', 'park square live music coffee',
+     'San Francisco', 'CA', '415-000-1234'),
+    (4, 'The Dueling Pianos Bar', 'dueling pianos bar', 'New York', 'NY',
+     '914-003-1132'),
+]
+
+
+def test_shingles_are_name_trigrams_city_and_phone():
+    assert shingles('hop', 'San Francisco ', 'CA', '+1 (123) 123-1234') == {
+        '  h', ' ho', 'hop', 'op ', 'city:san francisco:CA',
+        'phone:1231231234'}
+
+
+def test_shingles_without_city_or_phone():
+    assert shingles('hop', None, None, '') == {'  h', ' ho', 'hop', 'op '}
+    assert shingles(None, None, None, None) == {'   '}
+
+
+def test_jaccard():
+    assert jaccard({'a', 'b'}, {'b', 'c'}) == 1 / 3
+    assert jaccard(set(), set()) == 0.0
+
+
+def test_entries_sharing_a_key_are_grouped():
+    report = duplicate_groups(ROWS)
+    assert report['groups'] == [[(1, 'The Musical Hop'),
+                                 (2, 'Musical Hop, The')]]
+    assert report['entries'] == 4
+    assert report['candidate_pairs'] >= 1
+    assert report['skipped_buckets'] == 0
+
+
+def test_the_threshold_decides():
+    assert duplicate_groups(ROWS, threshold=1.01)['groups'] == []
+
+
+def test_groups_are_joined_through_shared_members():
+    rows = ROWS + [(5, 'Musical Hop', 'musical hop', 'San Francisco', 'CA',
+                    None)]
+    assert duplicate_groups(rows)['groups'] == [[
+        (1, 'The Musical Hop'), (2, 'Musical Hop, The'), (5, 'Musical Hop')]]
+
+
+def test_crowded_buckets_are_skipped(monkeypatch):
+    monkeypatch.setattr(duplicates, 'MAX_BUCKET', 1)
+    report = duplicate_groups(ROWS)
+    assert report['groups'] == []
+    assert report['skipped_buckets'] > 0
@@ -0,0 +1,47 @@
+from sqlalchemy import update, delete
+
+from entity_cache import _statement_ids
+from models import Venue, Artist
+
+
+def ids_of(statement, model=Venue):
+    return _statement_ids(statement.whereclause, model.__table__)
+
+
+def test_update_changed_statement():
+    # As updates.update_changed() builds it, with the ORM's columns.
+    statement = update(Venue.__table__) \
+        .where(Venue.id == 7) \
+        .where(Venue.version_id == 3) \
+        .values(version_id=Venue.version_id + 1, phone='123')
+    assert ids_of(statement) == {7}
+
+
+def test_delete_by_ids_statement():
+    # As updates.delete_by_ids() builds it.
+    statement = delete(Venue.__table__) \
+        .where(Venue.id.in_([1, 2, 3])) \
+        .returning(Venue.id, Venue.name)
+    assert ids_of(statement) == {1, 2, 3}
+
+
+def test_table_columns_match_too():
+    statement = update(Artist.__table__) \
+        .where(Artist.__table__.c.id == 4).values(phone='123')
+    assert ids_of(statement, Artist) == {4}
+
+
+def test_statements_not_by_id_touch_any_row():
+    assert ids_of(update(Venue.__table__).values(seeking_talent=False)) \
+        is None
+    assert ids_of(delete(Venue.__table__).where(Venue.city == 'Boston')) \
+        is None
+
+
+def test_ids_of_another_table_are_ignored():
+    statement = update(Venue.__table__) \
+        .where(Venue.id.in_(
+            Artist.__table__.select().where(Artist.id == 5)
+            .with_only_columns([Artist.id]).scalar_subquery())) \
+        .values(phone='123')
+    assert ids_of(statement) is None
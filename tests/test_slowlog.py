@@ -0,0 +1,31 @@
+from slowlog import statement_shape
+
+
+def test_parameters_become_placeholders():
+    assert statement_shape(
+        'SELECT * FROM venue WHERE id = %(id_1)s AND city = %s') == \
+        'SELECT * FROM venue WHERE id = ? AND city = ?'
+
+
+def test_in_lists_of_any_length_share_a_shape():
+    one = statement_shape('SELECT * FROM show WHERE id IN (%(id_1)s)')
+    three = statement_shape(
+        'SELECT * FROM show WHERE id IN (%(id_1)s, %(id_2)s,%(id_3)s)')
+    assert one == three == 'SELECT * FROM show WHERE id IN (?)'
+
+
+def test_literals_become_placeholders():
+    assert statement_shape(
+        "SELECT * FROM venue WHERE name = 'Bob''s Bar' AND rating > 4.5 "
+        "LIMIT 10") == \
+        'SELECT * FROM venue WHERE name = ? AND rating > ? LIMIT ?'
+
+
+def test_names_with_digits_are_kept():
+    assert statement_shape('SELECT show_2026_10.id FROM show_2026_10') == \
+        'SELECT show_2026_10.id FROM show_2026_10'
+
+
+def test_whitespace_is_collapsed():
+    assert statement_shape('SELECT id\n    FROM venue\n\tWHERE id = 1 ') == \
+        'SELECT id FROM venue WHERE id = ?'
@@ -0,0 +1,129 @@
+from collections import Counter
+
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Show
+from partitions import booking_conflict, near_month_boundary, \
+    MAX_SHOW_MINUTES
+
+
+def missing_references(artist_id, venue_ids):
+    """ Checks that the artist and every venue of a tour exist.
+
+    Uses a single query however many venues the tour visits.
+
+    Returns: A (artist exists, set of unknown venue ids) tuple.
+    """
+
+    row = db.session.execute(text(
+        'SELECT EXISTS (SELECT 1 FROM artist WHERE id = :artist_id), '
+        'ARRAY(SELECT requested.id FROM unnest(CAST(:venue_ids AS integer[])) '
+        'AS requested(id) '
+        'WHERE NOT EXISTS (SELECT 1 FROM venue WHERE venue.id = requested.id))'
+    ), {'artist_id': artist_id, 'venue_ids': list(set(venue_ids))}).first()
+
+    return row[0], set(row[1])
+
+
+def _venues_booked(entries, duration_minutes):
+    # The line numbers of the entries whose venue has an overlapping show.
+    # Only the (venue_id, start_time) index range a show could overlap from
+    # is searched.
+    if not entries:
+        return set()
+    return {row[0] for row in db.session.execute(text(
+        'SELECT entry.line FROM unnest(CAST(:lines AS integer[]), '
+        'CAST(:venue_ids AS integer[]), CAST(:start_times AS timestamp[])) '
+        'AS entry(line, venue_id, start_time) '
+        'WHERE EXISTS (SELECT 1 FROM show '
+        'WHERE show.venue_id = entry.venue_id '
+        'AND show.start_time > entry.start_time - '
+        'make_interval(mins => :longest) '
+        'AND show.start_time < entry.start_time + '
+        'make_interval(mins => :duration) '
+        'AND show.start_time + make_interval(mins => show.duration_minutes) '
+        '> entry.start_time)'), {
+            'lines': [entry[0] for entry in entries],
+            'venue_ids': [entry[1] for entry in entries],
+            'start_times': [entry[2] for entry in entries],
+            'longest': MAX_SHOW_MINUTES,
+            'duration': duration_minutes,
+        })}
+
+
+def schedule_tour(artist_id, entries, duration_minutes):
+    """ Inserts all the shows of a tour with one multi-row INSERT.
+
+    Dates that would double book the artist or a venue are skipped by the
+    booking exclusion constraints (ON CONFLICT DO NOTHING) instead of
+    failing the whole tour. Dates near a month boundary are checked by the
+    show_booking_check trigger instead, which can't be skipped that way, so
+    they are inserted one by one, each in a savepoint. The caller commits.
+
+    Args:
+        artist_id: The touring artist.
+        entries: A list of (line number, venue id, start time) tuples.
+        duration_minutes: The length of every show.
+
+    Returns: A (created show ids, conflicts) tuple, the conflicts as
+        (line number, venue id, start time, 'venue' or 'artist') tuples.
+    """
+
+    def values(entry):
+        return {
+            'artist_id': artist_id,
+            'venue_id': entry[1],
+            'start_time': entry[2],
+            'duration_minutes': duration_minutes,
+        }
+
+    within = []
+    boundary = []
+    for entry in entries:
+        if near_month_boundary(entry[2], duration_minutes):
+            boundary.append(entry)
+        else:
+            within.append(entry)
+
+    created = []
+    conflicts = []
+    if within:
+        statement = insert(Show.__table__) \
+            .values([values(entry) for entry in within]) \
+            .on_conflict_do_nothing() \
+            .returning(Show.id, Show.venue_id, Show.start_time)
+        rows = db.session.execute(statement).fetchall()
+        created.extend(row.id for row in rows)
+
+        # Entries without a matching inserted row were skipped as conflicts.
+        # ON CONFLICT doesn't tell which constraint, so the venue side is
+        # looked up, and it was the artist otherwise.
+        inserted = Counter((row.venue_id, row.start_time) for row in rows)
+        skipped = []
+        for entry in within:
+            key = (entry[1], entry[2])
+            if inserted[key]:
+                inserted[key] -= 1
+            else:
+                skipped.append(entry)
+        venues_booked = _venues_booked(skipped, duration_minutes)
+        conflicts.extend((*entry, 'venue' if entry[0] in venues_booked
+                          else 'artist') for entry in skipped)
+
+    # In time order, so the trigger's boundary locks are always taken in
+    # the same order and concurrent tours can't deadlock on them.
+    for entry in sorted(boundary, key=lambda entry: entry[2]):
+        try:
+            with db.session.begin_nested():
+                created.append(db.session.execute(
+                    insert(Show.__table__).values(values(entry))
+                    .returning(Show.id)).scalar())
+        except IntegrityError as e:
+            side = booking_conflict(e)
+            if side is None:
+                raise
+            conflicts.append((*entry, side))
+
+    return created, sorted(conflicts)
@@ -0,0 +1,93 @@
+from sqlalchemy import update, delete
+
+from models import db
+
+# Columns that are never taken from a form.
+PROTECTED_COLUMNS = {'id', 'version_id', 'created_date'}
+
+
+class ConcurrentUpdateError(Exception):
+    """ Raised when a row changed since the editor loaded it. """
+
+
+def form_values(form, model):
+    """ Returns the submitted values of the form fields that map to columns
+    of the model. """
+
+    columns = set(model.__table__.columns.keys()) - PROTECTED_COLUMNS
+    return {name: field.data for name, field in form._fields.items()
+            if name in columns}
+
+
+def same_value(current, submitted):
+    """ Compares a column value with a submitted one. """
+
+    # An empty form field and a NULL column mean the same thing.
+    if current in (None, '') and submitted in (None, ''):
+        return True
+    return current == submitted
+
+
+def update_changed(model, obj_id, version, values):
+    """ Updates only the columns whose value actually changed.
+
+    The current values are read with a column projection, so no instance is
+    built and no relationship is loaded. The UPDATE is guarded by the
+    version the editor started from, so a concurrent edit is reported
+    instead of being silently overwritten.
+
+    Args:
+        model: Venue or Artist.
+        obj_id: The id of the row to update.
+        version: The version_id the form was rendered with.
+        values: Column name -> submitted value.
+
+    Returns: The changed columns and their new values.
+
+    Raises:
+        ConcurrentUpdateError: If the row was updated since version.
+        LookupError: If the row does not exist.
+    """
+
+    row = db.session.query(model.version_id,
+                           *[getattr(model, name) for name in values]) \
+        .filter(model.id == obj_id).first()
+    if row is None:
+        raise LookupError('{} {} does not exist.'.format(model.__name__,
+                                                          obj_id))
+    if row.version_id != version:
+        raise ConcurrentUpdateError()
+
+    changes = {name: value for name, value in values.items()
+               if not same_value(getattr(row, name), value)}
+    if not changes:
+        return changes
+
+    result = db.session.execute(
+        update(model.__table__)
+        .where(model.id == obj_id)
+        .where(model.version_id == row.version_id)
+        .values(version_id=model.version_id + 1, **changes))
+    if result.rowcount != 1:
+        raise ConcurrentUpdateError()
+
+    return changes
+
+
+def delete_by_ids(model, ids):
+    """ Deletes venues or artists with a single DELETE statement.
+
+    Their shows are removed by the ON DELETE CASCADE foreign keys, so no
+    rows are loaded into the session first.
+
+    Args:
+        model: Venue or Artist.
+        ids: The ids to delete.
+
+    Returns: A list of (id, name) rows that were deleted.
+    """
+
+    return db.session.execute(
+        delete(model.__table__)
+        .where(model.id.in_(ids))
+        .returning(model.id, model.name)).fetchall()
@@ -0,0 +1,8 @@
+from views import main, venues, artists, shows, analytics, calendars
+
+
+def register_blueprints(app):
+    """ Registers the blueprints of every section of the site. """
+
+    for module in (main, venues, artists, shows, analytics, calendars):
+        app.register_blueprint(module.bp)
@@ -0,0 +1,76 @@
+import sys
+
+from flask import Blueprint, render_template, request, flash, jsonify, \
+    current_app
+
+from analytics import booking_report, MAX_ROWS
+from models import db
+
+bp = Blueprint('analytics', __name__, url_prefix='/analytics')
+
+# Longest period a report can cover, in months.
+MAX_MONTHS = 36
+
+
+def _report_args():
+    months = request.args.get('months', 12, type=int)
+    limit = request.args.get('limit', 10, type=int)
+    if not 1 <= months <= MAX_MONTHS or not 1 <= limit <= MAX_ROWS:
+        return None
+    return months, limit
+
+
+@bp.route('')
+def analytics():
+    """ Shows the booking activity of the last months.
+
+    Query args: months, the period covered (default 12, at most 36), and
+    limit, the number of venues, artists and cities listed (default 10).
+
+    Returns: The analytics view with the busiest venues, the most booked
+        artists and the top genres of the busiest cities.
+    """
+
+    error = False
+    report = None
+    args = _report_args() or (12, 10)
+
+    try:
+        report = booking_report(*args)
+    except:
+        error = True
+        current_app.logger.error(sys.exc_info())
+    finally:
+        db.session.close()
+
+    if error:
+        flash('Something went wrong!')
+
+    return render_template('pages/analytics.html', report=report,
+                           months=args[0])
+
+
+@bp.route('/data')
+def analytics_data():
+    """ Returns the booking activity of the last months.
+
+    Query args: months and limit, as for the analytics view.
+
+    Returns: The busiest venues with their shows per month, the most booked
+        artists and the top genres of the busiest cities, as JSON.
+    """
+
+    args = _report_args()
+    if args is None:
+        return jsonify({'success': False,
+                        'error': 'Invalid months or limit.'}), 400
+
+    try:
+        report = booking_report(*args)
+    except:
+        current_app.logger.error(sys.exc_info())
+        return jsonify({'success': False}), 500
+    finally:
+        db.session.close()
+
+    return jsonify(dict(report, success=True))
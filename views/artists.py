@@ -0,0 +1,401 @@
+import sys
+
+from flask import Blueprint, render_template, request, flash, redirect, \
+    url_for, jsonify, current_app, abort
+from werkzeug.datastructures import CombinedMultiDict
+
+from analytics import recounted_shows, uncount_shows
+from calendars import EVENT_COLUMNS, scopes_of
+from duplicates import find_duplicates
+from extensions import image_store, task_queue, recent_feed, \
+    changelog, matchmaker, load_shedder, calendar_feeds, entity_cache
+from feed import feed_entry
+from matchmaking import MAX_MATCHES
+from read_models import artist_list, artist_detail, \
+    search_artists as search_artists_by_name
+from forms import ArtistForm, EditArtistForm
+from models import db, Artist
+from updates import ConcurrentUpdateError, form_values, update_changed, \
+    delete_by_ids
+
+bp = Blueprint('artists', __name__, url_prefix='/artists')
+
+
+@bp.route('')
+@load_shedder.route_class('listing')
+def artists():
+    """ Shows the list of artists.
+
+    Returns: The artists view with a list of all artists.
+    """
+
+    artist_data = artist_list()
+    return render_template('pages/artists.html', artists=artist_data)
+
+
+@bp.route('/search', methods=['POST'])
+@load_shedder.route_class('search')
+def search_artists():
+    """ Searches artists in the database for the user's query.
+
+    Returns: Returns the artists that match the user's search query.
+    """
+
+    error = False
+    response_data = {}
+
+    try:
+        search_term = request.form.get('search_term', '')
+
+        # ilike makes the search case-insensitive
+        data = search_artists_by_name(search_term)
+
+        response_data = {
+            "count": len(data),
+            "data": data
+        }
+    except:
+        error = True
+        current_app.logger.error(sys.exc_info())
+
+    if error:
+        flash('Something went wrong!')
+
+    return render_template('pages/search_artists.html', results=response_data,
+                           search_term=request.form.get('search_term', ''))
+
+
+@bp.route('/<int:artist_id>')
+def show_artist(artist_id):
+    """ Shows the artist details for a specific artist.
+
+    Args:
+        artist_id: The id of the artist that the user has clicked on.
+
+    Returns: Returns the show artist view with the artist data.
+    """
+
+    error = False
+    data = {}
+
+    try:
+        # The artist and its live and archived shows, as read models.
+        data = artist_detail(artist_id)
+    except:
+        error = True
+        current_app.logger.error(sys.exc_info())
+
+    if data is None:
+        abort(404)
+    if error:
+        flash('Something went wrong!')
+
+    return render_template('pages/show_artist.html', artist=data)
+
+
+@bp.route('/<int:artist_id>/matches')
+@load_shedder.route_class('listing')
+def artist_matches(artist_id):
+    """ Recommends venues for an artist.
+
+    Candidates are scored on shared genres, being in the same city or
+    state, and whether they are looking for talent.
+
+    Args:
+        artist_id: The id of the artist to find venues for.
+
+    Returns: The best matches, with their score, as JSON. The number of
+        matches is set by the limit query arg (default 10, at most 100).
+    """
+
+    limit = request.args.get('limit', 10, type=int)
+    if not 1 <= limit <= MAX_MATCHES:
+        return jsonify({'success': False, 'error': 'Invalid limit.'}), 400
+
+    try:
+        matches = matchmaker.recommend('artists', artist_id, limit)
+    except:
+        current_app.logger.error(sys.exc_info())
+        return jsonify({'success': False}), 500
+    finally:
+        db.session.close()
+
+    if matches is None:
+        return jsonify({'success': False, 'error': 'Artist not found.'}), 404
+
+    return jsonify({'success': True, 'matches': matches})
+
+
+@bp.route('/create', methods=['GET'])
+def create_artist_form():
+    """ Shows the create artist form.
+
+    Returns: Returns the create artist view.
+    """
+
+    form = ArtistForm()
+    return render_template('forms/new_artist.html', form=form)
+
+
+@bp.route('/create', methods=['POST'])
+def create_artist_submission():
+    """ Creates an artist within the database if the form submission is valid.
+
+    Returns: Returns the homepage view with a flash indicating whether the
+        creation was a success or failure.
+    """
+
+    error = False
+    form = ArtistForm(CombinedMultiDict((request.files, request.form)))
+
+    if form.validate():
+        duplicates = []
+        if not form.not_duplicate.data:
+            try:
+                duplicates = find_duplicates(Artist, form.name.data,
+                                             form.city.data, form.state.data,
+                                             form.phone.data)
+            except:
+                # The check is advisory, it must not stop a listing.
+                db.session.rollback()
+                current_app.logger.error(sys.exc_info())
+        if duplicates:
+            flash('Artist ' + form.name.data + ' may already be listed. '
+                  'Check the artists below, or confirm it is a new one.')
+            return render_template('forms/new_artist.html', form=form,
+                                   duplicates=duplicates)
+
+        try:
+            artist = Artist()
+
+            form.populate_obj(artist)
+
+            if form.image_upload.data:
+                artist.image_file = image_store.save(form.image_upload.data)
+                task_queue.enqueue('image_variants',
+                                   filename=artist.image_file)
+
+            db.session.add(artist)
+            db.session.flush()
+            entry = feed_entry(artist)
+
+            db.session.commit()
+            recent_feed.push('artists', entry)
+            changelog.record('artists', [entry['id']])
+        except:
+            error = True
+            db.session.rollback()
+            current_app.logger.error(sys.exc_info())
+        finally:
+            db.session.close()
+
+        if error:
+            flash('An error occurred. Artist ' + form.name.data +
+                  ' could not be created.')
+        if not error:
+            flash('Artist ' + form.name.data + ' was successfully created!')
+
+    else:
+        message = []
+        for field, err in form.errors.items():
+            message.append(field + ' ' + '|'.join(err))
+        flash('Errors ' + str(message))
+
+    return render_template('pages/home.html')
+
+
+@bp.route('/<int:artist_id>/edit', methods=['GET'])
+def edit_artist(artist_id):
+    """ Shows the edit artist form.
+
+    Args:
+        artist_id: The id of the artist that the user wants to update.
+
+    Returns: Returns the edit artist view with the
+        artist details to populate the form.
+    """
+
+    # Only the artist's own columns are needed, not its shows. Outside of
+    # the try, so a missing artist is a 404 rather than an error page.
+    artist = entity_cache.get(Artist, artist_id)
+    if artist is None:
+        abort(404)
+
+    try:
+        form = EditArtistForm(obj=artist)
+        form.version.data = artist.version_id
+
+        return render_template('forms/edit_artist.html',
+                               form=form, artist=artist)
+    except:
+        current_app.logger.error(sys.exc_info())
+        return render_template('errors/500.html')
+
+
+@bp.route('/<int:artist_id>/edit', methods=['POST'])
+def edit_artist_submission(artist_id):
+    """ Updates an artist within the database if the form submission is valid.
+
+    Args:
+        artist_id: The id of the artist that the user wants to update.
+
+    Returns: Returns the show artist view with a flash indicating whether the
+        update was a success or failure.
+    """
+
+    error = False
+    conflict = False
+    missing = False
+    form = EditArtistForm(CombinedMultiDict((request.files, request.form)))
+
+    if form.validate():
+        try:
+            values = form_values(form, Artist)
+
+            if form.image_upload.data:
+                values['image_file'] = image_store.save(form.image_upload.data)
+                task_queue.enqueue('image_variants',
+                                   filename=values['image_file'])
+
+            # The feeds listing its upcoming shows.
+            calendars = scopes_of(Artist, [artist_id])
+
+            # Only the changed columns are written, and only if nobody else
+            # updated the artist since the form was loaded. Its shows are
+            # counted again if its genres change.
+            with recounted_shows(Artist, artist_id, values):
+                changes = update_changed(Artist, artist_id, form.version.data,
+                                         values)
+
+            db.session.commit()
+            if changes:
+                recent_feed.update('artists', artist_id, changes)
+                changelog.record('artists', [artist_id])
+            if changes and EVENT_COLUMNS & changes.keys():
+                calendar_feeds.touch(calendars)
+        except ConcurrentUpdateError:
+            conflict = True
+            db.session.rollback()
+        except LookupError:
+            missing = True
+            db.session.rollback()
+        except:
+            error = True
+            db.session.rollback()
+            current_app.logger.error(sys.exc_info())
+        finally:
+            db.session.close()
+
+        if missing:
+            abort(404)
+        if conflict:
+            flash('Artist ' + form.name.data + ' was changed by someone else '
+                  'while you were editing it. Please review and try again.')
+        elif error:
+            flash('An error occurred. Artist ' + form.name.data +
+                  ' could not be updated.')
+        if not error and not conflict:
+            flash('Artist ' + form.name.data + ' was successfully updated!')
+
+    else:
+        message = []
+        for field, err in form.errors.items():
+            message.append(field + ' ' + '|'.join(err))
+        flash('Errors ' + str(message))
+
+    return redirect(url_for('.show_artist', artist_id=artist_id))
+
+
+@bp.route('/<artist_id>', methods=['DELETE'])
+def delete_artist(artist_id):
+    """ Deletes an artist within the database.
+
+    Args:
+        artist_id: The id of the artist that the user wants to delete.
+
+    Returns: Returns the homepage view with a flash indicating whether the
+        delete was a success or failure.
+    """
+
+    error = False
+    artist_name = ""
+
+    try:
+        # One DELETE, the shows go with it through ON DELETE CASCADE, so
+        # they are taken out of the rollups first. The name is returned so
+        # it can be used in the flash message.
+        uncount_shows(Artist, [int(artist_id)])
+        calendars = scopes_of(Artist, [int(artist_id)])
+        deleted = delete_by_ids(Artist, [int(artist_id)])
+        if not deleted:
+            raise LookupError('Artist ' + artist_id + ' does not exist.')
+        artist_name = deleted[0].name
+
+        db.session.commit()
+        recent_feed.discard('artists', [int(artist_id)], Artist)
+        changelog.record('artists', [int(artist_id)])
+        calendar_feeds.touch(calendars)
+    except:
+        db.session.rollback()
+        error = True
+        current_app.logger.error(sys.exc_info())
+    finally:
+        db.session.close()
+
+    if error:
+        flash('An error occurred. Artist ' + artist_name +
+              ' could not be deleted.')
+    if not error:
+        flash('Artist ' + artist_name + ' was successfully deleted!')
+
+    return redirect(url_for('main.index'))
+
+
+@bp.route('/delete', methods=['POST'])
+def delete_artists():
+    """ Deletes many artists, and their shows, in one transaction.
+
+    The ids are taken from a JSON body ({"ids": [1, 2]}) or from repeated
+    `ids` form fields.
+
+    Returns: The ids and names of the deleted artists as JSON.
+    """
+
+    payload = request.get_json(silent=True) or {}
+    # A JSON body that isn't an object, or ids that aren't a list.
+    if not isinstance(payload, dict) or \
+            not isinstance(payload.get('ids') or [], list):
+        return jsonify({'success': False, 'error': 'Invalid ids.'}), 400
+    try:
+        ids = [int(i) for i in
+               payload.get('ids') or request.form.getlist('ids')]
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'Invalid ids.'}), 400
+
+    error = False
+    deleted = []
+    calendars = set()
+
+    try:
+        if ids:
+            uncount_shows(Artist, ids)
+            calendars = scopes_of(Artist, ids)
+            deleted = delete_by_ids(Artist, ids)
+        db.session.commit()
+        recent_feed.discard('artists', [row.id for row in deleted], Artist)
+        changelog.record('artists', [row.id for row in deleted])
+        calendar_feeds.touch(calendars)
+    except:
+        db.session.rollback()
+        error = True
+        current_app.logger.error(sys.exc_info())
+    finally:
+        db.session.close()
+
+    if error:
+        return jsonify({'success': False}), 500
+
+    return jsonify({
+        'success': True,
+        'deleted': [{'id': row.id, 'name': row.name} for row in deleted]
+    })
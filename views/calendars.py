@@ -0,0 +1,84 @@
+from flask import Blueprint, abort
+from sqlalchemy import select
+
+from areas import area_condition
+from calendars import venue_scope, artist_scope, city_scope, city_condition
+from extensions import calendar_feeds
+from models import db, Venue, Artist, Show, Area
+
+bp = Blueprint('calendars', __name__, url_prefix='/calendars')
+
+
+def _name(model, obj_id):
+    return db.session.execute(
+        select(model.name).where(model.id == obj_id)).scalar()
+
+
+@bp.route('/venues/<int:venue_id>.ics')
+def venue_calendar(venue_id):
+    """ Shows the upcoming shows of a venue as an iCalendar feed.
+
+    Args:
+        venue_id: The id of the venue.
+
+    Returns: The feed, or 304 if the client's copy is current.
+    """
+
+    def title():
+        name = _name(Venue, venue_id)
+        return None if name is None else 'Shows at ' + name
+
+    response = calendar_feeds.response(venue_scope(venue_id), title,
+                                       Show.venue_id == venue_id)
+    if response is None:
+        abort(404)
+    return response
+
+
+@bp.route('/artists/<int:artist_id>.ics')
+def artist_calendar(artist_id):
+    """ Shows the upcoming shows of an artist as an iCalendar feed.
+
+    Args:
+        artist_id: The id of the artist.
+
+    Returns: The feed, or 304 if the client's copy is current.
+    """
+
+    def title():
+        name = _name(Artist, artist_id)
+        return None if name is None else 'Shows by ' + name
+
+    response = calendar_feeds.response(artist_scope(artist_id), title,
+                                       Show.artist_id == artist_id)
+    if response is None:
+        abort(404)
+    return response
+
+
+@bp.route('/cities/<state>/<city>.ics')
+def city_calendar(state, city):
+    """ Shows the upcoming shows at every venue of a city as an iCalendar
+    feed.
+
+    Args:
+        state: The state code, e.g. CA.
+        city: The city name, in any case.
+
+    Returns: The feed, or 304 if the client's copy is current.
+    """
+
+    def title():
+        # Spelled as the city's area, if it has any venue.
+        area = db.session.execute(
+            select(Area.city, Area.state)
+            .join(Venue, Venue.area_id == Area.id)
+            .where(area_condition(city, state)).limit(1)).first()
+        return None if area is None else \
+            'Shows in {}, {}'.format(area.city, area.state)
+
+    response = calendar_feeds.response(city_scope(city, state), title,
+                                       city_condition(city, state))
+    if response is None:
+        abort(404)
+    return response
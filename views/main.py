@@ -0,0 +1,142 @@
+import hmac
+import sys
+from functools import wraps
+
+from flask import Blueprint, render_template, request, flash, jsonify, \
+    current_app, abort
+
+from autocomplete import MAX_SUGGESTIONS
+from extensions import task_queue, recent_feed, autocomplete, load_shedder, \
+    entity_cache
+from models import db, Venue, Artist
+
+bp = Blueprint('main', __name__)
+
+
+@bp.route('/')
+def index():
+    """ Shows the home page.
+
+    Returns: The home view with the 10 most recently listed venues and artists.
+    """
+
+    error = False
+    recent_venues = []
+    recent_artists = []
+
+    try:
+        # The feeds are kept up to date by the write handlers, the database
+        # is only queried if they haven't been built yet.
+        recent_venues = recent_feed.get('venues')
+        if recent_venues is None:
+            recent_venues = recent_feed.rebuild('venues', Venue)
+
+        recent_artists = recent_feed.get('artists')
+        if recent_artists is None:
+            recent_artists = recent_feed.rebuild('artists', Artist)
+    except:
+        error = True
+        current_app.logger.error(sys.exc_info())
+
+    if error:
+        flash('Something went wrong!')
+
+    return render_template('pages/home.html',
+                           recent_venues=recent_venues,
+                           recent_artists=recent_artists)
+
+
+@bp.route('/autocomplete')
+def autocomplete_names():
+    """ Suggests venues, artists and cities for the search boxes.
+
+    Query args: q, the text typed so far, and limit, the number of
+    suggestions of each kind (default 5, at most 10).
+
+    Returns: The matching venues, artists and cities as JSON.
+    """
+
+    limit = request.args.get('limit', 5, type=int)
+    if not 1 <= limit <= MAX_SUGGESTIONS:
+        return jsonify({'success': False, 'error': 'Invalid limit.'}), 400
+
+    try:
+        suggestions = autocomplete.suggest(request.args.get('q', ''), limit)
+    except:
+        current_app.logger.error(sys.exc_info())
+        return jsonify({'success': False}), 500
+    finally:
+        db.session.remove()
+
+    return jsonify(dict(suggestions, success=True))
+
+
+#  Metrics
+#  ----------------------------------------------------------------
+
+def metrics_access(view):
+    """ Limits a metrics view to requests carrying METRICS_TOKEN in the
+    X-Metrics-Token header or the `token` query arg. Other requests, and
+    all of them while no token is configured, get a 404.
+    """
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        token = current_app.config.get('METRICS_TOKEN')
+        given = request.headers.get('X-Metrics-Token') or \
+            request.args.get('token')
+        # As bytes, compare_digest refuses non-ASCII strings.
+        if not token or given is None or \
+                not hmac.compare_digest(given.encode(), token.encode()):
+            abort(404)
+        return view(*args, **kwargs)
+
+    return wrapper
+
+
+@bp.route('/metrics/tasks')
+@load_shedder.route_class(None)
+@metrics_access
+def task_metrics():
+    """ Shows the background task queue metrics of this worker.
+
+    Returns: The queue depth and task counters as JSON.
+    """
+
+    return jsonify(task_queue.metrics())
+
+
+@bp.route('/metrics/load')
+@load_shedder.route_class(None)
+@metrics_access
+def load_metrics():
+    """ Shows the load shedding metrics of this worker.
+
+    Returns: The running and waiting requests and the admitted, queued,
+        shed and timed out counters of each route class as JSON.
+    """
+
+    return jsonify(load_shedder.metrics())
+
+
+@bp.route('/metrics/cache')
+@load_shedder.route_class(None)
+@metrics_access
+def cache_metrics():
+    """ Shows the entity cache metrics of this worker.
+
+    Returns: The hits, misses, evictions and hit rate of the venue and
+        artist caches as JSON.
+    """
+
+    return jsonify(entity_cache.metrics())
+
+
+@bp.app_errorhandler(404)
+def not_found_error(error):
+    return render_template('errors/404.html'), 404
+
+
+@bp.app_errorhandler(500)
+def server_error(error):
+    return render_template('errors/500.html'), 500
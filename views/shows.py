@@ -0,0 +1,183 @@
+import sys
+
+from flask import Blueprint, render_template, request, flash, current_app
+from sqlalchemy.exc import IntegrityError
+
+from analytics import count_shows
+from calendars import scopes_of_shows
+from extensions import load_shedder, calendar_feeds
+from forms import ShowForm, TourForm
+from models import db, Show
+from partitions import booking_conflict
+from read_models import show_listing
+from tours import missing_references, schedule_tour
+
+bp = Blueprint('shows', __name__, url_prefix='/shows')
+
+
+@bp.route('')
+@load_shedder.route_class('listing')
+def shows():
+    """ Shows the list of shows.
+
+    Returns: The shows view with a list of all shows.
+    """
+
+    error = False
+    data = []
+
+    try:
+        # Columns of the show, venue and artist in one join, no instances.
+        data = show_listing()
+    except:
+        error = True
+        current_app.logger.error(sys.exc_info())
+
+    if error:
+        flash('Something went wrong!')
+
+    return render_template('pages/shows.html', shows=data)
+
+
+@bp.route('/create')
+def create_shows():
+    """ Shows the create show form.
+
+    Returns: Returns the create show view.
+    """
+
+    form = ShowForm()
+    return render_template('forms/new_show.html', form=form)
+
+
+@bp.route('/create', methods=['POST'])
+def create_show_submission():
+    """ Creates a show within the database if the form submission is valid.
+
+    Returns: Returns the homepage view with a flash indicating whether the
+        creation was a success or failure.
+    """
+
+    error = False
+    conflict = None
+    form = ShowForm(request.form)
+
+    if form.validate():
+        try:
+            show = Show()
+            form.populate_obj(show)
+
+            db.session.add(show)
+            db.session.flush()
+            count_shows([show.id])
+            calendars = scopes_of_shows([show.id])
+            db.session.commit()
+            calendar_feeds.touch(calendars)
+        except IntegrityError as e:
+            error = True
+            db.session.rollback()
+            # Double bookings are rejected by the exclusion constraints on
+            # the show partitions rather than by querying for overlaps first.
+            conflict = booking_conflict(e)
+            if conflict is None:
+                current_app.logger.error(sys.exc_info())
+        except:
+            error = True
+            db.session.rollback()
+            current_app.logger.error(sys.exc_info())
+        finally:
+            db.session.close()
+
+        if conflict:
+            flash('Show could not be created. The ' + conflict +
+                  ' is already booked at that time.')
+        elif error:
+            flash('An error occurred. Show could not be created.')
+        if not error:
+            flash('Show was successfully created!')
+
+    else:
+        message = []
+        for field, err in form.errors.items():
+            message.append(field + ' ' + '|'.join(err))
+        flash('Errors ' + str(message))
+
+    return render_template('pages/home.html')
+
+
+@bp.route('/tour', methods=['GET'])
+def create_tour_form():
+    """ Shows the book a tour form.
+
+    Returns: Returns the create tour view.
+    """
+
+    form = TourForm()
+    return render_template('forms/new_tour.html', form=form)
+
+
+@bp.route('/tour', methods=['POST'])
+def create_tour_submission():
+    """ Books every date of a tour in a single transaction.
+
+    The artist and venues are checked with one query and the shows are
+    inserted with one multi-row INSERT. Dates that clash with an existing
+    booking are skipped and reported back per line.
+
+    Returns: Returns the tour view with a flash per skipped date.
+    """
+
+    error = False
+    conflicts = []
+    form = TourForm(request.form)
+
+    if form.validate():
+        try:
+            artist_exists, unknown_venues = missing_references(
+                form.artist_id.data,
+                [venue_id for _, venue_id, _ in form.entries])
+
+            if not artist_exists or unknown_venues:
+                if not artist_exists:
+                    flash('Artist ' + str(form.artist_id.data) +
+                          ' does not exist.')
+                for number, venue_id, _ in form.entries:
+                    if venue_id in unknown_venues:
+                        flash('Line {}: venue {} does not exist.'
+                              .format(number, venue_id))
+                return render_template('forms/new_tour.html', form=form)
+
+            created, conflicts = schedule_tour(form.artist_id.data,
+                                               form.entries,
+                                               form.duration_minutes.data)
+            count_shows(created)
+            calendars = scopes_of_shows(created)
+            db.session.commit()
+            calendar_feeds.touch(calendars)
+        except:
+            error = True
+            db.session.rollback()
+            current_app.logger.error(sys.exc_info())
+        finally:
+            db.session.close()
+
+        if error:
+            flash('An error occurred. The tour could not be booked.')
+        if not error:
+            flash('{} shows were successfully booked!'.format(len(created)))
+            for number, venue_id, start_time, side in conflicts:
+                if side == 'venue':
+                    flash('Line {}: venue {} at {} is already booked.'
+                          .format(number, venue_id,
+                                  start_time.strftime('%Y-%m-%d %H:%M')))
+                else:
+                    flash('Line {}: the artist is already booked at {}.'
+                          .format(number,
+                                  start_time.strftime('%Y-%m-%d %H:%M')))
+    else:
+        message = []
+        for field, err in form.errors.items():
+            message.append(field + ' ' + '|'.join(err))
+        flash('Errors ' + str(message))
+
+    return render_template('forms/new_tour.html', form=form)
@@ -0,0 +1,450 @@
+import sys
+
+from flask import Blueprint, render_template, request, flash, redirect, \
+    url_for, jsonify, current_app, abort
+from werkzeug.datastructures import CombinedMultiDict
+
+from analytics import recounted_shows, uncount_shows
+from calendars import EVENT_COLUMNS, scopes_of, city_scope
+from duplicates import find_duplicates
+from extensions import image_store, task_queue, recent_feed, \
+    changelog, matchmaker, load_shedder, calendar_feeds, entity_cache
+from feed import feed_entry
+from matchmaking import MAX_MATCHES
+from read_models import venue_areas, venue_detail, \
+    search_venues as search_venues_by_name
+from forms import VenueForm, EditVenueForm
+from geo import venues_near
+from models import db, Venue
+from updates import ConcurrentUpdateError, form_values, update_changed, \
+    delete_by_ids
+
+bp = Blueprint('venues', __name__, url_prefix='/venues')
+
+
+@bp.route('')
+@load_shedder.route_class('listing')
+def venues():
+    """ Shows the list of venues grouped by city and state.
+
+    Returns: The venues view with the distinct areas. For each area, there will
+        be a list of venues.
+    """
+
+    error = False
+    response = []
+
+    try:
+        # One query, the upcoming shows are counted by the database.
+        response = venue_areas()
+    except:
+        error = True
+        current_app.logger.error(sys.exc_info())
+
+    if error:
+        flash('Something went wrong!')
+
+    return render_template('pages/venues.html', areas=response)
+
+
+@bp.route('/near')
+@load_shedder.route_class('search')
+def venues_near_point():
+    """ Finds the venues nearest to a point.
+
+    Query args: lat and lng in degrees, and optionally radius (km) and
+    limit (at most 100, default 20).
+
+    Returns: The venues sorted by distance, with their distance in km and
+        their number of upcoming shows, as JSON.
+    """
+
+    latitude = request.args.get('lat', type=float)
+    longitude = request.args.get('lng', type=float)
+    radius_km = request.args.get('radius', type=float)
+    limit = request.args.get('limit', 20, type=int)
+
+    if latitude is None or not -90 <= latitude <= 90 or \
+            longitude is None or not -180 <= longitude <= 180:
+        return jsonify({'success': False,
+                        'error': 'Invalid lat or lng.'}), 400
+    if (radius_km is not None and radius_km <= 0) or limit < 1:
+        return jsonify({'success': False,
+                        'error': 'Invalid radius or limit.'}), 400
+
+    try:
+        data = venues_near(latitude, longitude, radius_km, limit)
+    except:
+        current_app.logger.error(sys.exc_info())
+        return jsonify({'success': False}), 500
+    finally:
+        db.session.close()
+
+    return jsonify({'success': True, 'venues': data})
+
+
+@bp.route('/search', methods=['POST'])
+@load_shedder.route_class('search')
+def search_venues():
+    """ Searches venues in the database for the user's query.
+
+    Returns: Returns the venues that match the user's search query.
+    """
+
+    error = False
+    response_data = {}
+
+    try:
+        search_term = request.form.get('search_term', '')
+
+        # ilike makes the search case-insensitive
+        data = search_venues_by_name(search_term)
+
+        response_data = {
+            "count": len(data),
+            "data": data
+        }
+    except:
+        error = True
+        current_app.logger.error(sys.exc_info())
+
+    if error:
+        flash('Something went wrong!')
+
+    return render_template('pages/search_venues.html', results=response_data,
+                           search_term=request.form.get('search_term', ''))
+
+
+@bp.route('/<int:venue_id>')
+def show_venue(venue_id):
+    """ Shows the venue details for a specific venue.
+
+    Args:
+        venue_id: The id of the venue that the user has clicked on.
+
+    Returns: Returns the show venue view with the venue data.
+    """
+
+    error = False
+    data = {}
+
+    try:
+        # The venue and its live and archived shows, as read models.
+        data = venue_detail(venue_id)
+    except:
+        error = True
+        current_app.logger.error(sys.exc_info())
+
+    if data is None:
+        abort(404)
+    if error:
+        flash('Something went wrong!')
+
+    return render_template('pages/show_venue.html', venue=data)
+
+
+@bp.route('/<int:venue_id>/matches')
+@load_shedder.route_class('listing')
+def venue_matches(venue_id):
+    """ Recommends artists for a venue.
+
+    Candidates are scored on shared genres, being in the same city or
+    state, and whether they are looking for a venue.
+
+    Args:
+        venue_id: The id of the venue to find artists for.
+
+    Returns: The best matches, with their score, as JSON. The number of
+        matches is set by the limit query arg (default 10, at most 100).
+    """
+
+    limit = request.args.get('limit', 10, type=int)
+    if not 1 <= limit <= MAX_MATCHES:
+        return jsonify({'success': False, 'error': 'Invalid limit.'}), 400
+
+    try:
+        matches = matchmaker.recommend('venues', venue_id, limit)
+    except:
+        current_app.logger.error(sys.exc_info())
+        return jsonify({'success': False}), 500
+    finally:
+        db.session.close()
+
+    if matches is None:
+        return jsonify({'success': False, 'error': 'Venue not found.'}), 404
+
+    return jsonify({'success': True, 'matches': matches})
+
+
+@bp.route('/create', methods=['GET'])
+def create_venue_form():
+    """ Shows the create venue form.
+
+    Returns: Returns the create venue view.
+    """
+
+    form = VenueForm()
+    return render_template('forms/new_venue.html', form=form)
+
+
+@bp.route('/create', methods=['POST'])
+def create_venue_submission():
+    """ Creates a venue within the database if the form submission is valid.
+
+    Returns: Returns the homepage view with a flash indicating whether the
+        creation was a success or failure.
+    """
+
+    error = False
+
+    form = VenueForm(CombinedMultiDict((request.files, request.form)),
+                     meta={'csrf': False})
+    if form.validate():
+        duplicates = []
+        if not form.not_duplicate.data:
+            try:
+                duplicates = find_duplicates(Venue, form.name.data,
+                                             form.city.data, form.state.data,
+                                             form.phone.data)
+            except:
+                # The check is advisory, it must not stop a listing.
+                db.session.rollback()
+                current_app.logger.error(sys.exc_info())
+        if duplicates:
+            flash('Venue ' + form.name.data + ' may already be listed. '
+                  'Check the venues below, or confirm it is a new one.')
+            return render_template('forms/new_venue.html', form=form,
+                                   duplicates=duplicates)
+
+        try:
+            venue = Venue()
+            form.populate_obj(venue)
+
+            if form.image_upload.data:
+                venue.image_file = image_store.save(form.image_upload.data)
+                task_queue.enqueue('image_variants',
+                                   filename=venue.image_file)
+
+            db.session.add(venue)
+            db.session.flush()
+            entry = feed_entry(venue)
+
+            db.session.commit()
+            recent_feed.push('venues', entry)
+            changelog.record('venues', [entry['id']])
+        except:
+            error = True
+            db.session.rollback()
+            current_app.logger.error(sys.exc_info())
+        finally:
+            db.session.close()
+
+        if error:
+            flash('An error occurred. Venue ' + form.name.data +
+                  ' could not be created.')
+        if not error:
+            flash('Venue ' + form.name.data + ' was successfully created!')
+    else:
+        message = []
+        for field, err in form.errors.items():
+            message.append(field + ' ' + '|'.join(err))
+        flash('Errors ' + str(message))
+
+    return render_template('pages/home.html')
+
+
+@bp.route('/<int:venue_id>/edit', methods=['GET'])
+def edit_venue(venue_id):
+    """ Shows the edit venue form.
+
+    Args:
+        venue_id: The id of the venue that the user wants to update.
+
+    Returns: Returns the edit venue view with the
+        venue details to populate the form.
+    """
+
+    # Only the venue's own columns are needed, not its shows. Outside of
+    # the try, so a missing venue is a 404 rather than an error page.
+    venue = entity_cache.get(Venue, venue_id)
+    if venue is None:
+        abort(404)
+
+    try:
+        form = EditVenueForm(obj=venue)
+        form.version.data = venue.version_id
+
+        return render_template('forms/edit_venue.html', form=form, venue=venue)
+    except:
+        current_app.logger.error(sys.exc_info())
+        return render_template('errors/500.html')
+
+
+@bp.route('/<int:venue_id>/edit', methods=['POST'])
+def edit_venue_submission(venue_id):
+    """ Updates a venue within the database if the form submission is valid.
+
+    Args:
+        venue_id: The id of the venue that the user wants to update.
+
+    Returns: Returns the show venue view with a flash indicating whether the
+        update was a success or failure.
+    """
+
+    error = False
+    conflict = False
+    missing = False
+    form = EditVenueForm(CombinedMultiDict((request.files, request.form)))
+
+    if form.validate():
+        try:
+            values = form_values(form, Venue)
+
+            if form.image_upload.data:
+                values['image_file'] = image_store.save(form.image_upload.data)
+                task_queue.enqueue('image_variants',
+                                   filename=values['image_file'])
+
+            # The feeds listing its upcoming shows, before any change, and
+            # the feed of the city it may move to.
+            calendars = scopes_of(Venue, [venue_id])
+            calendars.add(city_scope(values.get('city'), values.get('state')))
+
+            # Only the changed columns are written, and only if nobody else
+            # updated the venue since the form was loaded. Its shows are
+            # counted again if its city or state changes.
+            with recounted_shows(Venue, venue_id, values):
+                changes = update_changed(Venue, venue_id, form.version.data,
+                                         values)
+
+            db.session.commit()
+            if changes:
+                recent_feed.update('venues', venue_id, changes)
+                changelog.record('venues', [venue_id])
+            if changes and EVENT_COLUMNS & changes.keys():
+                calendar_feeds.touch(calendars)
+        except ConcurrentUpdateError:
+            conflict = True
+            db.session.rollback()
+        except LookupError:
+            missing = True
+            db.session.rollback()
+        except:
+            error = True
+            db.session.rollback()
+            current_app.logger.error(sys.exc_info())
+        finally:
+            db.session.close()
+
+        if missing:
+            abort(404)
+        if conflict:
+            flash('Venue ' + form.name.data + ' was changed by someone else '
+                  'while you were editing it. Please review and try again.')
+        elif error:
+            flash('An error occurred. Venue ' + form.name.data +
+                  ' could not be updated.')
+        if not error and not conflict:
+            flash('Venue ' + form.name.data + ' was successfully updated!')
+    else:
+        message = []
+        for field, err in form.errors.items():
+            message.append(field + ' ' + '|'.join(err))
+        flash('Errors ' + str(message))
+
+    return redirect(url_for('.show_venue', venue_id=venue_id))
+
+
+@bp.route('/<venue_id>', methods=['DELETE'])
+def delete_venue(venue_id):
+    """ Deletes a venue within the database.
+
+    Args:
+        venue_id: The id of the venue that the user wants to delete.
+
+    Returns: Returns the homepage view with a flash indicating whether the
+        delete was a success or failure.
+    """
+
+    error = False
+    venue_name = ""
+
+    try:
+        # One DELETE, the shows go with it through ON DELETE CASCADE, so
+        # they are taken out of the rollups first. The name is returned so
+        # it can be used in the flash message.
+        uncount_shows(Venue, [int(venue_id)])
+        calendars = scopes_of(Venue, [int(venue_id)])
+        deleted = delete_by_ids(Venue, [int(venue_id)])
+        if not deleted:
+            raise LookupError('Venue ' + venue_id + ' does not exist.')
+        venue_name = deleted[0].name
+
+        db.session.commit()
+        recent_feed.discard('venues', [int(venue_id)], Venue)
+        changelog.record('venues', [int(venue_id)])
+        calendar_feeds.touch(calendars)
+    except:
+        db.session.rollback()
+        error = True
+        current_app.logger.error(sys.exc_info())
+    finally:
+        db.session.close()
+
+    if error:
+        flash('An error occurred. Venue ' + venue_name +
+              ' could not be deleted.')
+    if not error:
+        flash('Venue ' + venue_name + ' was successfully deleted!')
+
+    return redirect(url_for('main.index'))
+
+
+@bp.route('/delete', methods=['POST'])
+def delete_venues():
+    """ Deletes many venues, and their shows, in one transaction.
+
+    The ids are taken from a JSON body ({"ids": [1, 2]}) or from repeated
+    `ids` form fields.
+
+    Returns: The ids and names of the deleted venues as JSON.
+    """
+
+    payload = request.get_json(silent=True) or {}
+    # A JSON body that isn't an object, or ids that aren't a list.
+    if not isinstance(payload, dict) or \
+            not isinstance(payload.get('ids') or [], list):
+        return jsonify({'success': False, 'error': 'Invalid ids.'}), 400
+    try:
+        ids = [int(i) for i in
+               payload.get('ids') or request.form.getlist('ids')]
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'Invalid ids.'}), 400
+
+    error = False
+    deleted = []
+    calendars = set()
+
+    try:
+        if ids:
+            uncount_shows(Venue, ids)
+            calendars = scopes_of(Venue, ids)
+            deleted = delete_by_ids(Venue, ids)
+        db.session.commit()
+        recent_feed.discard('venues', [row.id for row in deleted], Venue)
+        changelog.record('venues', [row.id for row in deleted])
+        calendar_feeds.touch(calendars)
+    except:
+        db.session.rollback()
+        error = True
+        current_app.logger.error(sys.exc_info())
+    finally:
+        db.session.close()
+
+    if error:
+        return jsonify({'success': False}), 500
+
+    return jsonify({
+        'success': True,
+        'deleted': [{'id': row.id, 'name': row.name} for row in deleted]
+    })
@@ -0,0 +1,5 @@
+""" WSGI entry point, e.g. `gunicorn wsgi:app` (see gunicorn.conf.py). """
+
+from app import create_app
+
+app = create_app(migrations=False)